@@ -1,13 +1,48 @@
+import asyncio
+import json
+import os
+import numpy as np
 import pandas as pd
-from typing import Dict, Any, List
-from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, Any, List, Optional, Tuple
 import re
+from services.deadline import DeadlineExceeded, record_drop
 from services.gemini_service import GeminiService
-from logger import log_agent_start, log_agent_end
+from services.page_classifier import USEFUL_MIN_CHARS
+from logger import log_agent_start, log_agent_end, log_error
+
+SUMMARY_MODES = ("sequential", "concurrent", "batched")
+
+# Common English words left out of the keyword tables
+STOPWORDS = frozenset("""
+about above after again against all also and any are because been before being below between both but
+can could did does doing down during each few for from further had has have having her here hers herself
+him himself his how into its itself just more most not now off once only other our ours ourselves out over
+own same she should some such than that the their theirs them themselves then there these they this those
+through too under until very was were what when where which while who whom why will with would you your
+yours yourself yourselves
+""".split())
+
+# Every ASCII non-letter, plus common typographic punctuation, separates words
+TOKEN_SEPARATORS = str.maketrans({
+    char: " " for char in [chr(code) for code in range(128) if not chr(code).isalpha()] + list("\u2018\u2019\u201c\u201d\u2013\u2014\u2026\u00b7\u2022\u00ab\u00bb")
+})
 
 class AnalysisAgent:
-    def __init__(self):
-        self.gemini_service = GeminiService()
+    # Fetched text a source must exceed to count as meaningful (not a login wall or stub);
+    # shared with the fetcher's domain verdicts and the research agent's over-fetching
+    MIN_MEANINGFUL_LENGTH = USEFUL_MIN_CHARS
+    
+    def __init__(self, gemini_service: Optional[GeminiService] = None,
+                 summary_mode: Optional[str] = None, max_concurrency: Optional[int] = None):
+        self.gemini_service = gemini_service or GeminiService()
+        
+        # How per-source summaries are produced: one call at a time, a bounded
+        # concurrent fan-out, or a single multi-document prompt
+        self.summary_mode = (summary_mode or os.getenv("ANALYSIS_SUMMARY_MODE", "concurrent")).lower()
+        if self.summary_mode not in SUMMARY_MODES:
+            raise ValueError(f"Unsupported ANALYSIS_SUMMARY_MODE: {self.summary_mode}")
+        self.max_concurrency = max_concurrency or int(os.getenv("ANALYSIS_MAX_CONCURRENCY", "4"))
     
     def analyze(self, research_results: List[Dict[str, Any]]) -> Dict[str, Any]:
         """
@@ -23,40 +58,17 @@ class AnalysisAgent:
         
         try:
             # Check if we have meaningful content
-            meaningful_results = [r for r in research_results if r.get("fetched_text_length", 0) > 500]
+            meaningful_results = self._meaningful_results(research_results)
             
             if len(meaningful_results) == 0:
                 # All results are login walls or have minimal content
                 analysis_summary = self._create_limited_content_summary(research_results)
             else:
                 # Generate summaries for each meaningful result
-                summaries = []
-                for result in meaningful_results:
-                    prompt = f"""
-                    Summarize the following content in 2-3 sentences, focusing on key points related to the research topic:
-                    
-                    Title: {result["title"]}
-                    URL: {result["url"]}
-                    Content: {result["content_preview"]}
-                    """
-                    
-                    summary = self.gemini_service.generate_text(prompt)
-                    summaries.append({
-                        "url": result["url"],
-                        "title": result["title"],
-                        "summary": summary
-                    })
+                summaries = self._summarize_sources(meaningful_results)
                 
                 # Combine all summaries into an overall analysis summary
-                combined_summaries = "\n\n".join([f"{s['title']}: {s['summary']}" for s in summaries])
-                
-                analysis_prompt = f"""
-                Based on the following summarized research findings, provide a comprehensive analysis summary that identifies key trends, patterns, and insights:
-                
-                {combined_summaries}
-                """
-                
-                analysis_summary = self.gemini_service.generate_text(analysis_prompt)
+                analysis_summary = self.gemini_service.generate_text(self._analysis_prompt(summaries))
             
             # Generate data tables
             analysis_tables = self._generate_tables(research_results, meaningful_results)
@@ -73,10 +85,250 @@ class AnalysisAgent:
             log_agent_end("AnalysisAgent", start_time, None)
             raise Exception(f"Analysis failed: {str(e)}")
     
+    async def aanalyze(self, research_results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Async variant of `analyze` that awaits the Gemini calls instead of blocking."""
+        start_time = log_agent_start("AnalysisAgent", {"num_results": len(research_results)})
+        
+        try:
+            meaningful_results = self._meaningful_results(research_results)
+            
+            if len(meaningful_results) == 0:
+                analysis_summary = self._create_limited_content_summary(research_results)
+            else:
+                summaries = await self._asummarize_sources(meaningful_results)
+                
+                analysis_summary = await self.gemini_service.agenerate_text(self._analysis_prompt(summaries))
+            
+            analysis_tables = self._generate_tables(research_results, meaningful_results)
+            
+            result = {
+                "analysis_summary": analysis_summary,
+                "analysis_tables": analysis_tables
+            }
+            
+            log_agent_end("AnalysisAgent", start_time, result)
+            return result
+            
+        except Exception as e:
+            log_agent_end("AnalysisAgent", start_time, None)
+            raise Exception(f"Analysis failed: {str(e)}")
+    
+    async def asummarize_incrementally(self, sources: AsyncIterator[Tuple[int, Dict[str, Any]]]) -> List[Dict[str, str]]:
+        """
+        Summarize sources while research is still fetching the rest.
+        
+        Each meaningful source is summarized as soon as it arrives, within the
+        same concurrency limit as `aanalyze`. Batched mode needs every source
+        for its single prompt, so it waits for the stream to end.
+        
+        Args:
+            sources: (index, research result) pairs in completion order
+            
+        Returns:
+            Successful summaries in index order
+        """
+        if self.summary_mode == "batched":
+            arrived = sorted([item async for item in sources], key=lambda item: item[0])
+            meaningful_results = self._meaningful_results([result for _, result in arrived])
+            return await self._asummarize_sources(meaningful_results) if meaningful_results else []
+        
+        slots = asyncio.Semaphore(1 if self.summary_mode == "sequential" else self.max_concurrency)
+        
+        async def summarize(index: int, result: Dict[str, Any]):
+            async with slots:
+                return index, await self._asummarize_source(result)
+        
+        tasks = []
+        try:
+            async for index, result in sources:
+                if self._meaningful_results([result]):
+                    tasks.append(asyncio.create_task(summarize(index, result)))
+            summaries = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        
+        return self._successful_summaries([summary for _, summary in sorted(summaries, key=lambda item: item[0])])
+    
+    async def asynthesize(self, research_results: List[Dict[str, Any]], summaries: List[Dict[str, str]]) -> str:
+        """
+        Combine per-source summaries into the overall analysis summary.
+        
+        Args:
+            research_results: List of research results from ResearchAgent
+            summaries: Per-source summaries
+            
+        Returns:
+            Analysis summary text
+        """
+        if not self._meaningful_results(research_results):
+            # All results are login walls or have minimal content
+            return self._create_limited_content_summary(research_results)
+        try:
+            return await self.gemini_service.agenerate_text(self._analysis_prompt(summaries))
+        except DeadlineExceeded as e:
+            log_error("AnalysisAgent", e)
+            return self._create_deadline_summary(research_results, summaries)
+    
+    def generate_tables(self, research_results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Data tables for the research results; needs no model calls."""
+        return self._generate_tables(research_results, self._meaningful_results(research_results))
+    
+    def _summarize_sources(self, meaningful_results: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        """Summarize each source according to `summary_mode`, keeping result order."""
+        if self.summary_mode == "batched":
+            batched = self._parse_batched_summaries(
+                self._safe_generate(self._batched_summary_prompt(meaningful_results)),
+                meaningful_results
+            )
+            # Sources the batched response missed are summarized individually
+            missing = [result for result, summary in zip(meaningful_results, batched) if summary is None]
+            fallback = iter(self._summarize_each(missing))
+            return self._successful_summaries([
+                summary if summary is not None else next(fallback)
+                for summary in batched
+            ])
+        
+        return self._successful_summaries(self._summarize_each(meaningful_results))
+    
+    async def _asummarize_sources(self, meaningful_results: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        """Async counterpart of `_summarize_sources`."""
+        if self.summary_mode == "batched":
+            try:
+                response = await self.gemini_service.agenerate_text(self._batched_summary_prompt(meaningful_results))
+            except Exception as e:
+                log_error("AnalysisAgent", e)
+                response = ""
+            batched = self._parse_batched_summaries(response, meaningful_results)
+            missing = [result for result, summary in zip(meaningful_results, batched) if summary is None]
+            fallback = iter(await self._asummarize_each(missing))
+            return self._successful_summaries([
+                summary if summary is not None else next(fallback)
+                for summary in batched
+            ])
+        
+        return self._successful_summaries(await self._asummarize_each(meaningful_results))
+    
+    def _summarize_each(self, results: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        """One summary call per source, bounded by `max_concurrency` unless in sequential mode."""
+        if self.summary_mode == "sequential" or len(results) <= 1:
+            return [self._summarize_source(result) for result in results]
+        
+        workers = max(1, min(self.max_concurrency, len(results)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="summarize") as pool:
+            return list(pool.map(self._summarize_source, results))
+    
+    async def _asummarize_each(self, results: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        """Async counterpart of `_summarize_each`."""
+        limit = 1 if self.summary_mode == "sequential" else self.max_concurrency
+        slots = asyncio.Semaphore(limit)
+        
+        async def summarize(result: Dict[str, Any]) -> Dict[str, str]:
+            async with slots:
+                return await self._asummarize_source(result)
+        
+        return list(await asyncio.gather(*(summarize(result) for result in results)))
+    
+    def _summarize_source(self, result: Dict[str, Any]) -> Dict[str, str]:
+        """Summarize a single source; a failure is recorded on the entry instead of raised."""
+        try:
+            summary = self.gemini_service.generate_text(self._summary_prompt(result))
+            return {"url": result["url"], "title": result["title"], "summary": summary}
+        except Exception as e:
+            log_error("AnalysisAgent", e)
+            return {"url": result["url"], "title": result["title"], "summary": "", "error": str(e)}
+    
+    async def _asummarize_source(self, result: Dict[str, Any]) -> Dict[str, str]:
+        """Async counterpart of `_summarize_source`; a source out of time is recorded as dropped."""
+        try:
+            summary = await self.gemini_service.agenerate_text(self._summary_prompt(result))
+            return {"url": result["url"], "title": result["title"], "summary": summary}
+        except DeadlineExceeded as e:
+            record_drop(result["url"], result["title"], "summaries")
+            return {"url": result["url"], "title": result["title"], "summary": "", "error": str(e), "dropped": True}
+        except Exception as e:
+            log_error("AnalysisAgent", e)
+            return {"url": result["url"], "title": result["title"], "summary": "", "error": str(e)}
+    
+    def _safe_generate(self, prompt: str) -> str:
+        try:
+            return self.gemini_service.generate_text(prompt)
+        except Exception as e:
+            log_error("AnalysisAgent", e)
+            return ""
+    
+    def _successful_summaries(self, summaries: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Drop failed summaries; only fail the analysis if every source failed, none of them for the deadline."""
+        successful = [s for s in summaries if "error" not in s]
+        if summaries and not successful and not any(s.get("dropped") for s in summaries):
+            raise Exception(f"All source summaries failed: {summaries[0]['error']}")
+        return successful
+    
+    def _batched_summary_prompt(self, meaningful_results: List[Dict[str, Any]]) -> str:
+        documents = "\n\n".join(
+            f"[{i}] Title: {result['title']}\nURL: {result['url']}\nContent: {result['content_preview']}"
+            for i, result in enumerate(meaningful_results, start=1)
+        )
+        
+        return f"""
+                Summarize each of the following documents in 2-3 sentences, focusing on key points related to the research topic.
+                
+                IMPORTANT: Respond with ONLY a valid JSON array, one object per document, in this form:
+                [{{"url": "<document URL>", "summary": "<2-3 sentence summary>"}}]
+                
+                {documents}
+                """
+    
+    def _parse_batched_summaries(self, response: str, meaningful_results: List[Dict[str, Any]]) -> List[Optional[Dict[str, str]]]:
+        """
+        Map a batched JSON response back onto the sources by URL.
+        
+        Returns one entry per source, in order; None where the response had no
+        usable summary for that source.
+        """
+        by_url = {}
+        match = re.search(r"\[.*\]", response or "", re.DOTALL)
+        if match:
+            try:
+                for item in json.loads(match.group(0)):
+                    if isinstance(item, dict) and item.get("url") and item.get("summary"):
+                        by_url[item["url"]] = str(item["summary"])
+            except ValueError as e:
+                log_error("AnalysisAgent", e)
+        
+        return [
+            {"url": result["url"], "title": result["title"], "summary": by_url[result["url"]]}
+            if result["url"] in by_url else None
+            for result in meaningful_results
+        ]
+    
+    def _meaningful_results(self, research_results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Results with enough fetched text to be worth summarizing."""
+        return [r for r in research_results if r.get("fetched_text_length", 0) > self.MIN_MEANINGFUL_LENGTH]
+    
+    def _summary_prompt(self, result: Dict[str, Any]) -> str:
+        return f"""
+                    Summarize the following content in 2-3 sentences, focusing on key points related to the research topic:
+                    
+                    Title: {result["title"]}
+                    URL: {result["url"]}
+                    Content: {result["content_preview"]}
+                    """
+    
+    def _analysis_prompt(self, summaries: List[Dict[str, str]]) -> str:
+        combined_summaries = "\n\n".join([f"{s['title']}: {s['summary']}" for s in summaries])
+        
+        return f"""
+                Based on the following summarized research findings, provide a comprehensive analysis summary that identifies key trends, patterns, and insights:
+                
+                {combined_summaries}
+                """
+    
     def _create_limited_content_summary(self, research_results: List[Dict[str, Any]]) -> str:
         """Create a summary when content is limited due to login walls."""
         # Count how many results have meaningful content
-        meaningful_count = sum(1 for r in research_results if r.get("fetched_text_length", 0) > 500)
+        meaningful_count = len(self._meaningful_results(research_results))
         
         # Create a summary based on the limited content
         summary = f"""
@@ -89,38 +341,117 @@ class AnalysisAgent:
         
         return summary
     
+    def _create_deadline_summary(self, research_results: List[Dict[str, Any]], summaries: List[Dict[str, str]]) -> str:
+        """Stand-in for the overall analysis when the request deadline passed before it was generated."""
+        if not summaries:
+            return self._create_limited_content_summary(research_results)
+        points = "\n".join(f"- {s['title']}: {s['summary'][:400]}" for s in summaries)
+        return (
+            "The overall analysis could not be completed within the request's time budget. "
+            f"Key points from the {len(summaries)} sources summarized in time:\n{points}"
+        )
+    
     def _generate_tables(self, research_results: List[Dict[str, Any]], meaningful_results: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Generate data tables from research results."""
+        """
+        Generate data tables from research results.
+        
+        The results are loaded into one DataFrame and every table is computed
+        with vectorized pandas operations. Keyword statistics use the full
+        fetched text of the meaningful sources (the preview when no text was
+        kept).
+        """
         tables = {}
+        df = pd.DataFrame(research_results, columns=[
+            "title", "url", "snippet", "domain", "content_preview", "fetched_text", "fetched_text_length"
+        ])
+        df["fetched_text_length"] = df["fetched_text_length"].fillna(0).astype(int)
+        df["snippet"] = df["snippet"].fillna("")
+        accessible = df["fetched_text_length"] > self.MIN_MEANINGFUL_LENGTH
         
         # Table 1: Research results overview
-        overview_data = []
-        for result in research_results:
-            content_status = "Accessible" if result.get("fetched_text_length", 0) > 500 else "Limited/Behind Login"
-            overview_data.append({
-                "Title": result["title"],
-                "URL": result["url"],
-                "Content Length": result.get("fetched_text_length", 0),
-                "Content Status": content_status,
-                "Snippet": result["snippet"][:100] + "..." if len(result["snippet"]) > 100 else result["snippet"]
-            })
-        
-        tables["research_overview"] = overview_data
-        
-        # Table 2: Keyword frequency (only from meaningful results)
-        if meaningful_results:
-            all_text = " ".join([r["content_preview"] for r in meaningful_results if r["content_preview"]])
-            words = re.findall(r'\b[a-zA-Z]{3,}\b', all_text.lower())
-            word_freq = Counter(words).most_common(10)
-            
-            tables["keyword_frequency"] = [{"Keyword": word, "Count": count} for word, count in word_freq]
-        else:
-            tables["keyword_frequency"] = [{"Keyword": "N/A", "Count": 0}]
+        snippets = df["snippet"].where(df["snippet"].str.len() <= 100, df["snippet"].str.slice(0, 100) + "...")
+        tables["research_overview"] = pd.DataFrame({
+            "Title": df["title"],
+            "URL": df["url"],
+            "Content Length": df["fetched_text_length"],
+            "Content Status": np.where(accessible, "Accessible", "Limited/Behind Login"),
+            "Snippet": snippets
+        }).to_dict("records")
         
-        # Table 3: Source summaries (only from meaningful results)
-        if meaningful_results:
-            tables["source_summaries"] = meaningful_results
+        # Tables 2-3: Keyword frequency and TF-IDF (only from meaningful results)
+        terms = self._term_statistics(df[accessible])
+        if terms.empty:
+            tables["keyword_frequency"] = [{"Keyword": "N/A", "Count": 0}]
+            tables["keyword_tfidf"] = []
         else:
-            tables["source_summaries"] = []
+            top_counts = terms["count"].sort_values(ascending=False, kind="stable").head(10)
+            tables["keyword_frequency"] = [{"Keyword": word, "Count": int(count)} for word, count in top_counts.items()]
+            top_tfidf = terms.sort_values("tfidf", ascending=False, kind="stable").head(10)
+            tables["keyword_tfidf"] = [
+                {"Keyword": word, "TF-IDF": round(float(row.tfidf), 4), "Sources": int(row.sources)}
+                for word, row in zip(top_tfidf.index, top_tfidf.itertuples())
+            ]
+        
+        # Table 4: Per-domain aggregates
+        domains = df["domain"].fillna("")
+        domains = domains.where(domains != "", df["url"].str.extract(r"//([^/:]+)", expand=False).fillna(""))
+        grouped = pd.DataFrame({"accessible": accessible, "length": df["fetched_text_length"]}).groupby(domains, sort=False)
+        by_domain = pd.DataFrame({
+            "sources": grouped.size(),
+            "accessible": grouped["accessible"].sum(),
+            "average_length": grouped["length"].mean()
+        }).sort_values("sources", ascending=False, kind="stable")
+        tables["domain_summary"] = [
+            {
+                "Domain": row.Index,
+                "Sources": int(row.sources),
+                "Accessible": int(row.accessible),
+                "Average Content Length": int(round(row.average_length))
+            }
+            for row in by_domain.itertuples()
+        ]
+        
+        # Table 5: Source summaries (only from meaningful results; the full text stays internal)
+        tables["source_summaries"] = [
+            {key: value for key, value in result.items() if key != "fetched_text"}
+            for result in meaningful_results
+        ]
+        
+        return tables
+    
+    def _term_statistics(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Per-term statistics over the sources in `df`, indexed by term.
+        
+        Columns: `count` (total occurrences), `sources` (document frequency)
+        and `tfidf` (mean over sources of length-normalized TF times smoothed
+        IDF). Stopwords and words under three letters are left out.
+        """
+        text = df["fetched_text"].fillna("")
+        text = text.where(text.str.len() > 0, df["content_preview"].fillna(""))
+        tokens = text.str.lower().str.translate(TOKEN_SEPARATORS).str.split().explode()
+        
+        # Work on integer codes: filters run once per distinct word, counting is np.unique/np.bincount
+        codes, vocabulary = pd.factorize(tokens)
+        vocabulary = pd.Index(vocabulary, dtype=object)
+        keep = np.asarray((vocabulary.str.len() >= 3) & vocabulary.str.isalpha() & ~vocabulary.isin(STOPWORDS))
+        mask = codes >= 0  # empty sources explode to NaN
+        mask[mask] = keep[codes[mask]]
+        if not mask.any():
+            return pd.DataFrame(columns=["count", "sources", "tfidf"])
+        
+        # One entry per (source, term) pair with its occurrence count
+        _, source_ids = np.unique(tokens.index.to_numpy()[mask], return_inverse=True)
+        pairs, pair_counts = np.unique(source_ids * len(vocabulary) + codes[mask], return_counts=True)
+        pair_sources, pair_terms = pairs // len(vocabulary), pairs % len(vocabulary)
+        n_sources = int(source_ids.max()) + 1
         
-        return tables
\ No newline at end of file
+        term_frequency = pair_counts / np.bincount(pair_sources, weights=pair_counts)[pair_sources]
+        document_frequency = np.bincount(pair_terms, minlength=len(vocabulary))
+        idf = np.log((1 + n_sources) / (1 + document_frequency)) + 1
+        stats = pd.DataFrame({
+            "count": np.bincount(pair_terms, weights=pair_counts, minlength=len(vocabulary)).astype(np.int64),
+            "sources": document_frequency,
+            "tfidf": np.bincount(pair_terms, weights=term_frequency * idf[pair_terms], minlength=len(vocabulary)) / n_sources
+        }, index=vocabulary)
+        return stats[stats["count"] > 0]
@@ -1,40 +1,289 @@
-from typing import List, Dict, Any
+import asyncio
+import math
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Dict, Any, Optional, Tuple
+from urllib.parse import urlparse
 # from services.serpapi_service import SerpApiService   # ❌ old
 from services.serper_service import SerperService       # ✅ new
+from services.deadline import DeadlineExceeded, record_drop, within_deadline
 from services.fetcher import ContentFetcher
+from services.page_classifier import USEFUL_MIN_CHARS
 from logger import log_agent_start, log_agent_end
 
 
 class ResearchAgent:
-    def __init__(self):
-        self.serp_service = SerperService()   # ✅ now uses Serper.dev
-        self.fetcher = ContentFetcher()
-    
-    def research(self, topic: str, num_results: int = 5) -> List[Dict[str, Any]]:
+    # Result for a page abandoned at the request deadline
+    DROPPED_CONTENT = {
+        "content_preview": "Dropped: the request deadline passed before this page was fetched",
+        "fetched_text": "",
+        "fetched_text_length": 0
+    }
+
+    def __init__(self, search_service=None, fetcher: Optional[ContentFetcher] = None,
+                 max_concurrency: Optional[int] = None, per_domain_limit: Optional[int] = None,
+                 overfetch: Optional[float] = None):
+        self.serp_service = search_service or SerperService()   # ✅ now uses Serper.dev
+        self.fetcher = fetcher or ContentFetcher()
+
+        # Fetches at once per research run; per host, the async path leaves it to the fetcher's
+        # PolitenessScheduler and the thread pool dispatches at the same FETCH_PER_DOMAIN_LIMIT
+        self.max_concurrency = max_concurrency or int(os.getenv("FETCH_MAX_CONCURRENCY", "8"))
+        self.per_domain_limit = per_domain_limit or int(os.getenv("FETCH_PER_DOMAIN_LIMIT", "2"))
+
+        # Search candidates per requested result; above 1, extra pages are fetched and
+        # the first `num_results` meaningful ones kept (see `_select`)
+        self.overfetch = max(overfetch or float(os.getenv("RESEARCH_OVERFETCH", "1.0")), 1.0)
+
+    def research(self, topic: str, num_results: int = 5, concurrent: bool = True) -> List[Dict[str, Any]]:
         start_time = log_agent_start("ResearchAgent", {"topic": topic, "num_results": num_results})
-        
+
         try:
-            search_results = self.serp_service.search(topic, num_results)
-            
-            research_results = []
-            for result in search_results:
-                content_data = self.fetcher.fetch_content(result["url"])
-                
-                research_result = {
-                    "url": result.get("url", ""),
-                    "title": result.get("title", ""),
-                    "snippet": result.get("snippet", ""),
-                    "domain": result.get("domain", ""),             
-                    "published_date": result.get("published_date", ""),
-                    "content_preview": content_data.get("content_preview", ""),
-                    "fetched_text_length": content_data.get("fetched_text_length", 0)
-                }
-                
-                research_results.append(research_result)
-            
+            candidates = self._candidate_count(num_results)
+            search_results = self.serp_service.search(topic, candidates)
+            urls = [result.get("url", "") for result in search_results]
+
+            if concurrent:
+                contents = self._fetch_concurrently(urls, needed=num_results if candidates > num_results else None)
+            else:
+                contents = [self.fetcher.fetch_content(url) for url in urls]
+
+            research_results = [
+                self._build_result(result, content_data)
+                for result, content_data in self._select(search_results, contents, num_results)
+            ]
+
+            log_agent_end("ResearchAgent", start_time, research_results)
+            return research_results
+
+        except Exception as e:
+            log_agent_end("ResearchAgent", start_time, None)
+            raise Exception(f"Research failed: {str(e)}")
+
+    async def aresearch(self, topic: str, num_results: int = 5,
+                        on_search: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+                        on_result: Optional[Callable[[int, Dict[str, Any]], None]] = None) -> List[Dict[str, Any]]:
+        """
+        Async variant of `research`; fetches run concurrently on the event loop.
+
+        With over-fetching (RESEARCH_OVERFETCH above 1) more candidates are
+        searched and fetched than requested, and the remaining fetches are
+        cancelled as soon as `num_results` meaningful pages have arrived.
+
+        Args:
+            topic: Research topic
+            num_results: Number of search results to fetch
+            on_search: Optional callback receiving the raw search results
+                (every candidate) before any page is fetched
+            on_result: Optional callback receiving (index, result) as soon as
+                each page has been fetched, in completion order; the index is
+                the candidate's position in the search results
+
+        Returns:
+            Research results in search order
+        """
+        start_time = log_agent_start("ResearchAgent", {"topic": topic, "num_results": num_results})
+
+        try:
+            candidates = self._candidate_count(num_results)
+            search_results = await self.serp_service.asearch(topic, candidates)
+            urls = [result.get("url", "") for result in search_results]
+            if on_search is not None:
+                on_search(search_results)
+
+            on_content = None
+            if on_result is not None:
+                def on_content(index: int, content_data: Dict[str, Any]):
+                    on_result(index, self._build_result(search_results[index], content_data))
+
+            contents = await self._afetch_concurrently(
+                urls, on_content, search_results, needed=num_results if candidates > num_results else None
+            )
+
+            research_results = [
+                self._build_result(result, content_data)
+                for result, content_data in self._select(search_results, contents, num_results)
+            ]
+
             log_agent_end("ResearchAgent", start_time, research_results)
             return research_results
-            
+
         except Exception as e:
             log_agent_end("ResearchAgent", start_time, None)
             raise Exception(f"Research failed: {str(e)}")
+
+    def _build_result(self, result: Dict[str, Any], content_data: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "url": result.get("url", ""),
+            "title": result.get("title", ""),
+            "snippet": result.get("snippet", ""),
+            "domain": result.get("domain", ""),
+            "published_date": result.get("published_date", ""),
+            "content_preview": content_data.get("content_preview", ""),
+            "fetched_text_length": content_data.get("fetched_text_length", 0),
+            # Full page text for analysis; not part of the API response
+            "fetched_text": content_data.get("fetched_text", "")
+        }
+
+    def _candidate_count(self, num_results: int) -> int:
+        """Search results to request for `num_results` sources."""
+        return math.ceil(num_results * self.overfetch)
+
+    def _is_meaningful(self, content_data: Dict[str, Any]) -> bool:
+        """Enough text for AnalysisAgent to use the page (not a login wall or stub)."""
+        return content_data.get("fetched_text_length", 0) > USEFUL_MIN_CHARS
+
+    def _select(self, search_results: List[Dict[str, Any]], contents: List[Optional[Dict[str, Any]]],
+                num_results: int) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        """
+        Pick `num_results` of the fetched candidates, in search order.
+
+        Meaningful pages are chosen first; the rest of the places go to the
+        other fetched pages in search order. Without over-fetching this is
+        every result. Candidates whose fetch was cancelled have no content.
+        """
+        fetched = [(result, content_data) for result, content_data in zip(search_results, contents)
+                   if content_data is not None]
+        meaningful = [index for index, (_, content_data) in enumerate(fetched) if self._is_meaningful(content_data)]
+        others = [index for index, (_, content_data) in enumerate(fetched) if not self._is_meaningful(content_data)]
+        chosen = meaningful[:num_results]
+        chosen += others[:num_results - len(chosen)]
+        return [fetched[index] for index in sorted(chosen)]
+
+    def _fetch_concurrently(self, urls: List[str], needed: Optional[int] = None) -> List[Optional[Dict[str, Any]]]:
+        """
+        Fetch all URLs on a bounded thread pool.
+
+        At most `max_concurrency` fetches run at once overall and at most
+        `per_domain_limit` against any single host. A URL is only handed to the
+        pool once its host has a free slot, so a busy host never ties up
+        workers that URLs on other hosts could use. Results are returned in
+        the same order as `urls`.
+
+        With `needed`, no further URLs are started once that many meaningful
+        pages have arrived; fetches still running are left to finish in the
+        background and their URLs get None.
+        """
+        if not urls:
+            return []
+
+        # Pending URL indexes per host, in search order
+        pending: Dict[str, deque] = {}
+        for index, url in enumerate(urls):
+            pending.setdefault(self._domain_of(url), deque()).append(index)
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(urls)
+        errors: List[BaseException] = []
+        remaining = [len(urls)]
+        meaningful = [0]
+        lock = threading.Lock()
+        finished = threading.Event()
+
+        workers = max(1, min(self.max_concurrency, len(urls)))
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fetch")
+        try:
+            def fetch(index: int):
+                try:
+                    content_data = self.fetcher.fetch_content(urls[index])
+                except BaseException as e:
+                    errors.append(e)
+                    content_data = None
+                with lock:
+                    if finished.is_set():
+                        return
+                    results[index] = content_data
+                    if content_data is not None and self._is_meaningful(content_data):
+                        meaningful[0] += 1
+                    # Hand this host's slot to its next pending URL
+                    queue = pending[self._domain_of(urls[index])]
+                    if queue:
+                        pool.submit(fetch, queue.popleft())
+                    remaining[0] -= 1
+                    if remaining[0] == 0 or (needed is not None and meaningful[0] >= needed):
+                        finished.set()
+
+            with lock:
+                # Start one URL per host before a second one on any host
+                for _ in range(self.per_domain_limit):
+                    for queue in pending.values():
+                        if queue:
+                            pool.submit(fetch, queue.popleft())
+
+            finished.wait()
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        if errors:
+            raise errors[0]
+        return results
+
+    async def _afetch_concurrently(self, urls: List[str],
+                                   on_content: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+                                   search_results: Optional[List[Dict[str, Any]]] = None,
+                                   needed: Optional[int] = None) -> List[Optional[Dict[str, Any]]]:
+        """
+        Async counterpart of `_fetch_concurrently` with the same limits and ordering.
+
+        Per-host concurrency is enforced by the fetcher's PolitenessScheduler.
+        Fetches are started one host at a time in turn, so the URLs of one
+        host with many results do not queue ahead of every other host for
+        the global slots.
+
+        With `needed`, the fetches still pending once that many meaningful
+        pages have arrived are cancelled and their URLs get None.
+
+        Under a request deadline (see services/deadline.py), fetches still
+        running when it passes are abandoned: they get an empty result and
+        are recorded as dropped, and the pipeline goes on without them.
+        """
+        titles = [result.get("title", "") for result in search_results or []]
+        global_slots = asyncio.Semaphore(self.max_concurrency)
+
+        async def fetch(index: int, url: str) -> Dict[str, Any]:
+            try:
+                async with global_slots:
+                    return await within_deadline(self.fetcher.afetch_content(url))
+            except DeadlineExceeded:
+                record_drop(url, titles[index] if index < len(titles) else "", "fetch")
+                return dict(self.DROPPED_CONTENT)
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(urls)
+        tasks = {asyncio.ensure_future(fetch(index, urls[index])): index for index in self._by_host_in_turn(urls)}
+        meaningful = 0
+        try:
+            while tasks and (needed is None or meaningful < needed):
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in sorted(done, key=tasks.get):
+                    index = tasks.pop(task)
+                    if needed is not None and meaningful >= needed:
+                        continue
+                    results[index] = task.result()
+                    if self._is_meaningful(results[index]):
+                        meaningful += 1
+                    if on_content is not None:
+                        on_content(index, results[index])
+        finally:
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        return results
+
+    def _by_host_in_turn(self, urls: List[str]) -> List[int]:
+        """URL indexes taking one per host in turn, each host's in search order."""
+        pending: Dict[str, deque] = {}
+        for index, url in enumerate(urls):
+            pending.setdefault(self._domain_of(url), deque()).append(index)
+        order = []
+        while pending:
+            for domain in list(pending):
+                order.append(pending[domain].popleft())
+                if not pending[domain]:
+                    del pending[domain]
+        return order
+
+    @staticmethod
+    def _domain_of(url: str) -> str:
+        return urlparse(url).netloc.lower()
@@ -1,24 +1,54 @@
-from typing import Dict
+import asyncio
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from services.gemini_service import GeminiService
-from logger import log_agent_start, log_agent_end
+from services.prompt_budget import PromptBudget, estimate_tokens
+from logger import logger, log_agent_start, log_agent_end
 from datetime import datetime
-import time
 import re
 
+REVIEW_MODES = ("full", "sections", "auto")
+
+# Reply a section reviewer gives when a section needs no edits
+UNCHANGED = "UNCHANGED"
+
 class ReviewerAgent:
-    def __init__(self):
-        self.gemini_service = GeminiService()
+    # Sections with less prose than this (title, date line, bare headings) are not sent for review
+    MIN_SECTION_CHARS = 80
+    
+    def __init__(self, gemini_service: Optional[GeminiService] = None, prompt_tokens: Optional[int] = None,
+                 review_mode: Optional[str] = None, max_concurrency: Optional[int] = None,
+                 min_sections: Optional[int] = None):
+        self.gemini_service = gemini_service or GeminiService()
+        self.prompt_tokens = prompt_tokens or int(os.getenv("REVIEWER_PROMPT_TOKENS", "12000"))
+        
+        # full: one call returns the whole report; sections: markdown sections are
+        # reviewed concurrently and only changed ones come back; auto: sections
+        # once the draft has at least `min_sections` sections
+        self.review_mode = (review_mode or os.getenv("REVIEW_MODE", "auto")).lower()
+        if self.review_mode not in REVIEW_MODES:
+            raise ValueError(f"Unsupported REVIEW_MODE: {self.review_mode}")
+        self.max_concurrency = max_concurrency or int(os.getenv("REVIEW_MAX_CONCURRENCY", "4"))
+        self.min_sections = min_sections or int(os.getenv("REVIEW_MIN_SECTIONS", "4"))
     
-    def review_report(self, draft_report: str) -> Dict[str, str]:
+    def review_report(self, draft_report: str,
+                      on_prompt_usage: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, str]:
         """
         Always returns:
         {
           "final_report": str,
           "review_notes": str
         }
+        
+        In full mode only the leading sections of the draft that fit the
+        reviewer's prompt budget are sent for review; later sections are kept
+        as written. In sections mode see `_review_sections`.
+        `on_prompt_usage` receives the prompt's estimated token usage.
         """
         # Log the draft report length for debugging
-        print(f"=== DRAFT REPORT LENGTH === {len(draft_report)} characters")
+        logger.debug("Draft report length: %d characters", len(draft_report))
         
         # Get current date
         current_date = datetime.now().strftime("%B %d, %Y")
@@ -27,15 +57,79 @@ class ReviewerAgent:
         try:
             # Check if draft report is empty or too short
             if not draft_report or len(draft_report.strip()) < 100:
-                print("=== DRAFT REPORT IS EMPTY OR TOO SHORT ===")
+                logger.warning("Draft report is empty or too short")
                 # Return the draft as-is with a note
                 return {
                     "final_report": draft_report,
                     "review_notes": "Draft report was empty or too short for review."
                 }
             
-            # Create a prompt that explicitly avoids conversational openings
-            prompt = f"""
+            if self._use_sections(draft_report):
+                return self._review_sections(draft_report, current_date, on_prompt_usage)
+            
+            head, tail = self._fit_draft(draft_report, current_date, on_prompt_usage)
+            if not head:
+                return self._over_budget(draft_report)
+            prompt = self._build_prompt(head, current_date)
+            
+            # Get the raw response directly from the Gemini service with retry logic
+            raw_response = self._generate_review(prompt)
+            
+            return self._with_unreviewed(self._finalize(raw_response, head, current_date), tail)
+            
+        except Exception as e:
+            logger.error("Reviewer agent error: %s", e)
+            fallback = {
+                "final_report": draft_report,
+                "review_notes": f"Reviewer error; returned draft. Reason: {str(e)}"
+            }
+            log_agent_end("ReviewerAgent", start_time, fallback)
+            return fallback
+    
+    async def areview_report(self, draft_report: str,
+                             on_token: Optional[Callable[[str], None]] = None,
+                             on_prompt_usage: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, str]:
+        """
+        Async variant of `review_report` that does not block the event loop.
+        
+        When `on_token` is given the reviewed report is streamed and each raw
+        chunk is passed to it (in sections mode, each section in document
+        order once it and the sections before it are done); the returned
+        final report is still cleaned up.
+        """
+        current_date = datetime.now().strftime("%B %d, %Y")
+        
+        start_time = log_agent_start("ReviewerAgent", {"draft_report_length": len(draft_report)})
+        try:
+            if not draft_report or len(draft_report.strip()) < 100:
+                return {
+                    "final_report": draft_report,
+                    "review_notes": "Draft report was empty or too short for review."
+                }
+            
+            if self._use_sections(draft_report):
+                return await self._areview_sections(draft_report, current_date, on_token, on_prompt_usage)
+            
+            head, tail = self._fit_draft(draft_report, current_date, on_prompt_usage)
+            if not head:
+                return self._over_budget(draft_report)
+            prompt = self._build_prompt(head, current_date)
+            raw_response = await self._agenerate_review(prompt, on_token=on_token)
+            
+            return self._with_unreviewed(self._finalize(raw_response, head, current_date), tail)
+            
+        except Exception as e:
+            logger.error("Reviewer agent error: %s", e)
+            fallback = {
+                "final_report": draft_report,
+                "review_notes": f"Reviewer error; returned draft. Reason: {str(e)}"
+            }
+            log_agent_end("ReviewerAgent", start_time, fallback)
+            return fallback
+    
+    def _build_prompt(self, draft_report: str, current_date: str) -> str:
+        """Create a prompt that explicitly avoids conversational openings."""
+        return f"""
             You are a professional copy editor. Review the following report for clarity, grammar, and professionalism.
             
             Requirements:
@@ -51,63 +145,258 @@ class ReviewerAgent:
             
             {draft_report}
             """
+    
+    def _section_prompt(self, section: str, current_date: str) -> str:
+        """Prompt for reviewing one section of a longer report."""
+        return f"""
+            You are a professional copy editor. Review one section of a longer report for clarity, grammar, and professionalism.
             
-            # Get the raw response directly from the Gemini service with retry logic
-            raw_response = self._generate_with_retry(prompt)
-            
-            # Debug preview
-            print("=== RAW REVIEWER RESPONSE ===")
-            print(str(raw_response)[:500])
-            print("================================")
-            
-            # If we got a valid response, use it as the final report
-            if raw_response and len(raw_response.strip()) > 100:
-                # Remove any conversational openings that might still be present
-                final_report = self._remove_conversational_openings(raw_response)
-                
-                # Ensure there's exactly one correct date
-                final_report = self._ensure_correct_date(final_report, current_date)
-                
-                # Create a simple review note
-                review_notes = "Report reviewed for clarity, grammar, and professionalism. Removed conversational openings and ensured correct date formatting."
-                
-                return {
-                    "final_report": final_report,
-                    "review_notes": review_notes
-                }
-            else:
-                # If the response is empty or too short, return the draft
-                return {
-                    "final_report": draft_report,
-                    "review_notes": "Reviewer returned empty response; using draft."
-                }
+            Requirements:
+            - Maintain a professional, formal tone throughout
+            - Check for proper grammar and punctuation
+            - Improve readability while preserving all factual content, tables and citations
+            - Keep the section heading; do not add a report title, a date or any introductory phrases
+            - The report is dated {current_date}
+            - If the section needs no changes, reply with exactly {UNCHANGED}
+            - Otherwise reply with ONLY the corrected section
             
-        except Exception as e:
-            print(f"=== REVIEWER AGENT ERROR === {str(e)}")
-            fallback = {
+            Section:
+            
+            {section}
+            """
+    
+    def _use_sections(self, draft_report: str) -> bool:
+        if self.review_mode == "auto":
+            return len(self._split_sections(draft_report)) >= self.min_sections
+        return self.review_mode == "sections"
+    
+    def _plan_sections(self, draft_report: str, current_date: str,
+                       on_prompt_usage: Optional[Callable[[Dict[str, Any]], None]] = None) -> List[Tuple[str, Optional[str]]]:
+        """
+        Split the draft into sections and build a review prompt for each one worth reviewing.
+        
+        Returns:
+            (section, prompt) pairs in document order; the prompt is None for
+            sections kept as written (too little prose, or over the budget)
+        """
+        plan = []
+        call_tokens = []
+        for section in self._split_sections(draft_report):
+            body = section.split("\n", 1)[1] if section.startswith("#") and "\n" in section else section
+            prompt = self._section_prompt(section, current_date)
+            if len(body.strip()) < self.MIN_SECTION_CHARS or estimate_tokens(prompt) > self.prompt_tokens:
+                plan.append((section, None))
+                continue
+            plan.append((section, prompt))
+            call_tokens.append(estimate_tokens(prompt))
+        
+        usage = {
+            "budget": self.prompt_tokens,
+            "tokens": sum(call_tokens),
+            "calls": len(call_tokens),
+            "largest_call": max(call_tokens, default=0),
+            "sections": {"draft": {"sections": len(plan), "unreviewed": len(plan) - len(call_tokens)}}
+        }
+        logger.info("ReviewerAgent section prompts: ~%d tokens over %d calls", usage["tokens"], usage["calls"])
+        if on_prompt_usage is not None:
+            on_prompt_usage(usage)
+        return plan
+    
+    def _merge_section(self, section: str, response: str) -> Tuple[str, str]:
+        """
+        Splice a section reviewer's reply back in.
+        
+        Returns:
+            (section text, status) where status is "revised", "unchanged" or
+            "failed" (empty or truncated replies keep the original)
+        """
+        reply = (response or "").strip()
+        if reply.strip("`* .").upper() == UNCHANGED:
+            return section, "unchanged"
+        if len(reply) < len(section.strip()) // 2:
+            return section, "failed"
+        
+        heading = section.split("\n", 1)[0]
+        if heading.startswith("#") and not reply.startswith("#"):
+            reply = heading + "\n" + reply
+        # Keep the original spacing before the next section
+        return reply + section[len(section.rstrip()):], "revised"
+    
+    def _finalize_sections(self, merged: List[Tuple[str, str]], current_date: str) -> Dict[str, str]:
+        """Join the reviewed sections and clean up the whole report once."""
+        final_report = self._remove_conversational_openings("".join(text for text, _ in merged))
+        final_report = self._ensure_correct_date(final_report, current_date)
+        
+        statuses = [status for _, status in merged]
+        reviewed = len(statuses) - statuses.count("skipped")
+        review_notes = (
+            f"Reviewed {reviewed} of {len(statuses)} sections concurrently for clarity, grammar, and professionalism: "
+            f"{statuses.count('revised')} revised, {statuses.count('unchanged')} unchanged."
+        )
+        if statuses.count("failed"):
+            review_notes += f" {statuses.count('failed')} kept as written after an empty or incomplete review."
+        review_notes += " Removed conversational openings and ensured correct date formatting."
+        return {
+            "final_report": final_report,
+            "review_notes": review_notes
+        }
+    
+    def _review_sections(self, draft_report: str, current_date: str,
+                         on_prompt_usage: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, str]:
+        """
+        Review the draft's markdown sections concurrently.
+        
+        Each section goes to Gemini on its own and only revised sections come
+        back; unchanged and short sections are spliced in locally. Conversational
+        openings and the date are fixed once on the joined report.
+        """
+        plan = self._plan_sections(draft_report, current_date, on_prompt_usage)
+        
+        def review(item: Tuple[str, Optional[str]]) -> Tuple[str, str]:
+            section, prompt = item
+            if prompt is None:
+                return section, "skipped"
+            return self._merge_section(section, self._generate_review(prompt))
+        
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="review") as pool:
+            merged = list(pool.map(review, plan))
+        return self._finalize_sections(merged, current_date)
+    
+    async def _areview_sections(self, draft_report: str, current_date: str,
+                                on_token: Optional[Callable[[str], None]] = None,
+                                on_prompt_usage: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, str]:
+        """Async counterpart of `_review_sections`; sections are streamed to `on_token` in order."""
+        plan = self._plan_sections(draft_report, current_date, on_prompt_usage)
+        slots = asyncio.Semaphore(self.max_concurrency)
+        
+        async def review(section: str, prompt: str) -> Tuple[str, str]:
+            async with slots:
+                return self._merge_section(section, await self._agenerate_review(prompt))
+        
+        tasks = [asyncio.ensure_future(review(section, prompt)) if prompt is not None else None for section, prompt in plan]
+        merged = []
+        try:
+            for (section, _), task in zip(plan, tasks):
+                text, status = await task if task is not None else (section, "skipped")
+                merged.append((text, status))
+                if on_token is not None:
+                    on_token(text)
+        finally:
+            for task in tasks:
+                if task is not None:
+                    task.cancel()
+        return self._finalize_sections(merged, current_date)
+    
+    def _split_sections(self, report: str) -> List[str]:
+        """Split a markdown report before each heading; joining the parts gives the report back."""
+        return [part for part in re.split(r"(?m)^(?=#{1,6}\s)", report) if part]
+    
+    def _fit_draft(self, draft_report: str, current_date: str,
+                   on_prompt_usage: Optional[Callable[[Dict[str, Any]], None]] = None) -> Tuple[str, str]:
+        """
+        Split the draft into the leading whole sections that fit the prompt budget and the rest.
+        
+        Returns:
+            (part to review, part kept as written); the first is empty when
+            not even the first section fits
+        """
+        budget = PromptBudget(self.prompt_tokens)
+        budget.reserve("instructions", self._build_prompt("", current_date))
+        
+        sections = self._split_sections(draft_report)
+        fitting = 0
+        tokens = 0
+        for section in sections:
+            if tokens + estimate_tokens(section) > budget.remaining:
+                break
+            tokens += estimate_tokens(section)
+            fitting += 1
+        
+        head = "".join(sections[:fitting])
+        budget.reserve("draft", head, sections=fitting, unreviewed=len(sections) - fitting)
+        logger.info("ReviewerAgent prompt: %s", budget.summary())
+        if on_prompt_usage is not None:
+            on_prompt_usage(budget.report())
+        return head, "".join(sections[fitting:])
+    
+    def _over_budget(self, draft_report: str) -> Dict[str, str]:
+        return {
+            "final_report": draft_report,
+            "review_notes": "Draft report exceeds the reviewer's prompt budget; returned unreviewed."
+        }
+    
+    def _with_unreviewed(self, review: Dict[str, str], tail: str) -> Dict[str, str]:
+        """Append the sections that did not fit the prompt budget after the reviewed part."""
+        if not tail:
+            return review
+        return {
+            "final_report": review["final_report"].rstrip() + "\n\n" + tail.lstrip(),
+            "review_notes": review["review_notes"] + " Later sections exceeded the reviewer's prompt budget and were kept as written."
+        }
+    
+    def _finalize(self, raw_response: str, draft_report: str, current_date: str) -> Dict[str, str]:
+        """Turn the raw reviewer response into the final report, falling back to the draft."""
+        # Debug preview
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Raw reviewer response: %s", str(raw_response)[:500])
+        
+        # If we got a valid response, use it as the final report
+        if raw_response and len(raw_response.strip()) > 100:
+            # Remove any conversational openings that might still be present
+            final_report = self._remove_conversational_openings(raw_response)
+            
+            # Ensure there's exactly one correct date
+            final_report = self._ensure_correct_date(final_report, current_date)
+            
+            # Create a simple review note
+            review_notes = "Report reviewed for clarity, grammar, and professionalism. Removed conversational openings and ensured correct date formatting."
+            
+            return {
+                "final_report": final_report,
+                "review_notes": review_notes
+            }
+        else:
+            # If the response is empty or too short, return the draft
+            return {
                 "final_report": draft_report,
-                "review_notes": f"Reviewer error; returned draft. Reason: {str(e)}"
+                "review_notes": "Reviewer returned empty response; using draft."
             }
-            log_agent_end("ReviewerAgent", start_time, fallback)
-            return fallback
     
-    def _generate_with_retry(self, prompt, max_retries=3, initial_delay=1):
-        """Generate text with retry logic for transient errors."""
-        for attempt in range(max_retries):
-            try:
-                return self.gemini_service.generate_text(prompt)
-            except Exception as e:
-                if attempt == max_retries - 1:
-                    # Last attempt failed, return empty string
-                    print(f"=== ALL RETRY ATTEMPTS FAILED === {str(e)}")
-                    return ""
-                
-                # Exponential backoff
-                delay = initial_delay * (2 ** attempt)
-                print(f"=== RETRY ATTEMPT {attempt + 1}/{max_retries} AFTER {delay}s ===")
-                time.sleep(delay)
-        
-        return ""
+    def _generate_review(self, prompt):
+        """
+        Generate the review, or an empty string if the call fails.
+        
+        Transient errors (429s, 5xx, timeouts) are already retried by the
+        Gemini service's retry scheduler, within the shared rate limits.
+        """
+        try:
+            return self.gemini_service.generate_text(prompt)
+        except Exception as e:
+            logger.error("Review call failed: %s", e)
+            return ""
+    
+    async def _agenerate_review(self, prompt, on_token=None):
+        """
+        Async variant of `_generate_review`.
+        
+        A streamed call is only retried (by the service) if it failed before
+        any chunk was passed to `on_token`, so the caller never sees
+        duplicated output.
+        """
+        streamed = []
+        try:
+            if on_token is None:
+                return await self.gemini_service.agenerate_text(prompt)
+            async for chunk in self.gemini_service.astream_text(prompt):
+                streamed.append(chunk)
+                on_token(chunk)
+            return "".join(streamed)
+        except Exception as e:
+            if streamed:
+                logger.error("Streamed review failed after output: %s", e)
+            else:
+                logger.error("Review call failed: %s", e)
+            return ""
     
     def _remove_conversational_openings(self, text: str) -> str:
         """Remove conversational openings from the text."""
@@ -1,19 +1,30 @@
-from typing import Dict, Any
+import os
+from typing import Callable, Dict, Any, List, Optional
+from services.deadline import DeadlineExceeded
 from services.gemini_service import GeminiService
-from logger import log_agent_start, log_agent_end
+from services.prompt_budget import PromptBudget, relevance_score, relevance_terms
+from logger import logger, log_agent_start, log_agent_end
 from datetime import datetime
 
 class WriterAgent:
-    def __init__(self):
-        self.gemini_service = GeminiService()
+    # Shares of the prompt budget the summary and keyword sections may take; sources get the rest
+    SUMMARY_SHARE = 0.35
+    KEYWORDS_SHARE = 0.1
     
-    def write_report(self, analysis_data: Dict[str, Any], report_style: str = "concise") -> str:
+    def __init__(self, gemini_service: Optional[GeminiService] = None, prompt_tokens: Optional[int] = None):
+        self.gemini_service = gemini_service or GeminiService()
+        self.prompt_tokens = prompt_tokens or int(os.getenv("WRITER_PROMPT_TOKENS", "8000"))
+    
+    def write_report(self, analysis_data: Dict[str, Any], report_style: str = "concise",
+                     on_prompt_usage: Optional[Callable[[Dict[str, Any]], None]] = None) -> str:
         """
         Generate a draft report based on analysis data.
         
         Args:
             analysis_data: Output from AnalysisAgent
             report_style: Style of the report (concise, detailed, academic)
+            on_prompt_usage: Optional callback receiving the prompt's estimated
+                token usage per section
             
         Returns:
             Draft report text
@@ -24,27 +35,109 @@ class WriterAgent:
             # Get current date
             current_date = datetime.now().strftime("%B %d, %Y")
             
-            # Format analysis data for the writer
-            analysis_summary = analysis_data.get("analysis_summary", "")
-            research_overview = analysis_data.get("analysis_tables", {}).get("research_overview", [])
-            keyword_frequency = analysis_data.get("analysis_tables", {}).get("keyword_frequency", [])
-            source_summaries = analysis_data.get("analysis_tables", {}).get("source_summaries", [])
+            prompt = self._build_prompt(analysis_data, report_style, current_date, on_prompt_usage)
+            
+            # Generate the report directly
+            draft_report = self.gemini_service.generate_text(prompt)
+            draft_report = self._ensure_report(draft_report, analysis_data, current_date)
+            
+            log_agent_end("WriterAgent", start_time, draft_report)
+            return draft_report
+            
+        except Exception as e:
+            log_agent_end("WriterAgent", start_time, None)
+            raise Exception(f"Report writing failed: {str(e)}")
+    
+    async def awrite_report(self, analysis_data: Dict[str, Any], report_style: str = "concise",
+                            on_token: Optional[Callable[[str], None]] = None,
+                            on_prompt_usage: Optional[Callable[[Dict[str, Any]], None]] = None) -> str:
+        """
+        Async variant of `write_report` that awaits the Gemini call instead of blocking.
+        
+        Args:
+            analysis_data: Output from AnalysisAgent
+            report_style: Style of the report (concise, detailed, academic)
+            on_token: Optional callback; when given the report is streamed and
+                each generated chunk is passed to it as it arrives
+            on_prompt_usage: Optional callback receiving the prompt's estimated
+                token usage per section
+            
+        Returns:
+            Draft report text
+        """
+        start_time = log_agent_start("WriterAgent", {"report_style": report_style})
+        
+        try:
+            current_date = datetime.now().strftime("%B %d, %Y")
+            
+            prompt = self._build_prompt(analysis_data, report_style, current_date, on_prompt_usage)
+            parts = []
+            try:
+                if on_token is None:
+                    parts.append(await self.gemini_service.agenerate_text(prompt))
+                else:
+                    async for chunk in self.gemini_service.astream_text(prompt):
+                        parts.append(chunk)
+                        on_token(chunk)
+            except DeadlineExceeded:
+                # Out of time: keep what was streamed, or build the report from the analysis data
+                logger.warning("WriterAgent reached the request deadline after %d characters", len("".join(parts)))
+            draft_report = self._ensure_report("".join(parts), analysis_data, current_date)
+            
+            log_agent_end("WriterAgent", start_time, draft_report)
+            return draft_report
             
-            # Create a direct prompt with the actual analysis data
-            prompt = f"""
+        except Exception as e:
+            log_agent_end("WriterAgent", start_time, None)
+            raise Exception(f"Report writing failed: {str(e)}")
+    
+    def _build_prompt(self, analysis_data: Dict[str, Any], report_style: str, current_date: str,
+                      on_prompt_usage: Optional[Callable[[Dict[str, Any]], None]] = None) -> str:
+        """
+        Create a direct prompt with the actual analysis data, within the writer's token budget.
+        
+        The instructions are always sent whole. The analysis summary and the
+        keyword table are capped to a share of the budget, and the sources
+        fill what is left, most relevant first.
+        """
+        tables = analysis_data.get("analysis_tables", {})
+        budget = PromptBudget(self.prompt_tokens)
+        budget.reserve("instructions", self._render_prompt(report_style, current_date, "", "", ""))
+        
+        analysis_summary = budget.add(
+            "analysis_summary", analysis_data.get("analysis_summary", ""),
+            max_tokens=int(self.prompt_tokens * self.SUMMARY_SHARE)
+        )
+        keyword_frequency = budget.add_items(
+            "keyword_frequency", self._format_rows(tables.get("keyword_frequency", [])),
+            max_tokens=int(self.prompt_tokens * self.KEYWORDS_SHARE)
+        )
+        sources = budget.add_items("sources", self._source_entries(tables), separator="\n\n")
+        
+        logger.info("WriterAgent prompt: %s", budget.summary())
+        if on_prompt_usage is not None:
+            on_prompt_usage(budget.report())
+        
+        return self._render_prompt(
+            report_style, current_date,
+            analysis_summary or "No data available",
+            keyword_frequency or "No data available",
+            sources or "No data available"
+        )
+    
+    def _render_prompt(self, report_style: str, current_date: str, analysis_summary: str,
+                       keyword_frequency: str, sources: str) -> str:
+        return f"""
             Generate a professional business report in a {report_style} style based on the provided analysis data.
             
             Analysis Summary:
             {analysis_summary}
             
-            Research Overview:
-            {self._format_data_for_prompt(research_overview)}
-            
             Keyword Frequency:
-            {self._format_data_for_prompt(keyword_frequency)}
+            {keyword_frequency}
             
-            Source Summaries:
-            {self._format_data_for_prompt(source_summaries)}
+            Sources (most relevant first; the research overview lists each source's title, URL and content status):
+            {sources}
             
             The report must include the following sections:
             1. Executive Summary
@@ -66,44 +159,75 @@ class WriterAgent:
             - Avoid excessive markdown symbols (like multiple # or *) - use minimal formatting for clarity
             - Return ONLY the report content, nothing else
             """
-            
-            # Generate the report directly
-            draft_report = self.gemini_service.generate_text(prompt)
-            
-            # If the generated report is empty or too short, create one using the actual analysis data
-            if not draft_report or len(draft_report.strip()) < 100:
-                print("=== GENERATED REPORT WAS EMPTY, CREATING FROM ANALYSIS DATA ===")
-                draft_report = self._create_report_from_analysis(
-                    analysis_summary, 
-                    research_overview, 
-                    keyword_frequency, 
-                    source_summaries, 
-                    current_date
-                )
-            
-            log_agent_end("WriterAgent", start_time, draft_report)
-            return draft_report
-            
-        except Exception as e:
-            log_agent_end("WriterAgent", start_time, None)
-            raise Exception(f"Report writing failed: {str(e)}")
     
-    def _format_data_for_prompt(self, data):
-        """Format data for inclusion in the prompt."""
-        if not data:
-            return "No data available"
+    def _source_entries(self, tables: Dict[str, Any]) -> List[str]:
+        """
+        One prompt entry per source, ranked by relevance to the top keywords.
         
-        if isinstance(data, list):
-            # Format list of dictionaries
-            result = []
-            for item in data:
-                if isinstance(item, dict):
-                    result.append(", ".join([f"{k}: {v}" for k, v in item.items()]))
-                else:
-                    result.append(str(item))
-            return "\n".join(result)
+        The research overview and the source summaries describe the same
+        pages, so they are merged by URL: each source appears once, with its
+        content preview when it has one and its search snippet otherwise.
+        Accessible sources come before limited ones.
+        """
+        previews = {}
+        for summary in tables.get("source_summaries", []):
+            previews.setdefault(summary.get("url"), summary.get("content_preview") or "")
         
-        return str(data)
+        sources = []
+        seen = set()
+        for row in tables.get("research_overview", []):
+            url = row.get("URL")
+            if url in seen:
+                continue
+            seen.add(url)
+            sources.append({
+                "title": row.get("Title", ""),
+                "url": url,
+                "status": row.get("Content Status", ""),
+                "length": row.get("Content Length", 0),
+                "text": previews.get(url) or row.get("Snippet", "")
+            })
+        # Summaries without an overview row (e.g. callers passing only summaries)
+        for url, preview in previews.items():
+            if url not in seen:
+                seen.add(url)
+                sources.append({"title": "", "url": url, "status": "Accessible", "length": 0, "text": preview})
+        
+        weights = relevance_terms(tables)
+        ranked = sorted(
+            enumerate(sources),
+            key=lambda item: (
+                item[1]["status"] != "Accessible",
+                -relevance_score(f"{item[1]['title']} {item[1]['text']}", weights),
+                item[0]
+            )
+        )
+        return [
+            f"[{rank}] {source['title']} - {source['url']} ({source['status']}, {source['length']} chars)\n"
+            f"{source['text']}"
+            for rank, (_, source) in enumerate(ranked, 1)
+        ]
+    
+    def _format_rows(self, data: List[Dict[str, Any]]) -> List[str]:
+        """One line per table row for the prompt."""
+        return [
+            ", ".join([f"{k}: {v}" for k, v in item.items()]) if isinstance(item, dict) else str(item)
+            for item in data or []
+        ]
+    
+    def _ensure_report(self, draft_report: str, analysis_data: Dict[str, Any], current_date: str) -> str:
+        """If the generated report is empty or too short, create one using the actual analysis data."""
+        if not draft_report or len(draft_report.strip()) < 100:
+            logger.warning("Generated report was empty, creating it from the analysis data")
+            tables = analysis_data.get("analysis_tables", {})
+            draft_report = self._create_report_from_analysis(
+                analysis_data.get("analysis_summary", ""),
+                tables.get("research_overview", []),
+                tables.get("keyword_frequency", []),
+                tables.get("source_summaries", []),
+                current_date
+            )
+        return draft_report
     
     def _create_report_from_analysis(self, analysis_summary, research_overview, keyword_frequency, source_summaries, current_date):
         """Create a report using the analysis data when the generated report is empty."""
@@ -0,0 +1,60 @@
+"""
+Compare the BeautifulSoup and lxml HTML extractors on a corpus of saved pages.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_extractors
+    python -m benchmarks.bench_extractors --corpus /path/to/html --repeat 50
+"""
+import argparse
+import glob
+import os
+import statistics
+import time
+from services.extractors import BeautifulSoupExtractor, LxmlExtractor
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), "corpus")
+
+
+def time_extractor(extractor, html: str, repeat: int) -> float:
+    """Median wall time of one extraction, in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        extractor.extract(html)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="directory of saved .html pages")
+    parser.add_argument("--repeat", type=int, default=20, help="extractions per page and engine")
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.corpus, "*.html")))
+    if not paths:
+        raise SystemExit(f"No .html files found in {args.corpus}")
+
+    reference, fast = BeautifulSoupExtractor(), LxmlExtractor()
+    print(f"{'page':<28}{'size KB':>9}{'bs4 ms':>10}{'lxml ms':>10}{'speedup':>9}  equivalent")
+
+    totals = [0.0, 0.0]
+    for path in paths:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            html = f.read()
+
+        bs4_ms = time_extractor(reference, html, args.repeat)
+        lxml_ms = time_extractor(fast, html, args.repeat)
+        totals[0] += bs4_ms
+        totals[1] += lxml_ms
+        same = reference.extract(html) == fast.extract(html)
+
+        print(f"{os.path.basename(path):<28}{len(html) / 1024:>9.1f}{bs4_ms:>10.2f}{lxml_ms:>10.2f}"
+              f"{bs4_ms / lxml_ms:>8.1f}x  {'yes' if same else 'NO'}")
+
+    print(f"{'total':<28}{'':>9}{totals[0]:>10.2f}{totals[1]:>10.2f}{totals[0] / totals[1]:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+Replay the full research pipeline offline and report latency, throughput
+and peak memory.
+
+Search calls, web pages and Gemini responses come from a cassette (see
+cassette.py), so no network access or API keys are needed. Everything else
+is the real code: SerperService, ContentFetcher and its extractor, the four
+agents and the stage graph, and with `--target route` the FastAPI route too.
+Without `--cassette`, a synthetic cassette is built from the saved pages in
+benchmarks/corpus and Gemini responses are synthesized.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_pipeline
+    python -m benchmarks.bench_pipeline --clients 1 4 16 --requests 32 --llm-latency 1.5
+    python -m benchmarks.bench_pipeline --cassette cassettes/run.json --target route --latency-scale 0.5
+
+Record a cassette from live services (needs SERPER_API_KEY and GEMINI_API_KEY):
+
+    python -m benchmarks.bench_pipeline --record cassettes/run.json --topics "electric bikes" "heat pumps"
+"""
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import resource
+import statistics
+import sys
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+from benchmarks.cassette import Cassette, Latency, RecordingModel, RecordingTransport, ReplayModel, ReplayTransport, synth_cassette
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), "corpus")
+DEFAULT_TOPICS = ["electric bikes", "heat pumps", "home batteries"]
+
+
+def configure_environment(record: bool, warm_caches: bool):
+    """Settings for a reproducible run; call before the services are created."""
+    if not record:
+        os.environ.setdefault("SERPER_API_KEY", "replay")
+        os.environ.setdefault("GEMINI_API_KEY", "replay")
+        # Client-side rate limits would cap throughput at the quota instead of the pipeline's speed
+        for name in ("GEMINI_RPM", "GEMINI_TPM", "SERPER_RPM", "SERPAPI_RPM"):
+            os.environ.setdefault(name, "0")
+        # Replayed pages come from the cassette, not from the hosts politeness spacing protects
+        os.environ.setdefault("FETCH_DOMAIN_MIN_INTERVAL", "0")
+    os.environ["SEARCH_PROVIDER"] = "serper"
+    # Caches would turn repeated requests into lookups instead of pipeline runs
+    os.environ["SEARCH_CACHE_ENABLED"] = "true" if warm_caches else "false"
+    os.environ["GEMINI_CACHE_ENABLED"] = "true" if warm_caches else "false"
+    os.environ.pop("PAGE_CACHE_PATH", None)
+    # Likewise, domains learned to be useless would be skipped by later requests
+    os.environ.pop("DOMAIN_VERDICTS_PATH", None)
+    os.environ["DOMAIN_SKIP_MIN_SAMPLES"] = "0"
+
+
+def install(container, transport, model):
+    """Route the shared async HTTP client and the Gemini model through the cassette."""
+    from services import http_client
+
+    loop = asyncio.get_running_loop()
+    http_client._async_clients[loop] = http_client._build_async_client(transport)
+    container.gemini_service.model = model
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    ordered = sorted(samples)
+    return ordered[max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))]
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+async def run_load(send: Callable[[str], Awaitable[Dict]], topics: List[str], clients: int, requests: int,
+                   distinct: bool) -> Dict:
+    """`clients` concurrent loops sending `requests` requests in total."""
+    counter = itertools.count()
+    latencies: List[float] = []
+    stages: Dict[str, List[float]] = {}
+    failures = 0
+
+    async def client():
+        nonlocal failures
+        while True:
+            i = next(counter)
+            if i >= requests:
+                return
+            # Distinct topics keep identical in-flight requests from being coalesced into one run
+            topic = topics[i % len(topics)] + (f" #{i}" if distinct else "")
+            start = time.perf_counter()
+            try:
+                agent_logs = await send(topic)
+            except Exception as e:
+                failures += 1
+                print(f"request {i} failed: {e}", file=sys.stderr)
+                continue
+            latencies.append(time.perf_counter() - start)
+            for stage, seconds in (agent_logs.get("timings") or {}).get("stages", {}).items():
+                stages.setdefault(stage, []).append(seconds)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    wall = time.perf_counter() - start
+    return {"latencies": latencies, "stages": stages, "failures": failures, "wall": wall}
+
+
+async def replay(args, cassette: Cassette):
+    from dependencies import create_container
+    from schemas.request import ResearchRequest
+    from services.research_pipeline import run_pipeline
+
+    if not args.verbose:
+        # logger.py configures INFO logging on import
+        logging.getLogger().setLevel(logging.WARNING)
+
+    latency = Latency(args.search_latency, args.page_latency, args.llm_latency, args.latency_scale, args.jitter)
+    container = create_container()
+    install(container, ReplayTransport(cassette, latency), ReplayModel(cassette, latency, args.llm_words))
+
+    if args.target == "route":
+        import httpx
+        from main import app
+
+        http = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None)
+        app.state.agents = container
+
+        async def send(topic: str) -> Dict:
+            response = await http.post("/api/research", json={
+                "topic": topic, "num_results": args.num_results, "report_style": args.report_style
+            })
+            response.raise_for_status()
+            return response.json().get("agent_logs") or {}
+    else:
+        http = None
+
+        async def send(topic: str) -> Dict:
+            request = ResearchRequest(topic=topic, num_results=args.num_results, report_style=args.report_style)
+            return (await run_pipeline(request, container)).agent_logs or {}
+
+    topics = cassette.topics or DEFAULT_TOPICS
+    print(f"target={args.target} topics={len(topics)} num_results={args.num_results} "
+          f"latency: search={args.search_latency} page={args.page_latency} llm={args.llm_latency} "
+          f"scale={args.latency_scale} jitter={args.jitter}")
+    print(f"{'clients':>8}{'requests':>10}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}{'req/s':>9}{'failed':>8}{'peak RSS MB':>13}")
+    try:
+        for clients in args.clients:
+            result = await run_load(send, topics, clients, args.requests, not args.same_topics)
+            samples = result["latencies"] or [float("nan")]
+            print(f"{clients:>8}{args.requests:>10}{percentile(samples, 50):>9.2f}{percentile(samples, 95):>9.2f}"
+                  f"{percentile(samples, 99):>9.2f}{len(result['latencies']) / result['wall']:>9.2f}"
+                  f"{result['failures']:>8}{peak_rss_mb():>13.1f}")
+            stage_medians = ", ".join(
+                f"{stage} {statistics.median(values):.2f}s" for stage, values in result["stages"].items()
+            )
+            print(f"{'':>8}  stage p50: {stage_medians}")
+    finally:
+        if http is not None:
+            await http.aclose()
+    print(f"cassette misses: http={cassette.misses['http']} llm={cassette.misses['llm']} "
+          "(LLM misses are answered with synthesized text)")
+
+
+async def record(args):
+    from dependencies import create_container
+    from schemas.request import ResearchRequest
+    from services.research_pipeline import run_pipeline
+
+    cassette = Cassette(topics=list(args.topics))
+    container = create_container()
+    install(container, RecordingTransport(cassette), RecordingModel(cassette, container.gemini_service.model))
+    for topic in args.topics:
+        request = ResearchRequest(topic=topic, num_results=args.num_results, report_style=args.report_style)
+        start = time.perf_counter()
+        await run_pipeline(request, container)
+        print(f"recorded '{topic}' in {time.perf_counter() - start:.1f}s")
+    cassette.save(args.record)
+    print(f"saved {len(cassette.http)} HTTP exchanges and {len(cassette.llm)} Gemini responses to {args.record}")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cassette", help="cassette to replay (default: synthetic, built from --corpus)")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="saved .html pages for the synthetic cassette")
+    parser.add_argument("--record", metavar="PATH", help="record a cassette from live services instead of replaying")
+    parser.add_argument("--topics", nargs="+", default=DEFAULT_TOPICS, help="topics to record or synthesize")
+    parser.add_argument("--target", choices=["pipeline", "route"], default="pipeline",
+                        help="call run_pipeline directly or go through POST /api/research")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4], help="concurrent clients per run")
+    parser.add_argument("--requests", type=int, default=8, help="requests per run")
+    parser.add_argument("--num-results", type=int, default=5)
+    parser.add_argument("--report-style", default="concise")
+    parser.add_argument("--same-topics", action="store_true",
+                        help="reuse the topics verbatim, so concurrent identical requests are coalesced")
+    parser.add_argument("--warm-caches", action="store_true", help="leave the search and Gemini caches on")
+    parser.add_argument("--search-latency", type=float, help="seconds per search call (default: recorded)")
+    parser.add_argument("--page-latency", type=float, help="seconds per page fetch (default: recorded)")
+    parser.add_argument("--llm-latency", type=float, help="seconds per Gemini call (default: recorded)")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="multiplier for recorded latencies")
+    parser.add_argument("--jitter", type=float, default=0.1, help="random +/- fraction applied to every delay")
+    parser.add_argument("--llm-words", type=int, default=250, help="length of synthesized Gemini responses")
+    parser.add_argument("--verbose", action="store_true", help="keep the pipeline's info logs")
+    args = parser.parse_args(argv)
+
+    configure_environment(bool(args.record), args.warm_caches)
+    if args.record:
+        asyncio.run(record(args))
+        return
+
+    cassette = Cassette.load(args.cassette) if args.cassette else synth_cassette(args.corpus, args.topics, args.num_results)
+    asyncio.run(replay(args, cassette))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Time AnalysisAgent table generation at 10, 100 and 1,000 sources.
+
+Compares the DataFrame-backed `_generate_tables` with the previous
+row-by-row implementation (Python loops, one joined string, re.findall +
+Counter) run over the same full page text. Sources are synthetic and
+deterministic.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_tables
+    python -m benchmarks.bench_tables --sizes 10 100 1000 --words 1500 --repeat 3
+"""
+import argparse
+import random
+import re
+import statistics
+import time
+from collections import Counter
+from unittest.mock import Mock
+from agents.analysis_agent import AnalysisAgent
+
+
+def make_sources(count: int, words: int, seed: int = 7):
+    """Synthetic research results with `words` words of fetched text each."""
+    rng = random.Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    vocabulary = ["w" + letters[i // 676] + letters[i // 26 % 26] + letters[i % 26] for i in range(2000)]
+    vocabulary += ["the", "and", "market", "growth", "with", "from"]
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]  # Zipf-like
+    sources = []
+    for i in range(count):
+        text = " ".join(rng.choices(vocabulary, weights, k=words))
+        sources.append({
+            "title": f"Source {i}",
+            "url": f"https://site{i % 40}.example.com/article/{i}",
+            "snippet": text[:150],
+            "domain": f"site{i % 40}.example.com",
+            "content_preview": text[:300],
+            "fetched_text": text,
+            "fetched_text_length": len(text) if i % 10 else 200,  # every tenth is a login wall
+        })
+    return sources
+
+
+def legacy_tables(research_results, meaningful_results):
+    """The previous loop-based implementation, reading full text instead of previews."""
+    tables = {}
+    overview_data = []
+    for result in research_results:
+        content_status = "Accessible" if result.get("fetched_text_length", 0) > 500 else "Limited/Behind Login"
+        overview_data.append({
+            "Title": result["title"],
+            "URL": result["url"],
+            "Content Length": result.get("fetched_text_length", 0),
+            "Content Status": content_status,
+            "Snippet": result["snippet"][:100] + "..." if len(result["snippet"]) > 100 else result["snippet"]
+        })
+    tables["research_overview"] = overview_data
+
+    all_text = " ".join([r["fetched_text"] for r in meaningful_results if r["fetched_text"]])
+    words = re.findall(r'\b[a-zA-Z]{3,}\b', all_text.lower())
+    tables["keyword_frequency"] = [{"Keyword": w, "Count": c} for w, c in Counter(words).most_common(10)]
+    tables["source_summaries"] = meaningful_results
+    return tables
+
+
+def median_ms(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="source counts to time")
+    parser.add_argument("--words", type=int, default=1500, help="words of fetched text per source")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per size and implementation")
+    args = parser.parse_args()
+
+    agent = AnalysisAgent(gemini_service=Mock())
+    print(f"{'sources':>8}{'text MB':>9}{'legacy ms':>11}{'pandas ms':>11}  tables (pandas)")
+    for size in args.sizes:
+        sources = make_sources(size, args.words)
+        meaningful = agent._meaningful_results(sources)
+        megabytes = sum(len(s["fetched_text"]) for s in sources) / 1e6
+
+        legacy_ms = median_ms(lambda: legacy_tables(sources, meaningful), args.repeat)
+        pandas_ms = median_ms(lambda: agent._generate_tables(sources, meaningful), args.repeat)
+        tables = ", ".join(agent._generate_tables(sources, meaningful))
+        print(f"{size:>8}{megabytes:>9.1f}{legacy_ms:>11.1f}{pandas_ms:>11.1f}  {tables}")
+
+
+if __name__ == "__main__":
+    main()
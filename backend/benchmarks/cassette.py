@@ -0,0 +1,311 @@
+"""
+Record and replay the pipeline's outside world: search API calls, web pages
+and Gemini responses.
+
+A cassette is one JSON file. Replaying it needs no network and no API keys:
+HTTP goes through `ReplayTransport` (installed as the shared async client's
+transport) and Gemini through `ReplayModel` (in place of the LangChain chat
+model), each sleeping for a configurable latency. See bench_pipeline.py.
+"""
+import asyncio
+import base64
+import glob
+import hashlib
+import itertools
+import json
+import os
+import random
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import httpx
+
+# Dates in prompts ("October 17, 2026") would make recordings expire daily
+_DATE = re.compile(r"\b(January|February|March|April|May|June|July|August|September|October|November|December) \d{1,2}, \d{4}\b")
+
+KEPT_HEADERS = ("content-type", "etag", "last-modified")
+
+
+def prompt_key(prompt: str) -> str:
+    return hashlib.sha256(_DATE.sub("<date>", prompt).encode("utf-8")).hexdigest()
+
+
+def request_key(method: str, url: str, body: bytes = b"") -> str:
+    try:
+        # JSON bodies match regardless of the client's separators and key order
+        body = json.dumps(json.loads(body), sort_keys=True).encode("utf-8") if body else body
+    except ValueError:
+        pass
+    digest = hashlib.sha256(body).hexdigest()[:16] if body else ""
+    return f"{method.upper()} {url} {digest}".strip()
+
+
+class Latency:
+    """
+    Replay delays, in seconds.
+
+    A fixed value applies to every call of that kind; None replays the
+    recorded duration multiplied by `scale`. `jitter` spreads each delay by
+    up to that fraction either way.
+    """
+
+    def __init__(self, search: Optional[float] = None, page: Optional[float] = None,
+                 llm: Optional[float] = None, scale: float = 1.0, jitter: float = 0.0, seed: int = 7):
+        self.search = search
+        self.page = page
+        self.llm = llm
+        self.scale = scale
+        self.jitter = jitter
+        self._random = random.Random(seed)
+
+    def delay(self, kind: str, recorded: float) -> float:
+        fixed = getattr(self, kind)
+        base = fixed if fixed is not None else recorded * self.scale
+        if self.jitter:
+            base *= 1 + self._random.uniform(-self.jitter, self.jitter)
+        return max(base, 0.0)
+
+
+class Cassette:
+    """Recorded HTTP exchanges and Gemini responses."""
+
+    def __init__(self, http: Optional[List[Dict[str, Any]]] = None, llm: Optional[List[Dict[str, Any]]] = None,
+                 topics: Optional[List[str]] = None):
+        self.http = http or []
+        self.llm = llm or []
+        self.topics = topics or []
+        self.misses = {"http": 0, "llm": 0}
+        # Latency of synthesized Gemini responses when nothing was recorded
+        self.default_llm_elapsed = 1.0
+        self._index()
+
+    @classmethod
+    def load(cls, path: str) -> "Cassette":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data.get("http"), data.get("llm"), data.get("topics"))
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "topics": self.topics, "http": self.http, "llm": self.llm}, f)
+
+    def add_http(self, method: str, url: str, body: bytes, status: int, headers: Dict[str, str],
+                 content: bytes, elapsed: float):
+        try:
+            text, encoding = content.decode("utf-8"), "utf-8"
+        except UnicodeDecodeError:
+            text, encoding = base64.b64encode(content).decode("ascii"), "base64"
+        self.http.append({
+            "key": request_key(method, url, body),
+            "method": method.upper(),
+            "url": url,
+            "status": status,
+            "headers": {k: v for k, v in headers.items() if k.lower() in KEPT_HEADERS},
+            "body": text,
+            "encoding": encoding,
+            "elapsed": elapsed
+        })
+        self._index()
+
+    def add_llm(self, prompt: str, response: str, elapsed: float):
+        self.llm.append({"key": prompt_key(prompt), "prompt_chars": len(prompt), "response": response, "elapsed": elapsed})
+        self._index()
+
+    def find_http(self, method: str, url: str, body: bytes = b"") -> Optional[Dict[str, Any]]:
+        entry = self._http.get(request_key(method, url, body))
+        if entry is None and method.upper() == "POST":
+            # An unrecorded query to a recorded API endpoint gets the recorded responses in turn
+            cycle = self._posts.get(url)
+            entry = next(cycle) if cycle is not None else None
+        if entry is None:
+            self.misses["http"] += 1
+        return entry
+
+    def find_llm(self, prompt: str) -> Optional[Dict[str, Any]]:
+        entry = self._llm.get(prompt_key(prompt))
+        if entry is None:
+            self.misses["llm"] += 1
+        return entry
+
+    def llm_elapsed(self) -> float:
+        """Median recorded Gemini latency, used for synthesized responses."""
+        samples = sorted(entry["elapsed"] for entry in self.llm) or [self.default_llm_elapsed]
+        return samples[len(samples) // 2]
+
+    def _index(self):
+        self._http = {entry["key"]: entry for entry in self.http}
+        self._llm = {entry["key"]: entry for entry in self.llm}
+        posts: Dict[str, List[Dict[str, Any]]] = {}
+        for entry in self.http:
+            if entry["method"] == "POST":
+                posts.setdefault(entry["url"], []).append(entry)
+        self._posts = {url: itertools.cycle(entries) for url, entries in posts.items()}
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """Answers HTTP requests from a cassette after the configured latency; unknown URLs get a 404."""
+
+    def __init__(self, cassette: Cassette, latency: Latency):
+        self.cassette = cassette
+        self.latency = latency
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        entry = self.cassette.find_http(request.method, str(request.url), body)
+        kind = "search" if request.method == "POST" else "page"
+        await asyncio.sleep(self.latency.delay(kind, entry["elapsed"] if entry else 0.1))
+        if entry is None:
+            return httpx.Response(404, request=request)
+        content = base64.b64decode(entry["body"]) if entry["encoding"] == "base64" else entry["body"].encode("utf-8")
+        return httpx.Response(entry["status"], headers=entry["headers"], content=content, request=request)
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """Passes requests to a real transport and records every exchange."""
+
+    def __init__(self, cassette: Cassette, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.cassette = cassette
+        self._transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        start = time.perf_counter()
+        response = await self._transport.handle_async_request(request)
+        content = await response.aread()
+        self.cassette.add_http(request.method, str(request.url), body, response.status_code,
+                               dict(response.headers), content, time.perf_counter() - start)
+        headers = {k: v for k, v in response.headers.items() if k.lower() not in ("content-encoding", "content-length")}
+        return httpx.Response(response.status_code, headers=headers, content=content, request=request)
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+class _Message:
+    def __init__(self, content: str):
+        self.content = content
+
+
+class ReplayModel:
+    """
+    Stands in for the LangChain chat model.
+
+    Recorded prompts get their recorded response. Unrecorded ones (e.g. a
+    cassette from an older prompt version) get a synthesized response of
+    the right shape, so the pipeline still runs end to end; the cassette
+    counts them as misses.
+    """
+
+    CHUNK_CHARS = 40
+
+    def __init__(self, cassette: Cassette, latency: Latency, words: int = 250):
+        self.cassette = cassette
+        self.latency = latency
+        self.words = words
+
+    def _respond(self, messages) -> Tuple[str, float]:
+        prompt = messages[0].content
+        entry = self.cassette.find_llm(prompt)
+        if entry is not None:
+            return entry["response"], self.latency.delay("llm", entry["elapsed"])
+        return synthesize_response(prompt, self.words), self.latency.delay("llm", self.cassette.llm_elapsed())
+
+    def invoke(self, messages):
+        response, delay = self._respond(messages)
+        time.sleep(delay)
+        return _Message(response)
+
+    async def ainvoke(self, messages):
+        response, delay = self._respond(messages)
+        await asyncio.sleep(delay)
+        return _Message(response)
+
+    async def astream(self, messages):
+        response, delay = self._respond(messages)
+        chunks = [response[i:i + self.CHUNK_CHARS] for i in range(0, len(response), self.CHUNK_CHARS)] or [""]
+        for chunk in chunks:
+            await asyncio.sleep(delay / len(chunks))
+            yield _Message(chunk)
+
+
+class RecordingModel:
+    """Wraps the real chat model and records each prompt and response."""
+
+    def __init__(self, cassette: Cassette, model):
+        self.cassette = cassette
+        self._model = model
+
+    def invoke(self, messages):
+        start = time.perf_counter()
+        response = self._model.invoke(messages)
+        self.cassette.add_llm(messages[0].content, response.content, time.perf_counter() - start)
+        return response
+
+    async def ainvoke(self, messages):
+        start = time.perf_counter()
+        response = await self._model.ainvoke(messages)
+        self.cassette.add_llm(messages[0].content, response.content, time.perf_counter() - start)
+        return response
+
+    async def astream(self, messages):
+        start = time.perf_counter()
+        parts = []
+        async for chunk in self._model.astream(messages):
+            parts.append(chunk.content or "")
+            yield chunk
+        self.cassette.add_llm(messages[0].content, "".join(parts), time.perf_counter() - start)
+
+
+_FILLER = (
+    "Market demand continues to grow as adoption widens across regions while suppliers expand "
+    "capacity and competition on price and features intensifies among established and new vendors"
+).split()
+
+
+def _words(count: int, seed: str) -> str:
+    rng = random.Random(seed)
+    return " ".join(rng.choice(_FILLER) for _ in range(count)).capitalize() + "."
+
+
+def synthesize_response(prompt: str, words: int = 250) -> str:
+    """A deterministic response shaped like what each pipeline prompt expects."""
+    if "reply with exactly UNCHANGED" in prompt:
+        return "UNCHANGED"
+    if "Generate a professional business report" in prompt or "Please review and improve this report" in prompt:
+        sections = ["Executive Summary", "Key Findings", "Data Tables", "Recommendations", "Sources"]
+        body = "\n\n".join(f"## {name}\n{_words(words // len(sections), prompt[:64] + name)}" for name in sections)
+        return f"# Research Report\n\n{body}\n"
+    return _words(words // 2, prompt[:256])
+
+
+def synth_cassette(corpus: str, topics: List[str], num_results: int = 5, search_elapsed: float = 0.4,
+                   page_elapsed: float = 0.3, llm_elapsed: float = 2.0) -> Cassette:
+    """
+    Build a cassette from saved HTML pages, for running without any recording.
+
+    Every topic's search returns the corpus pages (repeated to `num_results`)
+    under distinct URLs; Gemini responses are synthesized at replay time with
+    `llm_elapsed` as their latency.
+    """
+    paths = sorted(glob.glob(os.path.join(corpus, "*.html")))
+    if not paths:
+        raise ValueError(f"No .html files found in {corpus}")
+
+    cassette = Cassette(topics=list(topics))
+    for topic in topics:
+        organic = []
+        for i in range(num_results):
+            path = paths[i % len(paths)]
+            name = os.path.splitext(os.path.basename(path))[0]
+            url = f"https://site{i}.example.com/{name}"
+            organic.append({"title": f"{name.replace('_', ' ').title()} ({i})", "link": url,
+                            "snippet": f"{topic}: {name.replace('_', ' ')}", "source": f"site{i}.example.com"})
+            with open(path, "rb") as f:
+                cassette.add_http("GET", url, b"", 200, {"Content-Type": "text/html; charset=utf-8"}, f.read(), page_elapsed)
+        body = json.dumps({"q": topic, "num": num_results}).encode("utf-8")
+        cassette.add_http("POST", "https://google.serper.dev/search", body, 200,
+                          {"Content-Type": "application/json"}, json.dumps({"organic": organic}).encode("utf-8"),
+                          search_elapsed)
+    cassette.default_llm_elapsed = llm_elapsed
+    return cassette
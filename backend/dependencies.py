@@ -0,0 +1,86 @@
+import threading
+from typing import Optional
+from fastapi import HTTPException, Request
+from services.gemini_service import GeminiService
+from services.search_provider import SearchProviderFactory
+from services.fetcher import ContentFetcher
+from services.http_client import close_http_clients
+from services.job_manager import JobManager
+from services.metrics import register_cache
+from services.search_cache import CachedSearchService
+from agents.research_agent import ResearchAgent
+from agents.analysis_agent import AnalysisAgent
+from agents.writer_agent import WriterAgent
+from agents.reviewer_agent import ReviewerAgent
+
+
+class AgentContainer:
+    """
+    Process-wide services and agents, created once and shared by every request.
+
+    The services hold no per-request state, so a single instance of each is
+    safe to use from concurrent requests and worker threads.
+    """
+
+    def __init__(self):
+        self.gemini_service = GeminiService()
+        self.search_service = SearchProviderFactory.get_service()
+        self.fetcher = ContentFetcher()
+
+        self.research_agent = ResearchAgent(search_service=self.search_service, fetcher=self.fetcher)
+        self.analysis_agent = AnalysisAgent(gemini_service=self.gemini_service)
+        self.writer_agent = WriterAgent(gemini_service=self.gemini_service)
+        self.reviewer_agent = ReviewerAgent(gemini_service=self.gemini_service)
+
+        # Cache hit rates on /metrics
+        register_cache("gemini", self.gemini_service.cache)
+        register_cache("page", self.fetcher.page_cache)
+        if isinstance(self.search_service, CachedSearchService):
+            register_cache("search", self.search_service)
+
+    async def aclose(self):
+        """Release resources held by the shared services."""
+        await close_http_clients()
+
+
+_container: Optional[AgentContainer] = None
+_container_lock = threading.Lock()
+
+
+def create_container() -> AgentContainer:
+    """Return the process-wide container, creating it on first use."""
+    global _container
+    with _container_lock:
+        if _container is None:
+            _container = AgentContainer()
+        return _container
+
+
+async def close_container():
+    """Close the process-wide container, if one was created."""
+    global _container
+    with _container_lock:
+        container, _container = _container, None
+    if container is not None:
+        await container.aclose()
+
+
+def get_agents(request: Request) -> AgentContainer:
+    """FastAPI dependency returning the shared agents set up at startup."""
+    container = getattr(request.app.state, "agents", None)
+    if container is None:
+        # Startup hook did not run or failed (e.g. missing API keys)
+        try:
+            container = create_container()
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Research process failed: {str(e)}")
+        request.app.state.agents = container
+    return container
+
+
+def get_job_manager(request: Request) -> JobManager:
+    """FastAPI dependency returning the background job manager started at startup."""
+    jobs = getattr(request.app.state, "jobs", None)
+    if jobs is None:
+        raise HTTPException(status_code=503, detail="Job queue is not running")
+    return jobs
@@ -1,44 +1,165 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import random
 import time
-from datetime import datetime
-from typing import Any, Dict
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler("app.log"),
-        logging.StreamHandler()
-    ]
-)
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+from services.metrics import AGENT_SECONDS
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Attributes every LogRecord has; anything else was passed through `extra=`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, message, any `extra=` fields and exc."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and key not in entry:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class DebugSampler(logging.Filter):
+    """Lets through only `rate` (0-1) of DEBUG records; other levels always pass."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Queues a copy of each record with its message and traceback rendered, so the listener can format it."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The stock prepare() folds the traceback into the message, which would hide it from JsonFormatter
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _file_handler(path: str) -> logging.Handler:
+    backups = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+    if os.getenv("LOG_ROTATION", "size").lower() == "time":
+        return logging.handlers.TimedRotatingFileHandler(
+            path, when=os.getenv("LOG_ROTATE_WHEN", "midnight"), backupCount=backups, encoding="utf-8"
+        )
+    return logging.handlers.RotatingFileHandler(
+        path, maxBytes=int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024))), backupCount=backups, encoding="utf-8"
+    )
+
+
+def configure_logging(force: bool = False):
+    """
+    Send all logging through a queue to a background listener thread.
+
+    Callers only put records on an in-memory queue; formatting and the
+    console and file writes happen on the listener thread. Configured from
+    the environment: LOG_LEVEL, LOG_FORMAT (text or json), LOG_FILE (empty
+    disables the file), LOG_ROTATION (size or time), LOG_MAX_BYTES,
+    LOG_ROTATE_WHEN, LOG_BACKUP_COUNT and LOG_DEBUG_SAMPLE_RATE.
+
+    Args:
+        force: Replace an existing configuration (e.g. after changing the environment)
+    """
+    global _listener
+    if _listener is not None:
+        if not force:
+            return
+        stop_logging()
+
+    level = getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper(), logging.INFO)
+    if os.getenv("LOG_FORMAT", "text").lower() == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(TEXT_FORMAT)
+
+    handlers = [logging.StreamHandler()]
+    log_file = os.getenv("LOG_FILE", "app.log")
+    if log_file:
+        handlers.append(_file_handler(log_file))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    sample_rate = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0"))
+    if sample_rate < 1.0:
+        queue_handler.addFilter(DebugSampler(sample_rate))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging():
+    """Flush queued records and stop the listener thread (registered with atexit)."""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+
+
+configure_logging()
+atexit.register(stop_logging)
 
 logger = logging.getLogger(__name__)
 
 def log_agent_start(agent_name: str, params: Dict[str, Any] = None):
-    """Log the start of an agent execution."""
-    timestamp = datetime.now().isoformat()
-    logger.info(f"[{timestamp}] Agent '{agent_name}' started with params: {params}")
-    return timestamp
+    """Log the start of an agent execution; returns the monotonic start time for `log_agent_end`."""
+    logger.info("Agent '%s' started with params: %s", agent_name, params)
+    return time.perf_counter()
 
-def log_agent_end(agent_name: str, start_time: str, output: Any = None):
-    """Log the end of an agent execution."""
+def log_agent_end(agent_name: str, start_time: float, output: Any = None):
+    """Log the end of an agent execution and record its duration in the agent histogram."""
     end_time = datetime.now().isoformat()
-    start_dt = datetime.fromisoformat(start_time)
-    end_dt = datetime.fromisoformat(end_time)
-    duration = (end_dt - start_dt).total_seconds()
-    
+    duration = time.perf_counter() - start_time
+    AGENT_SECONDS.observe(duration, agent=agent_name)
+
     output_size = 0
-    if output is not None:
+    # str() of a large result is only worth building when it is logged
+    if output is not None and logger.isEnabledFor(logging.INFO):
         if isinstance(output, str):
             output_size = len(output)
         elif isinstance(output, (list, dict)):
             output_size = len(str(output))
-    
-    logger.info(f"[{end_time}] Agent '{agent_name}' completed in {duration:.2f}s with output size: {output_size}")
+
+    logger.info("Agent '%s' completed in %.2fs with output size: %d", agent_name, duration, output_size)
     return end_time, duration, output_size
 
 def log_error(agent_name: str, error: Exception):
     """Log an error that occurred during agent execution."""
-    timestamp = datetime.now().isoformat()
-    logger.error(f"[{timestamp}] Error in agent '{agent_name}': {str(error)}")
\ No newline at end of file
+    logger.error("Error in agent '%s': %s", agent_name, error)
@@ -1,22 +1,48 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 import os
 from dotenv import load_dotenv
-from routes.research_route import router as research_router
+from dependencies import create_container, close_container
+from logger import logger
+from routes.research_route import router as research_router, run_research_job
+from services.job_manager import JobManager
+from services.job_store import create_job_store
+from services.metrics import REGISTRY
 
 # --- Load environment variables from .env ---
 load_dotenv()
 
 # Debugging: log important env vars (mask sensitive ones if needed)
-print("DEBUG: GEMINI_API_KEY exists?", bool(os.getenv("GEMINI_API_KEY")))
-print("DEBUG: SERPAPI_API_KEY exists?", bool(os.getenv("SERPAPI_API_KEY")))
-print("DEBUG: BASE_URL =", os.getenv("BASE_URL"))
-print("DEBUG: FRONTEND_URL =", os.getenv("FRONTEND_URL"))
+logger.debug("GEMINI_API_KEY exists? %s", bool(os.getenv("GEMINI_API_KEY")))
+logger.debug("SERPAPI_API_KEY exists? %s", bool(os.getenv("SERPAPI_API_KEY")))
+logger.debug("BASE_URL = %s", os.getenv("BASE_URL"))
+logger.debug("FRONTEND_URL = %s", os.getenv("FRONTEND_URL"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the shared services and agents once for the whole process
+    try:
+        app.state.agents = create_container()
+    except ValueError as e:
+        # Keep serving /health; research requests will report the problem
+        logger.warning("Agents not initialized at startup: %s", e)
+        app.state.agents = None
+
+    # Background research jobs (JOB_WORKERS workers, JOB_STORE_PATH for persistence)
+    app.state.jobs = JobManager(create_job_store(), run_research_job)
+    await app.state.jobs.start()
+    yield
+    await app.state.jobs.stop()
+    app.state.jobs.store.close()
+    await close_container()
 
 app = FastAPI(
     title="Product Research & Report Generator API",
     description="API for researching topics and generating business reports",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -42,3 +68,8 @@ def read_root():
 @app.get("/health")
 def health_check():
     return {"status": "healthy"}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus text exposition of request, stage, fetch, Gemini and cache metrics."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
@@ -1,16 +1,19 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from schemas.request import ResearchRequest
-from schemas.response import ResearchResponse
-from agents.research_agent import ResearchAgent
-from agents.analysis_agent import AnalysisAgent
-from agents.writer_agent import WriterAgent
-from agents.reviewer_agent import ReviewerAgent
-import time, traceback
+from schemas.response import JobStatus, ResearchResponse
+from dependencies import AgentContainer, create_container, get_agents, get_job_manager
+from logger import logger
+from services.job_manager import JobManager, JobQueueFull
+from services.research_pipeline import ProgressCallback, run_coalesced, run_pipeline
+from typing import Any, Dict
+import asyncio, json
 
 router = APIRouter()
 
 @router.post("/research", response_model=ResearchResponse)
-async def research_topic(request: ResearchRequest):
+async def research_topic(request: ResearchRequest, agents: AgentContainer = Depends(get_agents)):
     """
     Research a topic and generate a comprehensive report.
     
@@ -20,75 +23,114 @@ async def research_topic(request: ResearchRequest):
     Returns:
         Research response with all agent outputs
     """
-    start_time = time.time()
-    agent_logs = {}
-
-    print("📌 Incoming request payload:", request.dict())
-
     try:
-        # Initialize agents
-        print("🔹 Initializing agents...")
-        research_agent = ResearchAgent()
-        analysis_agent = AnalysisAgent()
-        writer_agent = WriterAgent()
-        reviewer_agent = ReviewerAgent()
-        print("✅ Agents initialized")
-
-        # Step 1: Research
-        print("🔍 Running ResearchAgent...")
-        research_results = research_agent.research(request.topic, request.num_results)
-        print(f"✅ Research completed. Results found: {len(research_results)}")
-        agent_logs["research"] = {
-            "status": "completed",
-            "results_count": len(research_results)
-        }
-
-        # Step 2: Analysis
-        print("📊 Running AnalysisAgent...")
-        analysis_output = analysis_agent.analyze(research_results)
-        print("✅ Analysis completed")
-        agent_logs["analysis"] = {
-            "status": "completed",
-            "summary_length": len(analysis_output.get("analysis_summary", "")),
-            "tables_count": len(analysis_output.get("analysis_tables", []))
-        }
-
-        # Step 3: Writing
-        print("📝 Running WriterAgent...")
-        draft_report = writer_agent.write_report(analysis_output, request.report_style)
-        print(f"✅ Draft report generated. Length: {len(draft_report)} characters")
-        agent_logs["writer"] = {
-            "status": "completed",
-            "draft_length": len(draft_report)
-        }
-
-        # Step 4: Review
-        print("🔎 Running ReviewerAgent...")
-        review_output = reviewer_agent.review_report(draft_report)
-        print("✅ Review completed")
-        agent_logs["reviewer"] = {
-            "status": "completed",
-            "final_report_length": len(review_output.get("final_report", "")),
-            "review_notes_length": len(review_output.get("review_notes", ""))
-        }
-
-        # Calculate total processing time
-        processing_time = time.time() - start_time
-        print(f"⏱️ Total processing time: {processing_time:.2f} seconds")
-
-        # Return the complete response
-        return ResearchResponse(
-            research_results=research_results,
-            analysis_summary=analysis_output["analysis_summary"],
-            analysis_tables=analysis_output["analysis_tables"],
-            draft_report=draft_report,
-            final_report=review_output["final_report"],
-            review_notes=review_output["review_notes"],
-            processing_time=processing_time,
-            agent_logs=agent_logs
-        )
+        return await run_coalesced(request, agents)
 
     except Exception as e:
-        print("❌ ERROR in /research route:", str(e))
-        traceback.print_exc()
+        logger.exception("Error in /research route: %s", e)
         raise HTTPException(status_code=500, detail=f"Research process failed: {str(e)}")
+
+
+@router.post("/research/stream")
+async def research_topic_stream(request: ResearchRequest, agents: AgentContainer = Depends(get_agents)):
+    """
+    Streaming variant of `/research` as Server-Sent Events.
+    
+    Events, in order: `search` (search results), `source` (one per fetched
+    page, as it lands), `research`, `tables` (as soon as they are built,
+    while the summaries are still being written), `analysis` (summary and tables),
+    `draft_token` / `draft`, `review_token` and finally `complete` with the
+    same body `/research` returns. A failure ends the stream with `error`.
+    
+    Args:
+        request: Research request with topic, number of results, and report style
+        
+    Returns:
+        text/event-stream response
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    def emit(event: str, data: Dict[str, Any]):
+        queue.put_nowait((event, data))
+
+    async def run():
+        try:
+            response = await run_pipeline(request, agents, emit)
+            emit("complete", jsonable_encoder(response))
+        except Exception as e:
+            logger.exception("Error in /research/stream route: %s", e)
+            emit("error", {"detail": f"Research process failed: {str(e)}"})
+        finally:
+            queue.put_nowait(None)
+
+    async def events():
+        task = asyncio.create_task(run())
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                yield _format_event(*item)
+        finally:
+            # Client went away: stop the pipeline instead of finishing it for nobody
+            task.cancel()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.post("/research/jobs", response_model=JobStatus, status_code=202)
+async def submit_research_job(request: ResearchRequest, jobs: JobManager = Depends(get_job_manager)):
+    """
+    Queue a research job and return immediately.
+    
+    Args:
+        request: Research request with topic, number of results, and report style
+        
+    Returns:
+        The queued job; poll `/research/jobs/{job_id}` for progress
+    """
+    try:
+        job = jobs.submit(request.model_dump())
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return JobStatus(**job)
+
+
+@router.get("/research/jobs/{job_id}", response_model=JobStatus)
+async def get_research_job(job_id: str, jobs: JobManager = Depends(get_job_manager)):
+    """
+    Job status with per-agent stage progress (`agent_logs`).
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return JobStatus(**job)
+
+
+@router.get("/research/jobs/{job_id}/result", response_model=ResearchResponse)
+async def get_research_job_result(job_id: str, jobs: JobManager = Depends(get_job_manager)):
+    """
+    Result of a completed job, in the same shape `/research` returns.
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    if job["status"] == "failed":
+        raise HTTPException(status_code=409, detail=f"Research process failed: {job['error']}")
+    if job["status"] != "completed":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    return job["result"]
+
+
+async def run_research_job(request: Dict[str, Any], on_progress: ProgressCallback) -> Dict[str, Any]:
+    """Job runner for the background worker pool."""
+    response = await run_coalesced(ResearchRequest(**request), create_container(), on_progress=on_progress)
+    return jsonable_encoder(response)
+
+
+def _format_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -1,6 +1,8 @@
+from typing import Optional
 from pydantic import BaseModel, Field
 
 class ResearchRequest(BaseModel):
     topic: str = Field(..., description="Research topic to investigate")
     num_results: int = Field(5, ge=1, le=10, description="Number of search results to fetch")
-    report_style: str = Field("concise", description="Style of the report (concise, detailed, academic)")
\ No newline at end of file
+    report_style: str = Field("concise", description="Style of the report (concise, detailed, academic)")
+    deadline_seconds: Optional[float] = Field(None, gt=0, le=600, description="Time budget for the whole request; sources not fetched or summarized in time are dropped (default: RESEARCH_DEADLINE_SECONDS)")
\ No newline at end of file
@@ -8,6 +8,11 @@ class SearchResult(BaseModel):
     content_preview: Optional[str] = None
     fetched_text_length: Optional[int] = None
 
+class DroppedSource(BaseModel):
+    url: str
+    title: str = ""
+    stage: str  # "fetch" or "summaries": where the request deadline cut it off
+
 class ResearchResponse(BaseModel):
     research_results: List[SearchResult]
     analysis_summary: str
@@ -16,4 +21,14 @@ class ResearchResponse(BaseModel):
     final_report: str
     review_notes: str
     processing_time: Optional[float] = None
-    agent_logs: Optional[Dict[str, Dict[str, Any]]] = None
\ No newline at end of file
+    agent_logs: Optional[Dict[str, Dict[str, Any]]] = None
+    dropped_sources: List[DroppedSource] = []
+
+class JobStatus(BaseModel):
+    job_id: str
+    status: str
+    agent_logs: Dict[str, Dict[str, Any]] = {}
+    error: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
\ No newline at end of file
@@ -0,0 +1,94 @@
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Dict, Iterator, List, Optional
+
+
+class DeadlineExceeded(Exception):
+    """The request's time budget ran out; callers fall back to partial results instead of failing."""
+
+
+class Deadline:
+    """
+    Time budget of one research request, on the monotonic clock.
+
+    `until(fraction)` gives a stage its own earlier deadline within the same
+    budget (e.g. fetching may use the first 35%); all of them share one
+    `dropped` list of sources abandoned for lack of time.
+    """
+
+    def __init__(self, seconds: float, _parent: Optional["Deadline"] = None, _expires_at: Optional[float] = None):
+        self.seconds = seconds
+        self.started = _parent.started if _parent is not None else time.monotonic()
+        self.expires_at = _expires_at if _expires_at is not None else self.started + seconds
+        self.dropped: List[Dict[str, str]] = _parent.dropped if _parent is not None else []
+        self._lock = _parent._lock if _parent is not None else threading.Lock()
+
+    def until(self, fraction: float) -> "Deadline":
+        """A deadline at `fraction` of the whole budget, never later than this one."""
+        return Deadline(self.seconds, self, min(self.expires_at, self.started + self.seconds * fraction))
+
+    def remaining(self) -> float:
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def check(self):
+        if self.expired():
+            raise DeadlineExceeded(f"Request deadline of {self.seconds:g}s reached")
+
+    async def wait_for(self, awaitable: Awaitable[Any]) -> Any:
+        """Await `awaitable`, cancelling it with DeadlineExceeded once the deadline passes."""
+        if self.expired():
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            self.check()
+        try:
+            return await asyncio.wait_for(awaitable, self.remaining())
+        except asyncio.TimeoutError:
+            # A timeout of the call's own (e.g. a read timeout) is not ours to rename
+            if not self.expired():
+                raise
+            raise DeadlineExceeded(f"Request deadline of {self.seconds:g}s reached") from None
+
+    def drop(self, url: str, title: str, stage: str):
+        """Record a source left out because the deadline passed."""
+        with self._lock:
+            if not any(entry["url"] == url and entry["stage"] == stage for entry in self.dropped):
+                self.dropped.append({"url": url, "title": title, "stage": stage})
+
+
+_current_deadline: ContextVar[Optional[Deadline]] = ContextVar("request_deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    """The deadline of the request being handled in this context, if it has one."""
+    return _current_deadline.get()
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[Deadline]) -> Iterator[Optional[Deadline]]:
+    """Apply `deadline` to every fetch and Gemini call made in this context (tasks included)."""
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+async def within_deadline(awaitable: Awaitable[Any]) -> Any:
+    """Await `awaitable` under the current deadline, if any."""
+    deadline = current_deadline()
+    if deadline is None:
+        return await awaitable
+    return await deadline.wait_for(awaitable)
+
+
+def record_drop(url: str, title: str, stage: str):
+    """Record a source dropped for the deadline on the current request (no-op without one)."""
+    deadline = current_deadline()
+    if deadline is not None:
+        deadline.drop(url, title, stage)
@@ -0,0 +1,256 @@
+import codecs
+import os
+import re
+from typing import List, Optional
+from bs4 import BeautifulSoup
+from logger import logger
+
+try:
+    from lxml import etree
+except ImportError:  # pragma: no cover - lxml is in requirements.txt
+    etree = None
+
+# Elements whose whole subtree is dropped before extracting text
+SKIP_TAGS = frozenset(["script", "style", "header", "footer", "nav", "aside"])
+# Elements carrying any of these classes are dropped as well
+SKIP_CLASSES = frozenset(["navigation", "menu", "sidebar", "comments", "related"])
+
+
+_META_CHARSET = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([a-zA-Z0-9_\-]+)', re.IGNORECASE)
+
+
+def sniff_encoding(content_type: Optional[str], head: bytes) -> str:
+    """
+    Pick the character encoding for a streamed page.
+
+    Uses the Content-Type charset, then a <meta charset> declaration in the
+    first bytes, then UTF-8.
+    """
+    for candidate in (_header_charset(content_type), _meta_charset(head)):
+        if candidate:
+            try:
+                return codecs.lookup(candidate).name
+            except LookupError:
+                continue
+    return "utf-8"
+
+
+def _header_charset(content_type: Optional[str]) -> Optional[str]:
+    for param in (content_type or "").split(";")[1:]:
+        key, _, value = param.partition("=")
+        if key.strip().lower() == "charset":
+            return value.strip().strip('"\'')
+    return None
+
+
+def _meta_charset(head: bytes) -> Optional[str]:
+    match = _META_CHARSET.search(head[:4096])
+    return match.group(1).decode("ascii") if match else None
+
+
+def clean_text(text: str) -> str:
+    """Collapse extracted text into single-space separated phrases."""
+    lines = (line.strip() for line in text.splitlines())
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    return ' '.join(chunk for chunk in chunks if chunk)
+
+
+class BeautifulSoupExtractor:
+    """Reference extractor: BeautifulSoup's pure-Python parser plus tree pruning."""
+
+    name = "bs4"
+
+    def extract(self, html: str) -> str:
+        soup = BeautifulSoup(html, 'html.parser')
+
+        # Remove script and style elements
+        for script in soup(["script", "style"]):
+            script.extract()
+
+        # Remove common non-content elements
+        for element in soup(["header", "footer", "nav", "aside"]):
+            element.extract()
+
+        # Remove elements with common non-content classes
+        for element in soup.find_all(class_=["navigation", "menu", "sidebar", "comments", "related"]):
+            element.extract()
+
+        return clean_text(soup.get_text())
+
+    def stream(self, encoding: str = "utf-8") -> "_BufferedStream":
+        return _BufferedStream(self, encoding)
+
+
+class _BufferedStream:
+    """
+    Streaming adapter for extractors that need the whole document.
+
+    Bytes are only buffered (the fetcher caps how many) and parsed on close.
+    """
+
+    def __init__(self, extractor, encoding: str):
+        self._extractor = extractor
+        self._encoding = encoding
+        self._chunks: List[bytes] = []
+        self.text_length = 0  # unknown until close
+
+    def feed(self, chunk: bytes):
+        self._chunks.append(chunk)
+
+    def close(self) -> str:
+        html = b"".join(self._chunks).decode(self._encoding, errors="replace")
+        self._chunks = []
+        return self._extractor.extract(html)
+
+
+class _TextCollector:
+    """
+    lxml parser target that prunes and collects text in a single pass.
+
+    No tree is built: each start tag decides whether its subtree is skipped
+    and text is only kept outside skipped subtrees.
+    """
+
+    def __init__(self):
+        self.parts: List[str] = []
+        self.length = 0
+        self._skipping: List[bool] = []
+
+    def start(self, tag, attrib):
+        skip = bool(self._skipping and self._skipping[-1])
+        if not skip:
+            if isinstance(tag, str) and tag.lower() in SKIP_TAGS:
+                skip = True
+            else:
+                classes = attrib.get("class")
+                skip = bool(classes) and not SKIP_CLASSES.isdisjoint(classes.split())
+        self._skipping.append(skip)
+
+    def end(self, tag):
+        if self._skipping:
+            self._skipping.pop()
+
+    def data(self, data):
+        if not (self._skipping and self._skipping[-1]):
+            self.parts.append(data)
+            self.length += len(data)
+
+    def close(self):
+        return "".join(self.parts)
+
+
+class LxmlExtractor:
+    """Fast extractor: libxml2's HTML parser driving a single-pass pruning target."""
+
+    name = "lxml"
+
+    def extract(self, html: str) -> str:
+        collector = _TextCollector()
+        parser = etree.HTMLParser(target=collector, remove_comments=True, remove_pis=True)
+        parser.feed(html)
+        return clean_text(parser.close())
+
+    def stream(self, encoding: str = "utf-8") -> "_LxmlStream":
+        return _LxmlStream(encoding)
+
+
+class _LxmlStream:
+    """
+    Incremental lxml extraction: chunks are parsed as they arrive.
+
+    `text_length` grows as text is found, so the caller can stop reading the
+    body once it has enough.
+    """
+
+    def __init__(self, encoding: str):
+        self._collector = _TextCollector()
+        self._parser = etree.HTMLParser(
+            target=self._collector, encoding=encoding, remove_comments=True, remove_pis=True
+        )
+
+    @property
+    def text_length(self) -> int:
+        return self._collector.length
+
+    def feed(self, chunk: bytes):
+        self._parser.feed(chunk)
+
+    def close(self) -> str:
+        return clean_text(self._parser.close())
+
+
+class FallbackExtractor:
+    """Uses the primary extractor and falls back to another one if it raises."""
+
+    def __init__(self, primary, fallback):
+        self.primary = primary
+        self.fallback = fallback
+        self.name = primary.name
+
+    def extract(self, html: str) -> str:
+        try:
+            return self.primary.extract(html)
+        except Exception as e:
+            logger.warning("%s extractor failed, falling back to %s: %s", self.primary.name, self.fallback.name, e)
+            return self.fallback.extract(html)
+
+    def stream(self, encoding: str = "utf-8") -> "_FallbackStream":
+        return _FallbackStream(self, encoding)
+
+
+class _FallbackStream:
+    """Streams through the primary extractor, replaying the received bytes into the fallback if it fails."""
+
+    def __init__(self, extractor: FallbackExtractor, encoding: str):
+        self._extractor = extractor
+        self._encoding = encoding
+        self._primary = extractor.primary.stream(encoding)
+        self._chunks: List[bytes] = []
+        self._failed = False
+
+    @property
+    def text_length(self) -> int:
+        return 0 if self._failed else self._primary.text_length
+
+    def feed(self, chunk: bytes):
+        self._chunks.append(chunk)
+        if not self._failed:
+            try:
+                self._primary.feed(chunk)
+            except Exception as e:
+                self._fail(e)
+
+    def close(self) -> str:
+        if not self._failed:
+            try:
+                return self._primary.close()
+            except Exception as e:
+                self._fail(e)
+        fallback = self._extractor.fallback.stream(self._encoding)
+        for chunk in self._chunks:
+            fallback.feed(chunk)
+        return fallback.close()
+
+    def _fail(self, error: Exception):
+        self._failed = True
+        logger.warning(
+            f"{self._extractor.primary.name} extractor failed, falling back to {self._extractor.fallback.name}: {error}"
+        )
+
+
+def get_extractor(name: Optional[str] = None):
+    """
+    Return the HTML extractor selected by `name` or HTML_EXTRACTOR.
+
+    "lxml" (the default) is backed by BeautifulSoup when lxml is missing or
+    fails on a page; "bs4" uses BeautifulSoup only.
+    """
+    name = (name or os.getenv("HTML_EXTRACTOR", "lxml")).lower()
+    if name == "bs4":
+        return BeautifulSoupExtractor()
+    if name == "lxml":
+        if etree is None:
+            logger.warning("lxml is not installed; using the BeautifulSoup extractor")
+            return BeautifulSoupExtractor()
+        return FallbackExtractor(LxmlExtractor(), BeautifulSoupExtractor())
+    raise ValueError(f"Unsupported HTML_EXTRACTOR: {name}")
@@ -1,15 +1,76 @@
-import requests
-from bs4 import BeautifulSoup
+import asyncio
+import os
 from typing import Dict, Optional
 import time
 import random
+from services.http_client import config as http_config, get_async_client, get_session
+from services.extractors import get_extractor, sniff_encoding
+from services.metrics import observe_fetch
+from services.page_cache import CachedPage, PageCache
+from services.page_classifier import LOGIN_PREVIEW, USEFUL_MIN_CHARS, PageClassifier, PageRejected
+from services.politeness import PolitenessScheduler
+from services.rate_limiter import status_code
+from services.singleflight import AsyncSingleFlight, SingleFlight
+
+# Content types worth parsing; anything else (PDF, images, archives) is rejected from the headers
+HTML_CONTENT_TYPES = frozenset(["text/html", "application/xhtml+xml", "text/plain"])
+CHUNK_SIZE = 64 * 1024
+# HTTP errors that say the site will not serve us, counted against the domain
+UNUSABLE_STATUSES = frozenset([401, 402, 403, 451])
+
+
+class _Body:
+    """
+    Reads a response body within the fetch budgets.
+
+    The first `prefix_bytes` are held back and shown to the classifier
+    before the extractor sees any of them, so a rejected page is never
+    parsed; after that, chunks stream straight into the extractor.
+    """
+
+    def __init__(self, fetcher: "ContentFetcher", content_type: Optional[str]):
+        self.fetcher = fetcher
+        self.content_type = content_type
+        self.head = b""
+        self.stream = None
+        self.received = 0
+
+    def feed(self, chunk: bytes) -> bool:
+        """Take a chunk; returns True once a budget is used up and reading should stop."""
+        fetcher = self.fetcher
+        chunk = chunk[:fetcher.max_bytes - self.received]
+        self.received += len(chunk)
+        if self.stream is not None:
+            self.stream.feed(chunk)
+        else:
+            self.head += chunk
+            if len(self.head) < min(fetcher.classifier.prefix_bytes, fetcher.max_bytes):
+                return False
+            self._start()
+        return self.received >= fetcher.max_bytes or self.stream.text_length >= fetcher.max_text_chars
+
+    def close(self) -> str:
+        """Finish the parse and return the page text (a short body is classified here)."""
+        if self.stream is None:
+            if not self.head:
+                return ""
+            self._start()
+        return self.stream.close()
+
+    def _start(self):
+        encoding = sniff_encoding(self.content_type, self.head)
+        self.fetcher.classifier.check_prefix(self.head.decode(encoding, errors="replace"))
+        self.stream = self.fetcher.extractor.stream(encoding)
+        self.stream.feed(self.head)
+
 
 class ContentFetcher:
-    def __init__(self):
+    def __init__(self, page_cache: Optional[PageCache] = None, extractor=None,
+                 politeness: Optional[PolitenessScheduler] = None, classifier: Optional[PageClassifier] = None):
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
         }
-        self.timeout = 10  # seconds
+        self.timeout = http_config.timeout  # (connect, read) seconds
         
         # Add a list of user agents to rotate through
         self.user_agents = [
@@ -17,6 +78,26 @@ class ContentFetcher:
             "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
             "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0"
         ]
+        
+        # HTML-to-text engine (HTML_EXTRACTOR: lxml with BeautifulSoup fallback, or bs4)
+        self.extractor = extractor or get_extractor()
+        
+        # Optional persistent page cache (PAGE_CACHE_PATH)
+        self.page_cache = page_cache or PageCache.from_env()
+        
+        # Per-host spacing and concurrency, shared by every request using this fetcher
+        self.politeness = politeness or PolitenessScheduler.from_env()
+        
+        # Early rejection of login walls, paywalls and domains learned to be useless
+        self.classifier = classifier or PageClassifier.from_env()
+        
+        # Per-fetch budgets: bytes read from the body, and characters of text kept
+        self.max_bytes = int(os.getenv("FETCH_MAX_BYTES", str(2 * 1024 * 1024)))
+        self.max_text_chars = int(os.getenv("FETCH_MAX_TEXT_CHARS", "50000"))
+        
+        # Concurrent fetches of the same URL share one download
+        self._flight = SingleFlight()
+        self._aflight = AsyncSingleFlight()
     
     def fetch_content(self, url: str) -> Dict[str, str]:
         """
@@ -28,88 +109,196 @@ class ContentFetcher:
         Returns:
             Dictionary with content preview and full text
         """
+        return self._flight.do(url, lambda: self._fetch_content(url))
+    
+    def _fetch_content(self, url: str) -> Dict[str, str]:
+        start = time.perf_counter()
+        outcome = "error"
+        body = None
         try:
-            # Rotate user agents
-            headers = self.headers.copy()
-            headers["User-Agent"] = random.choice(self.user_agents)
-            
-            # Add a small delay to avoid rate limiting
-            time.sleep(random.uniform(0.5, 1.5))
-            
-            response = requests.get(url, headers=headers, timeout=self.timeout)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
+            cached = self._cached_page(url)
+            if cached is not None and cached.is_fresh(self.page_cache.freshness):
+                self.page_cache.hits += 1
+                outcome = "cached"
+                return cached.result
+            self.classifier.check_url(url)
             
-            # Remove script and style elements
-            for script in soup(["script", "style"]):
-                script.extract()
+            # Spaced out per host (FETCH_DOMAIN_MIN_INTERVAL); other hosts are not delayed
+            with self.politeness.slot(url):
+                # Stream the body so large pages are never held in memory whole
+                with get_session().get(url, headers=self._request_headers(cached), timeout=self.timeout, stream=True) as response:
+                    if response.status_code == 304 and cached is not None:
+                        outcome = "revalidated"
+                        return self._revalidated(url, cached)
+                    response.raise_for_status()
+                    self._check_content_type(response.headers)
+                    self.classifier.check_response(str(response.url))
+                    
+                    body = _Body(self, response.headers.get("Content-Type"))
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        if body.feed(chunk):
+                            break
             
-            # Remove common non-content elements
-            for element in soup(["header", "footer", "nav", "aside"]):
-                element.extract()
+            result = self._build_result(body.close())
+            self._store_page(url, response.headers, result)
+            self._record(url, result)
+            outcome = "ok"
+            return result
             
-            # Remove elements with common non-content classes
-            for element in soup.find_all(class_=["navigation", "menu", "sidebar", "comments", "related"]):
-                element.extract()
-            
-            # Get text
-            text = soup.get_text()
-            
-            # Clean up text
-            lines = (line.strip() for line in text.splitlines())
-            chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-            text = ' '.join(chunk for chunk in chunks if chunk)
-            
-            # Check if the content is meaningful (not just login walls)
-            if self._is_login_wall(text):
-                return {
-                    "content_preview": "Content requires login to access",
-                    "fetched_text": "",
-                    "fetched_text_length": 0
-                }
+        except PageRejected as e:
+            outcome = "rejected"
+            return self._rejected_result(url, e)
+        except Exception as e:
+            self._record_error(url, e)
+            return self._error_result(e)
+        finally:
+            observe_fetch(url, time.perf_counter() - start, body.received if body else 0, outcome)
+    
+    async def afetch_content(self, url: str) -> Dict[str, str]:
+        """
+        Async variant of `fetch_content`.
+        
+        The body is streamed and parsed chunk by chunk on the event loop;
+        finishing the parse (the whole document for the BeautifulSoup
+        extractor), the page cache's SQLite reads and writes and the
+        domain verdict lookups and updates are pushed to worker threads.
+        """
+        return await self._aflight.do(url, lambda: self._afetch_content(url))
+    
+    async def _afetch_content(self, url: str) -> Dict[str, str]:
+        start = time.perf_counter()
+        outcome = "error"
+        body = None
+        try:
+            # The page cache is SQLite: its reads and writes run on worker threads, off the event loop
+            cached = await asyncio.to_thread(self._cached_page, url) if self.page_cache is not None else None
+            if cached is not None and cached.is_fresh(self.page_cache.freshness):
+                self.page_cache.hits += 1
+                outcome = "cached"
+                return cached.result
+            # Domain verdicts may be in SQLite (DOMAIN_VERDICTS_PATH) too
+            await asyncio.to_thread(self.classifier.check_url, url)
             
-            # Create preview (first 300 characters)
-            preview = text[:300] + "..." if len(text) > 300 else text
+            # Spaced out per host (FETCH_DOMAIN_MIN_INTERVAL); other hosts are not delayed
+            async with self.politeness.aslot(url):
+                async with get_async_client().stream("GET", url, headers=self._request_headers(cached)) as response:
+                    if response.status_code == 304 and cached is not None:
+                        outcome = "revalidated"
+                        return await asyncio.to_thread(self._revalidated, url, cached)
+                    response.raise_for_status()
+                    self._check_content_type(response.headers)
+                    self.classifier.check_response(str(response.url))
+                    
+                    body = _Body(self, response.headers.get("Content-Type"))
+                    async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                        if body.feed(chunk):
+                            break
             
-            return {
-                "content_preview": preview,
-                "fetched_text": text,
-                "fetched_text_length": len(text)
-            }
+            text = await asyncio.to_thread(body.close)
+            result = self._build_result(text)
+            if self.page_cache is not None:
+                await asyncio.to_thread(self._store_page, url, response.headers, result)
+            await asyncio.to_thread(self._record, url, result)
+            outcome = "ok"
+            return result
             
+        except PageRejected as e:
+            outcome = "rejected"
+            return await asyncio.to_thread(self._rejected_result, url, e)
+        except asyncio.CancelledError:
+            # No longer needed, e.g. enough sources arrived from other pages
+            outcome = "cancelled"
+            raise
         except Exception as e:
+            await asyncio.to_thread(self._record_error, url, e)
+            return self._error_result(e)
+        finally:
+            observe_fetch(url, time.perf_counter() - start, body.received if body else 0, outcome)
+    
+    def _request_headers(self, cached: Optional[CachedPage] = None) -> Dict[str, str]:
+        # Rotate user agents
+        headers = self.headers.copy()
+        headers["User-Agent"] = random.choice(self.user_agents)
+        
+        # Revalidate a stale cached copy instead of downloading it again
+        if cached is not None:
+            headers.update(cached.conditional_headers())
+        return headers
+    
+    def _cached_page(self, url: str) -> Optional[CachedPage]:
+        if self.page_cache is None:
+            return None
+        cached = self.page_cache.get(url)
+        if cached is None:
+            self.page_cache.misses += 1
+        return cached
+    
+    def _revalidated(self, url: str, cached: CachedPage) -> Dict[str, str]:
+        """304 Not Modified: reuse the cached text without transfer or parsing."""
+        self.page_cache.revalidated += 1
+        self.page_cache.touch(url)
+        return cached.result
+    
+    def _store_page(self, url: str, response_headers, result: Dict[str, str]):
+        if self.page_cache is not None:
+            self.page_cache.set(
+                url,
+                result,
+                etag=response_headers.get("ETag"),
+                last_modified=response_headers.get("Last-Modified")
+            )
+    
+    def _check_content_type(self, response_headers):
+        """Reject non-HTML bodies before any of them is downloaded."""
+        content_type = response_headers.get("Content-Type")
+        if not content_type:
+            return
+        mime = content_type.split(";")[0].strip().lower()
+        if mime not in HTML_CONTENT_TYPES:
+            raise ValueError(f"Unsupported content type: {mime}")
+    
+    def _build_result(self, text: str) -> Dict[str, str]:
+        """Build the content preview / full text result from extracted text."""
+        text = text[:self.max_text_chars]
+        
+        # Check if the content is meaningful (not just login walls)
+        if self.classifier.is_login_wall(text):
             return {
-                "content_preview": f"Error fetching content: {str(e)}",
+                "content_preview": LOGIN_PREVIEW,
                 "fetched_text": "",
                 "fetched_text_length": 0
             }
-    
-    def _is_login_wall(self, text: str) -> bool:
-        """Check if the text is primarily a login wall."""
-        # Common login wall indicators
-        login_indicators = [
-            "sign in",
-            "log in",
-            "create account",
-            "join now",
-            "subscribe to read",
-            "please login",
-            "log in to continue",
-            "create a free account"
-        ]
         
-        # Count how many login indicators appear in the text
-        login_count = sum(1 for indicator in login_indicators if indicator.lower() in text.lower())
+        # Create preview (first 300 characters)
+        preview = text[:300] + "..." if len(text) > 300 else text
         
-        # If there are multiple login indicators and the text is short, it's likely a login wall
-        if login_count >= 2 and len(text) < 1000:
-            return True
-        
-        # If the text contains "sign in" and "continue" or "access", it's likely a login wall
-        if ("sign in" in text.lower() or "log in" in text.lower()) and \
-           ("continue" in text.lower() or "access" in text.lower()) and \
-           len(text) < 1500:
-            return True
-        
-        return False
\ No newline at end of file
+        return {
+            "content_preview": preview,
+            "fetched_text": text,
+            "fetched_text_length": len(text)
+        }
+    
+    def _rejected_result(self, url: str, rejection: PageRejected) -> Dict[str, str]:
+        # The domain verdicts count pages, not the skips they cause
+        if rejection.stage in ("response", "prefix"):
+            self.classifier.record(url, useful=False)
+        return {
+            "content_preview": LOGIN_PREVIEW if rejection.reason == "login form" else f"Skipped: {rejection.reason}",
+            "fetched_text": "",
+            "fetched_text_length": 0
+        }
+    
+    def _error_result(self, error: Exception) -> Dict[str, str]:
+        return {
+            "content_preview": f"Error fetching content: {str(error)}",
+            "fetched_text": "",
+            "fetched_text_length": 0
+        }
+    
+    def _record(self, url: str, result: Dict[str, str]):
+        self.classifier.record(url, useful=result["fetched_text_length"] > USEFUL_MIN_CHARS)
+    
+    def _record_error(self, url: str, error: Exception):
+        # Only refusals count against a domain; timeouts and 5xx may well pass
+        if status_code(error) in UNUSABLE_STATUSES:
+            self.classifier.record(url, useful=False)
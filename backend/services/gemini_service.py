@@ -1,38 +1,222 @@
+import asyncio
 import os
-from typing import Dict, Any, List
+import time
+from typing import Dict, AsyncIterator, Optional
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.prompts import PromptTemplate
 from langchain.schema import HumanMessage
 from langchain.tools import Tool
+from services.deadline import DeadlineExceeded, current_deadline, deadline_scope, within_deadline
+from services.hedging import Hedger
+from services.llm_cache import LLMResponseCache
+from services.metrics import observe_llm_call
+from services.prompt_budget import estimate_tokens
+from services.rate_limiter import RetryScheduler, get_scheduler
+from services.singleflight import AsyncSingleFlight, SingleFlight
 
 class GeminiService:
-    def __init__(self):
+    def __init__(self, cache: Optional[LLMResponseCache] = None, scheduler: Optional[RetryScheduler] = None):
         self.api_key = os.getenv("GEMINI_API_KEY")
         if not self.api_key:
             raise ValueError("GEMINI_API_KEY environment variable not set")
         
+        self.model_name = "gemini-2.5-pro"
+        self.temperature = 0.2
         self.model = ChatGoogleGenerativeAI(
-            model="gemini-2.5-pro",
+            model=self.model_name,
             google_api_key=self.api_key,
-            temperature=0.2,
+            temperature=self.temperature,
             convert_system_message_to_human=True
         )
+        
+        # Opt-in response memoization (GEMINI_CACHE_ENABLED)
+        self.cache = cache or LLMResponseCache.from_env()
+        
+        # Shared Gemini rate limits (GEMINI_RPM / GEMINI_TPM) and retries of transient errors
+        self.scheduler = scheduler or get_scheduler("gemini")
+        
+        # Optional duplicate of non-streamed calls slower than the recent p95 (HEDGE_LLM)
+        self.hedger = Hedger.from_env("gemini", "HEDGE_LLM")
+        
+        # Identical prompts in flight at the same moment share one model call
+        self._flight = SingleFlight()
+        self._aflight = AsyncSingleFlight()
     
-    def generate_text(self, prompt: str) -> str:
+    def generate_text(self, prompt: str, use_cache: bool = True) -> str:
         """
         Generate text using Gemini model.
         
         Args:
             prompt: Input prompt
+            use_cache: Set to False to bypass the response cache (and sharing of
+                identical in-flight calls) for this call
+            
+        Returns:
+            Generated text response
+        """
+        key = self._cache_key(prompt) if use_cache else None
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        
+        try:
+            if use_cache:
+                # The shared call runs without any one caller's deadline, so check this request's first
+                deadline = current_deadline()
+                if deadline is not None:
+                    deadline.check()
+                response = self._flight.do(self._flight_key(prompt), lambda: self._invoke_shared(prompt))
+            else:
+                response = self._invoke(prompt)
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            raise Exception(f"Gemini API call failed: {str(e)}")
+        
+        if key is not None and response.content:
+            self.cache.set(key, response.content)
+        return response.content
+    
+    async def agenerate_text(self, prompt: str, use_cache: bool = True) -> str:
+        """
+        Async variant of `generate_text` using the model's native async invoke.
+        
+        Args:
+            prompt: Input prompt
+            use_cache: Set to False to bypass the response cache (and sharing of
+                identical in-flight calls) for this call
             
         Returns:
             Generated text response
         """
+        key = self._cache_key(prompt) if use_cache else None
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        
         try:
-            response = self.model.invoke([HumanMessage(content=prompt)])
-            return response.content
+            # Each caller waits for the (possibly shared) call only until its own deadline
+            if use_cache:
+                response = await within_deadline(self._aflight.do(self._flight_key(prompt), lambda: self._ainvoke_shared(prompt)))
+            else:
+                response = await within_deadline(self._ainvoke(prompt))
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             raise Exception(f"Gemini API call failed: {str(e)}")
+        
+        if key is not None and response.content:
+            self.cache.set(key, response.content)
+        return response.content
+    
+    async def astream_text(self, prompt: str, use_cache: bool = True) -> AsyncIterator[str]:
+        """
+        Stream generated text chunk by chunk using the model's native async streaming.
+        
+        Args:
+            prompt: Input prompt
+            use_cache: Set to False to bypass the response cache for this call
+            
+        Yields:
+            Text chunks as the model produces them (a cached response is yielded whole)
+        """
+        key = self._cache_key(prompt) if use_cache else None
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+        
+        parts = []
+        self.scheduler.budget.record_attempt()
+        for attempt in range(self.scheduler.max_attempts):
+            await self.scheduler.limiter.aacquire(estimate_tokens(prompt))
+            start = time.perf_counter()
+            stream = self.model.astream([HumanMessage(content=prompt)])
+            try:
+                while True:
+                    # Each chunk is awaited under the request deadline, if there is one
+                    try:
+                        chunk = await within_deadline(stream.__anext__())
+                    except StopAsyncIteration:
+                        break
+                    if chunk.content:
+                        parts.append(chunk.content)
+                        yield chunk.content
+            except Exception as e:
+                observe_llm_call("astream", time.perf_counter() - start, prompt, "".join(parts), "error")
+                await stream.aclose()
+                if isinstance(e, DeadlineExceeded):
+                    raise
+                # Once output has been yielded a retry would repeat it
+                delay = None if parts else self.scheduler.next_delay(e, attempt)
+                if delay is None:
+                    raise Exception(f"Gemini API call failed: {str(e)}")
+                await asyncio.sleep(delay)
+                continue
+            observe_llm_call("astream", time.perf_counter() - start, prompt, "".join(parts), "ok")
+            self.scheduler.limiter.succeeded()
+            self.scheduler.limiter.charge(estimate_tokens("".join(parts)))
+            break
+        
+        if key is not None and parts:
+            self.cache.set(key, "".join(parts))
+    
+    def _invoke(self, prompt: str):
+        """One model call through the rate limiter and retry scheduler; each attempt is timed into the Gemini metrics."""
+        def attempt():
+            # The sync client cannot be interrupted, so the deadline is only checked before each attempt
+            deadline = current_deadline()
+            if deadline is not None:
+                deadline.check()
+            start = time.perf_counter()
+            try:
+                response = self.model.invoke([HumanMessage(content=prompt)])
+            except Exception:
+                observe_llm_call("invoke", time.perf_counter() - start, prompt, "", "error")
+                raise
+            observe_llm_call("invoke", time.perf_counter() - start, prompt, str(response.content or ""), "ok")
+            return response
+        
+        response = self.scheduler.call(attempt, estimate_tokens(prompt))
+        self.scheduler.limiter.charge(estimate_tokens(str(response.content or "")))
+        return response
+    
+    async def _ainvoke(self, prompt: str):
+        """Async counterpart of `_invoke`, optionally hedged; callers apply the request deadline around it."""
+        async def attempt():
+            start = time.perf_counter()
+            try:
+                response = await self.model.ainvoke([HumanMessage(content=prompt)])
+            except Exception:
+                observe_llm_call("ainvoke", time.perf_counter() - start, prompt, "", "error")
+                raise
+            observe_llm_call("ainvoke", time.perf_counter() - start, prompt, str(response.content or ""), "ok")
+            return response
+        
+        response = await self.hedger.run(lambda: self.scheduler.acall(attempt, estimate_tokens(prompt)))
+        self.scheduler.limiter.charge(estimate_tokens(str(response.content or "")))
+        return response
+    
+    def _invoke_shared(self, prompt: str):
+        """`_invoke` for a call shared by identical requests: no single caller's deadline applies to it."""
+        with deadline_scope(None):
+            return self._invoke(prompt)
+    
+    async def _ainvoke_shared(self, prompt: str):
+        """Async counterpart of `_invoke_shared`."""
+        with deadline_scope(None):
+            return await self._ainvoke(prompt)
+    
+    def _flight_key(self, prompt: str) -> str:
+        return LLMResponseCache.make_key(self.model_name, self.temperature, prompt)
+    
+    def _cache_key(self, prompt: str) -> Optional[str]:
+        if self.cache is None:
+            return None
+        return LLMResponseCache.make_key(self.model_name, self.temperature, prompt)
     
     def create_writer_tool(self) -> Tool:
         """Create a tool for the writer agent."""
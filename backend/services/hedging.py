@@ -0,0 +1,107 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Optional
+from services.metrics import REGISTRY
+
+HEDGES = REGISTRY.counter(
+    "hedged_requests_total", "Duplicate requests fired after the latency threshold, by which copy won", ("call", "winner")
+)
+
+
+class LatencyTracker:
+    """Latencies of the last `window` successful calls."""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float, min_samples: int = 1) -> Optional[float]:
+        """The q-quantile (0-1) of the window, or None with fewer than `min_samples` samples."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < max(min_samples, 1):
+            return None
+        return samples[min(int(q * len(samples)), len(samples) - 1)]
+
+
+class Hedger:
+    """
+    Hedged requests: when a call is slower than the recent p95, fire a duplicate and take whichever finishes first.
+
+    Only the slowest few percent of calls get a second copy, so the extra
+    load stays around 5% while the tail latency drops to roughly p95 plus
+    one typical call. Until `min_samples` latencies are known, and when
+    disabled, calls run once as usual. Only for idempotent calls.
+    """
+
+    def __init__(self, name: str, enabled: bool = False, percentile: float = 95, min_samples: int = 20,
+                 min_delay: float = 0.05):
+        self.name = name
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.latency = LatencyTracker()
+
+    @classmethod
+    def from_env(cls, name: str, flag: str) -> "Hedger":
+        return cls(
+            name,
+            enabled=os.getenv(flag, "false").lower() in ("1", "true", "yes"),
+            percentile=float(os.getenv("HEDGE_PERCENTILE", "95")),
+            min_samples=int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+        )
+
+    def threshold(self) -> Optional[float]:
+        """Seconds after which a duplicate is fired, or None while hedging is off."""
+        if not self.enabled:
+            return None
+        quantile = self.latency.quantile(self.percentile / 100, self.min_samples)
+        return max(quantile, self.min_delay) if quantile is not None else None
+
+    async def run(self, call: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run `call()`, hedged once it outlasts the threshold.
+
+        Args:
+            call: Returns a new awaitable for each copy of the request
+
+        Returns:
+            The first successful result; an error is raised only when every
+            copy failed
+        """
+        start = time.perf_counter()
+        threshold = self.threshold()
+        if threshold is None:
+            result = await call()
+            self.latency.observe(time.perf_counter() - start)
+            return result
+
+        primary = asyncio.ensure_future(call())
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=threshold)
+            hedged = not done
+            if hedged:
+                tasks.add(asyncio.ensure_future(call()))
+            error: Optional[BaseException] = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if hedged:
+                            HEDGES.inc(call=self.name, winner="primary" if task is primary else "hedge")
+                        self.latency.observe(time.perf_counter() - start)
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
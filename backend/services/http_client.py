@@ -0,0 +1,193 @@
+import asyncio
+import http.cookiejar
+import importlib.util
+import os
+import threading
+import weakref
+from typing import Callable, Dict, Optional, Tuple
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from logger import logger
+
+
+class HttpClientConfig:
+    """Connection pool and timeout settings shared by every outbound HTTP call."""
+
+    def __init__(self):
+        self.pool_connections = int(os.getenv("HTTP_POOL_CONNECTIONS", "20"))  # hosts kept in the sync pool
+        self.per_host_limit = int(os.getenv("HTTP_PER_HOST_LIMIT", "10"))  # open connections per host
+        self.max_connections = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+        self.max_keepalive = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+        self.keepalive_expiry = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+        self.connect_timeout = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+        self.read_timeout = float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+        self.http2 = os.getenv("HTTP2_ENABLED", "false").lower() in ("1", "true", "yes")
+
+    @property
+    def timeout(self) -> Tuple[float, float]:
+        """(connect, read) timeout tuple in the form `requests` expects."""
+        return (self.connect_timeout, self.read_timeout)
+
+
+config = HttpClientConfig()
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def get_session() -> requests.Session:
+    """
+    Return the process-wide keep-alive `requests` session.
+
+    The mounted adapter keeps one pool per host (up to `pool_connections`
+    hosts) and blocks once `per_host_limit` connections to a host are busy.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            # Shared across all traffic, so never carry cookies between requests
+            session.cookies.set_policy(_no_cookies_policy())
+            adapter = HTTPAdapter(
+                pool_connections=config.pool_connections,
+                pool_maxsize=config.per_host_limit,
+                pool_block=True
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    Return the shared `httpx.AsyncClient` for the running event loop.
+
+    httpx connection pools are bound to the loop they were opened on, so one
+    client is kept per loop (in practice, one per worker process).
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = _build_async_client(
+            httpx.AsyncHTTPTransport(
+                limits=httpx.Limits(
+                    max_connections=config.max_connections,
+                    max_keepalive_connections=config.max_keepalive,
+                    keepalive_expiry=config.keepalive_expiry
+                ),
+                http2=_http2_available()
+            )
+        )
+        _async_clients[loop] = client
+    return client
+
+
+def _build_async_client(transport: httpx.AsyncBaseTransport) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        transport=_PerHostLimitTransport(transport, config.per_host_limit),
+        timeout=httpx.Timeout(config.read_timeout, connect=config.connect_timeout),
+        # Shared across all traffic, so never carry cookies between requests
+        cookies=http.cookiejar.CookieJar(policy=_no_cookies_policy()),
+        follow_redirects=True
+    )
+
+
+async def close_http_clients():
+    """Close the shared session and the async client of the running loop."""
+    global _session
+    with _session_lock:
+        session, _session = _session, None
+    if session is not None:
+        session.close()
+
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def _no_cookies_policy() -> http.cookiejar.DefaultCookiePolicy:
+    """Cookie policy that accepts no cookies from any domain."""
+    return http.cookiejar.DefaultCookiePolicy(allowed_domains=[])
+
+
+def _http2_available() -> bool:
+    if not config.http2:
+        return False
+    if importlib.util.find_spec("h2") is None:
+        logger.warning("HTTP2_ENABLED is set but the 'h2' package is not installed; using HTTP/1.1")
+        return False
+    return True
+
+
+class _HostSlots:
+    """Concurrency slots for one host, plus how many requests currently use them."""
+
+    def __init__(self, limit: int):
+        self.semaphore = asyncio.Semaphore(limit)
+        self.users = 0
+
+
+class _PerHostLimitTransport(httpx.AsyncBaseTransport):
+    """
+    Caps concurrent in-flight requests per host; a slot is held until the body is closed.
+
+    Slot entries are reference counted and dropped once no request for the
+    host is waiting or in flight, so arbitrary fetch targets do not accumulate.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, per_host_limit: int):
+        self._transport = transport
+        self._per_host_limit = per_host_limit
+        self._slots: Dict[str, _HostSlots] = {}
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        slots = self._slots.get(host)
+        if slots is None:
+            slots = self._slots[host] = _HostSlots(self._per_host_limit)
+        slots.users += 1
+
+        try:
+            await slots.semaphore.acquire()
+        except BaseException:
+            self._release(host, slots, acquired=False)
+            raise
+
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            self._release(host, slots)
+            raise
+        response.stream = _ReleasingStream(response.stream, lambda: self._release(host, slots))
+        return response
+
+    def _release(self, host: str, slots: _HostSlots, acquired: bool = True):
+        if acquired:
+            slots.semaphore.release()
+        slots.users -= 1
+        if slots.users == 0 and self._slots.get(host) is slots:
+            del self._slots[host]
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, release: Callable[[], None]):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            if self._release is not None:
+                self._release()
+                self._release = None
@@ -0,0 +1,112 @@
+import asyncio
+import os
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# runner(request, on_progress) -> result; on_progress receives the pipeline's agent_logs
+JobRunner = Callable[[Dict[str, Any], Callable[[Dict[str, Dict[str, Any]]], None]], Awaitable[Dict[str, Any]]]
+
+
+class JobQueueFull(Exception):
+    """Raised by `JobManager.submit` when the backlog is at its limit."""
+
+
+class JobManager:
+    """
+    Runs research jobs on a fixed pool of in-process async workers.
+
+    Jobs are recorded in a job store before they are queued, and their
+    per-agent stage status is copied into the store as the pipeline reports
+    it. Throughput is set by the number of workers; submissions beyond
+    `queue_size` waiting jobs are refused. Jobs a previous process left
+    queued or running are picked up again on `start`.
+    """
+
+    def __init__(self, store, runner: JobRunner, workers: Optional[int] = None,
+                 queue_size: Optional[int] = None, retention: Optional[float] = None):
+        self.store = store
+        self.runner = runner
+        self.workers = workers or int(os.getenv("JOB_WORKERS", "2"))
+        self.queue_size = queue_size or int(os.getenv("JOB_QUEUE_SIZE", "100"))
+        self.retention = retention or float(os.getenv("JOB_RETENTION", "86400"))
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self):
+        """Start the workers and requeue unfinished jobs from the store."""
+        self._queue = asyncio.Queue()
+        for job in self.store.unfinished():
+            self.store.update(job["job_id"], status="queued", started_at=None)
+            self._queue.put_nowait(job["job_id"])
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Stop the workers; jobs still running stay unfinished and resume on the next start."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Record and queue a job.
+
+        Args:
+            request: JSON-serialisable research request
+
+        Returns:
+            The queued job record
+        """
+        if self._queue is None:
+            raise RuntimeError("Job manager is not running")
+        if self._queue.qsize() >= self.queue_size:
+            raise JobQueueFull(f"Job queue is full ({self.queue_size} waiting)")
+
+        self.store.purge(time.time() - self.retention)
+        job = self.store.create(uuid.uuid4().hex, request)
+        self._queue.put_nowait(job["job_id"])
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get(job_id)
+
+    async def _work(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str):
+        job = self.store.get(job_id)
+        if job is None:
+            return
+
+        agent_logs: Dict[str, Dict[str, Any]] = {}
+
+        def on_progress(logs: Dict[str, Dict[str, Any]]):
+            agent_logs.clear()
+            agent_logs.update(logs)
+            self.store.update(job_id, agent_logs=logs)
+
+        self.store.update(job_id, status="running", started_at=time.time(), agent_logs={})
+        try:
+            result = await self.runner(job["request"], on_progress)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # The stage that was running when the pipeline gave up is the one that failed
+            for log in agent_logs.values():
+                if log.get("status") == "running":
+                    log["status"] = "failed"
+            self.store.update(
+                job_id, status="failed", error=str(e), agent_logs=agent_logs, finished_at=time.time()
+            )
+            return
+
+        self.store.update(
+            job_id, status="completed", result=result, agent_logs=result.get("agent_logs") or agent_logs,
+            finished_at=time.time()
+        )
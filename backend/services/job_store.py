@@ -0,0 +1,152 @@
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+# Lifecycle of a research job
+JOB_STATUSES = ("queued", "running", "completed", "failed")
+UNFINISHED_STATUSES = ("queued", "running")
+
+# Fields stored as JSON text in the SQLite store
+_JSON_FIELDS = ("request", "agent_logs", "result")
+
+
+def new_job(job_id: str, request: Dict[str, Any]) -> Dict[str, Any]:
+    """A freshly queued job record."""
+    return {
+        "job_id": job_id,
+        "status": "queued",
+        "request": request,
+        "agent_logs": {},
+        "result": None,
+        "error": None,
+        "created_at": time.time(),
+        "started_at": None,
+        "finished_at": None
+    }
+
+
+class InMemoryJobStore:
+    """Thread-safe job store kept in process memory; jobs are lost on restart."""
+
+    def __init__(self):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def create(self, job_id: str, request: Dict[str, Any]) -> Dict[str, Any]:
+        job = new_job(job_id, request)
+        with self._lock:
+            self._jobs[job_id] = job
+            return copy.deepcopy(job)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return copy.deepcopy(job) if job is not None else None
+
+    def update(self, job_id: str, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(copy.deepcopy(fields))
+
+    def unfinished(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if job["status"] in UNFINISHED_STATUSES]
+            return [copy.deepcopy(job) for job in sorted(jobs, key=lambda job: job["created_at"])]
+
+    def purge(self, finished_before: float):
+        """Drop completed and failed jobs that finished before the given time."""
+        with self._lock:
+            for job_id in [
+                job_id for job_id, job in self._jobs.items()
+                if job["finished_at"] is not None and job["finished_at"] < finished_before
+            ]:
+                del self._jobs[job_id]
+
+    def close(self):
+        pass
+
+
+class SQLiteJobStore:
+    """
+    Job store backed by SQLite, so queued work and finished results survive restarts.
+
+    Request, stage logs and result are stored as JSON text.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "job_id TEXT PRIMARY KEY, status TEXT NOT NULL, request TEXT NOT NULL, agent_logs TEXT NOT NULL, "
+                "result TEXT, error TEXT, created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+
+    def create(self, job_id: str, request: Dict[str, Any]) -> Dict[str, Any]:
+        job = new_job(job_id, request)
+        row = self._encode(job)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT INTO jobs ({', '.join(row)}) VALUES ({', '.join('?' for _ in row)})", tuple(row.values())
+            )
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            cursor = self._conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,))
+            row = cursor.fetchone()
+            return self._decode(cursor, row) if row is not None else None
+
+    def update(self, job_id: str, **fields):
+        row = self._encode(fields)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE jobs SET {', '.join(f'{column} = ?' for column in row)} WHERE job_id = ?",
+                (*row.values(), job_id)
+            )
+
+    def unfinished(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT * FROM jobs WHERE status IN (?, ?) ORDER BY created_at", UNFINISHED_STATUSES
+            )
+            return [self._decode(cursor, row) for row in cursor.fetchall()]
+
+    def purge(self, finished_before: float):
+        """Drop completed and failed jobs that finished before the given time."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM jobs WHERE finished_at < ?", (finished_before,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _encode(fields: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            column: json.dumps(value) if column in _JSON_FIELDS and value is not None else value
+            for column, value in fields.items()
+        }
+
+    @staticmethod
+    def _decode(cursor, row) -> Dict[str, Any]:
+        job = dict(zip((column[0] for column in cursor.description), row))
+        for column in _JSON_FIELDS:
+            if job[column] is not None:
+                job[column] = json.loads(job[column])
+        return job
+
+
+def create_job_store():
+    """SQLite job store when JOB_STORE_PATH is set, in-memory otherwise."""
+    path = os.getenv("JOB_STORE_PATH")
+    return SQLiteJobStore(path) if path else InMemoryJobStore()
@@ -0,0 +1,67 @@
+import hashlib
+import os
+from typing import Any, Dict, Optional
+from services.cache import MemoryCache, SQLiteCache
+
+
+class LLMResponseCache:
+    """
+    Memoizes model responses keyed on a hash of model name, temperature and prompt.
+
+    The in-memory LRU tier is checked first, then the optional SQLite tier;
+    disk hits are promoted back into memory.
+    """
+
+    def __init__(self, memory: MemoryCache, disk: Optional[SQLiteCache] = None):
+        self.memory = memory
+        self.disk = disk
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["LLMResponseCache"]:
+        """Build the cache from GEMINI_CACHE_* settings; None unless GEMINI_CACHE_ENABLED is set."""
+        if os.getenv("GEMINI_CACHE_ENABLED", "false").lower() not in ("1", "true", "yes"):
+            return None
+        ttl = float(os.getenv("GEMINI_CACHE_TTL", "86400"))
+        memory = MemoryCache(
+            max_entries=int(os.getenv("GEMINI_CACHE_MAX_ENTRIES", "1024")),
+            ttl=ttl,
+            max_bytes=int(os.getenv("GEMINI_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+        )
+        path = os.getenv("GEMINI_CACHE_PATH")
+        disk = SQLiteCache(path, ttl=ttl, table="llm_cache") if path else None
+        return cls(memory, disk)
+
+    @staticmethod
+    def make_key(model: str, temperature: float, prompt: str) -> str:
+        digest = hashlib.sha256()
+        for part in (model, repr(temperature), prompt):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: str):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats() if self.disk else None
+        }
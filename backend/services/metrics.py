@@ -0,0 +1,307 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Upper bounds (le) of the histogram buckets; +Inf is implied
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, per label combination."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}" for key, value in values
+        ]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets, per label combination."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[LabelValues, List[Any]] = {}
+
+    def observe(self, value: float, **labels: Any):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        """Observe the duration of the `with` block, on the monotonic clock."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels: Any) -> int:
+        series = self._series.get(self._key(labels))
+        return series[2] if series else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = sorted((key, [list(value[0]), value[1], value[2]]) for key, value in self._series.items())
+        lines = self.header()
+        for key, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {count}")
+        return lines
+
+
+class _Collected(_Metric):
+    """Values read from a callback at scrape time (e.g. cache counters kept elsewhere)."""
+
+    def __init__(self, name: str, documentation: str, kind: str, labels: Sequence[str],
+                 collect: Callable[[], Dict[LabelValues, float]]):
+        super().__init__(name, documentation, labels)
+        self.kind = kind
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        return self.header() + [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in sorted(self.collect().items())
+        ]
+
+
+class Registry:
+    """Named metrics rendered together in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def collector(self, name: str, documentation: str, kind: str, labels: Sequence[str],
+                  collect: Callable[[], Dict[LabelValues, float]]):
+        """Register (or replace) a metric whose values come from `collect()` at scrape time."""
+        with self._lock:
+            self._metrics[name] = _Collected(name, documentation, kind, labels, collect)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def _register(self, metric: _Metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    "research_request_duration_seconds", "Research pipeline runs, end to end", ("outcome",)
+)
+STAGE_SECONDS = REGISTRY.histogram(
+    "pipeline_stage_duration_seconds", "Pipeline stage run time", ("stage",)
+)
+AGENT_SECONDS = REGISTRY.histogram(
+    "agent_duration_seconds", "Agent calls, from log_agent_start to log_agent_end", ("agent",)
+)
+FETCH_SECONDS = REGISTRY.histogram(
+    "fetch_duration_seconds", "Page fetches by outcome (ok, cached, revalidated, error)", ("outcome",)
+)
+FETCH_BYTES = REGISTRY.histogram(
+    "fetch_response_bytes", "Body bytes read per page fetch", ("outcome",), SIZE_BUCKETS
+)
+LLM_SECONDS = REGISTRY.histogram(
+    "gemini_request_duration_seconds", "Gemini model calls (cache hits excluded)", ("method", "outcome")
+)
+LLM_PROMPT_CHARS = REGISTRY.histogram(
+    "gemini_prompt_chars", "Prompt size per Gemini model call", ("method",), SIZE_BUCKETS
+)
+LLM_RESPONSE_CHARS = REGISTRY.histogram(
+    "gemini_response_chars", "Response size per Gemini model call", ("method",), SIZE_BUCKETS
+)
+
+# name -> object with `hits` and `misses` counters (see register_cache)
+_caches: Dict[str, Any] = {}
+
+
+def _cache_lookups() -> Dict[LabelValues, float]:
+    values = {}
+    for name, cache in list(_caches.items()):
+        values[(name, "hit")] = cache.hits
+        values[(name, "miss")] = cache.misses
+    return values
+
+
+def _cache_hit_ratio() -> Dict[LabelValues, float]:
+    values = {}
+    for name, cache in list(_caches.items()):
+        lookups = cache.hits + cache.misses
+        values[(name,)] = cache.hits / lookups if lookups else 0
+    return values
+
+
+REGISTRY.collector("cache_lookups_total", "Cache lookups by cache and result", "counter", ("cache", "result"), _cache_lookups)
+REGISTRY.collector("cache_hit_ratio", "Hits over lookups since start", "gauge", ("cache",), _cache_hit_ratio)
+
+
+def register_cache(name: str, cache: Any):
+    """Export a cache's `hits` / `misses` counters (no-op for None)."""
+    if cache is not None:
+        _caches[name] = cache
+
+
+class RequestTrace:
+    """Timings of one research request, reported in its `agent_logs`."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.fetches: List[Dict[str, Any]] = []
+        self.llm_calls: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add_fetch(self, entry: Dict[str, Any]):
+        with self._lock:
+            self.fetches.append(entry)
+
+    def add_llm_call(self, entry: Dict[str, Any]):
+        with self._lock:
+            self.llm_calls.append(entry)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            fetches = list(self.fetches)
+            llm_calls = list(self.llm_calls)
+        return {
+            "total_seconds": round(time.perf_counter() - self.started, 3),
+            "stages": {name: round(seconds, 3) for name, seconds in self.stages.items()},
+            "fetches": fetches,
+            "llm": {
+                "calls": len(llm_calls),
+                "seconds": round(sum(call["seconds"] for call in llm_calls), 3),
+                "prompt_chars": sum(call["prompt_chars"] for call in llm_calls),
+                "response_chars": sum(call["response_chars"] for call in llm_calls)
+            }
+        }
+
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("request_trace", default=None)
+
+
+@contextmanager
+def trace() -> Iterator[RequestTrace]:
+    """Collect per-request timings from everything run in this context (tasks and to_thread included)."""
+    request_trace = RequestTrace()
+    token = _current_trace.set(request_trace)
+    try:
+        yield request_trace
+    finally:
+        _current_trace.reset(token)
+
+
+def observe_stage(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    request_trace = _current_trace.get()
+    if request_trace is not None:
+        request_trace.stages[stage] = seconds
+
+
+def observe_fetch(url: str, seconds: float, received: int, outcome: str):
+    FETCH_SECONDS.observe(seconds, outcome=outcome)
+    FETCH_BYTES.observe(received, outcome=outcome)
+    request_trace = _current_trace.get()
+    if request_trace is not None:
+        request_trace.add_fetch({"url": url, "seconds": round(seconds, 3), "bytes": received, "outcome": outcome})
+
+
+def observe_llm_call(method: str, seconds: float, prompt: str, response: str, outcome: str):
+    LLM_SECONDS.observe(seconds, method=method, outcome=outcome)
+    LLM_PROMPT_CHARS.observe(len(prompt), method=method)
+    LLM_RESPONSE_CHARS.observe(len(response), method=method)
+    request_trace = _current_trace.get()
+    if request_trace is not None:
+        request_trace.add_llm_call({
+            "method": method, "seconds": seconds, "prompt_chars": len(prompt), "response_chars": len(response)
+        })
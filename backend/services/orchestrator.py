@@ -0,0 +1,184 @@
+import asyncio
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence
+from logger import logger
+from services.metrics import observe_stage
+
+_END = object()
+
+
+class Stage:
+    """
+    One step of a pipeline.
+
+    Args:
+        name: Stage name, unique within the pipeline
+        run: Coroutine function called with a `StageContext`; returns a dict
+            holding a value for every name in `outputs`
+        inputs: Values that must exist before the stage starts
+        outputs: Values the stage produces
+        streams: Item streams the stage publishes to while it runs
+        consumes: Item streams the stage reads; it starts right away instead
+            of waiting for the producer to finish
+    """
+
+    def __init__(self, name: str, run: Callable[["StageContext"], Awaitable[Optional[Dict[str, Any]]]],
+                 inputs: Sequence[str] = (), outputs: Sequence[str] = (),
+                 streams: Sequence[str] = (), consumes: Sequence[str] = ()):
+        self.name = name
+        self.run = run
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.streams = tuple(streams)
+        self.consumes = tuple(consumes)
+
+
+class StageContext:
+    """What a running stage sees: its input values and its streams."""
+
+    def __init__(self, inputs: Dict[str, Any], publishers: Dict[str, List[asyncio.Queue]],
+                 subscriptions: Dict[str, asyncio.Queue]):
+        self.inputs = inputs
+        self._publishers = publishers
+        self._subscriptions = subscriptions
+
+    def publish(self, stream: str, item: Any):
+        """Hand an item to every stage consuming `stream`."""
+        for queue in self._publishers[stream]:
+            queue.put_nowait(item)
+
+    async def stream(self, name: str) -> AsyncIterator[Any]:
+        """Items of a consumed stream, as they are published, until its producer finishes."""
+        queue = self._subscriptions[name]
+        while True:
+            item = await queue.get()
+            if item is _END:
+                return
+            yield item
+
+
+class Orchestrator:
+    """
+    Runs pipeline stages as a dependency graph.
+
+    Each stage starts as soon as all of its inputs exist, so independent
+    stages run concurrently, and stages consuming a stream start together
+    with its producer and work on items as they arrive. The first failing
+    stage cancels the rest and its exception is raised.
+    """
+
+    def __init__(self, stages: Iterable[Stage], on_stage: Optional[Callable[[str, str], None]] = None):
+        self.stages = list(stages)
+        self.on_stage = on_stage
+        self.timings: Dict[str, float] = {}
+        self._validate()
+
+    async def run(self, initial: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Run every stage.
+
+        Args:
+            initial: Values available before any stage runs
+
+        Returns:
+            All values: the initial ones plus every stage output
+        """
+        initial = initial or {}
+        produced = {name for stage in self.stages for name in stage.outputs}
+        missing = sorted({name for stage in self.stages for name in stage.inputs} - produced - set(initial))
+        if missing:
+            raise ValueError(f"No stage produces: {', '.join(missing)}")
+
+        loop = asyncio.get_running_loop()
+        values: Dict[str, asyncio.Future] = {}
+        for name, value in initial.items():
+            values[name] = loop.create_future()
+            values[name].set_result(value)
+        for stage in self.stages:
+            for name in stage.outputs:
+                values[name] = loop.create_future()
+
+        # One queue per (stream, consumer), so each consumer sees every item
+        subscriptions = {
+            stage.name: {stream: asyncio.Queue() for stream in stage.consumes}
+            for stage in self.stages
+        }
+        publishers = {
+            stream: [subscriptions[consumer.name][stream] for consumer in self.stages if stream in consumer.consumes]
+            for stage in self.stages for stream in stage.streams
+        }
+
+        async def run_stage(stage: Stage):
+            inputs = {name: await values[name] for name in stage.inputs}
+            context = StageContext(inputs, publishers, subscriptions[stage.name])
+            self._notify(stage.name, "running")
+            start = time.perf_counter()
+            try:
+                outputs = await stage.run(context) or {}
+            finally:
+                for stream in stage.streams:
+                    for queue in publishers[stream]:
+                        queue.put_nowait(_END)
+
+            missing = [name for name in stage.outputs if name not in outputs]
+            if missing:
+                raise RuntimeError(f"Stage '{stage.name}' did not produce: {', '.join(missing)}")
+            for name in stage.outputs:
+                values[name].set_result(outputs[name])
+
+            self.timings[stage.name] = time.perf_counter() - start
+            observe_stage(stage.name, self.timings[stage.name])
+            logger.info("Stage '%s' completed in %.2fs", stage.name, self.timings[stage.name])
+            self._notify(stage.name, "completed")
+
+        tasks = [asyncio.create_task(run_stage(stage), name=f"stage-{stage.name}") for stage in self.stages]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                if task.exception() is not None:
+                    raise task.exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        return {name: future.result() for name, future in values.items()}
+
+    def _notify(self, stage: str, status: str):
+        if self.on_stage is not None:
+            self.on_stage(stage, status)
+
+    def _validate(self):
+        """Reject duplicate stages or outputs, unknown streams and cycles."""
+        names = [stage.name for stage in self.stages]
+        if len(set(names)) != len(names):
+            raise ValueError("Stage names must be unique")
+
+        producers: Dict[str, Stage] = {}
+        for stage in self.stages:
+            for name in stage.outputs + stage.streams:
+                if name in producers:
+                    raise ValueError(f"'{name}' is produced by both '{producers[name].name}' and '{stage.name}'")
+                producers[name] = stage
+
+        for stage in self.stages:
+            for name in stage.consumes:
+                if name not in producers or name not in producers[name].streams:
+                    raise ValueError(f"Stage '{stage.name}' consumes unknown stream '{name}'")
+
+        # Depth-first search over "waits for" edges; streams do not wait
+        state: Dict[str, str] = {}
+
+        def visit(stage: Stage):
+            if state.get(stage.name) == "done":
+                return
+            if state.get(stage.name) == "visiting":
+                raise ValueError(f"Pipeline has a cycle through '{stage.name}'")
+            state[stage.name] = "visiting"
+            for name in stage.inputs:
+                if name in producers:
+                    visit(producers[name])
+            state[stage.name] = "done"
+
+        for stage in self.stages:
+            visit(stage)
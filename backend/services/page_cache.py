@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+class CachedPage:
+    """A cached fetch result together with the validators needed to revalidate it."""
+
+    def __init__(self, result: Dict[str, Any], etag: Optional[str], last_modified: Optional[str], fetched_at: float):
+        self.result = result
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+
+    def is_fresh(self, freshness: float) -> bool:
+        return time.time() - self.fetched_at < freshness
+
+    def conditional_headers(self) -> Dict[str, str]:
+        """If-None-Match / If-Modified-Since headers for a conditional GET."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class PageCache:
+    """
+    Persistent cache of cleaned page text, keyed by the SHA-256 of the URL.
+
+    Within the freshness window a cached page is served without any network
+    traffic. After that it is revalidated with a conditional GET; a 304 only
+    refreshes the timestamp, so neither the body nor the HTML parse is paid
+    again. Total stored text is capped at `max_bytes`, evicting the least
+    recently used pages first.
+    """
+
+    def __init__(self, path: str, freshness: float = 3600, max_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.freshness = freshness
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                "key TEXT PRIMARY KEY, url TEXT NOT NULL, result TEXT NOT NULL, etag TEXT, last_modified TEXT, "
+                "fetched_at REAL NOT NULL, accessed_at REAL NOT NULL, size INTEGER NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS pages_accessed ON pages (accessed_at)")
+
+    @classmethod
+    def from_env(cls) -> Optional["PageCache"]:
+        """Build the cache from PAGE_CACHE_* settings; None when PAGE_CACHE_PATH is unset."""
+        path = os.getenv("PAGE_CACHE_PATH")
+        if not path:
+            return None
+        return cls(
+            path,
+            freshness=float(os.getenv("PAGE_CACHE_FRESHNESS", "3600")),
+            max_bytes=int(os.getenv("PAGE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+        )
+
+    def get(self, url: str) -> Optional[CachedPage]:
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT result, etag, last_modified, fetched_at FROM pages WHERE key = ?", (self._key(url),)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE pages SET accessed_at = ? WHERE key = ?", (time.time(), self._key(url)))
+        return CachedPage(json.loads(row[0]), row[1], row[2], row[3])
+
+    def set(self, url: str, result: Dict[str, Any], etag: Optional[str] = None, last_modified: Optional[str] = None):
+        payload = json.dumps(result)
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages (key, url, result, etag, last_modified, fetched_at, accessed_at, size) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (self._key(url), url, payload, etag, last_modified, now, now, len(payload))
+            )
+            self._evict()
+
+    def touch(self, url: str):
+        """Mark a cached page as fresh again after a 304 Not Modified."""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE pages SET fetched_at = ?, accessed_at = ? WHERE key = ?", (now, now, self._key(url))
+            )
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM pages").fetchone()
+        return {
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+            "entries": entries,
+            "bytes": size
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        for key, size in self._conn.execute("SELECT key, size FROM pages ORDER BY accessed_at ASC").fetchall():
+            if excess <= 0:
+                break
+            self._conn.execute("DELETE FROM pages WHERE key = ?", (key,))
+            excess -= size
+
+    @staticmethod
+    def _key(url: str) -> str:
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
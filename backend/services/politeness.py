@@ -0,0 +1,154 @@
+import asyncio
+import os
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Dict, Iterator, Optional
+from urllib.parse import urlparse
+from urllib.robotparser import RobotFileParser
+from services.http_client import config as http_config, get_async_client, get_session
+from services.metrics import REGISTRY
+from services.singleflight import AsyncSingleFlight, SingleFlight
+
+# How long a host's robots.txt crawl-delay is trusted before it is read again
+ROBOTS_TTL = 24 * 3600
+
+POLITENESS_WAIT = REGISTRY.histogram(
+    "fetch_politeness_wait_seconds", "Time page fetches waited for their host's slot and interval"
+)
+
+
+class _Host:
+    def __init__(self):
+        self.next_start = 0.0
+        self.crawl_delay: Optional[float] = None
+        self.robots_checked = 0.0
+
+
+class PolitenessScheduler:
+    """
+    Spaces out page fetches per host instead of sleeping before every fetch.
+
+    Fetches to different hosts start immediately. Fetches to the same host
+    start at least `min_interval` seconds apart (or the host's robots.txt
+    Crawl-delay, if `respect_crawl_delay` and it is longer, up to
+    `max_crawl_delay`) and at most `per_host_limit` of them run at once.
+    One scheduler is shared by every request, so concurrent research runs
+    hitting the same site are spaced out together.
+    """
+
+    def __init__(self, min_interval: float = 1.0, per_host_limit: int = 2,
+                 respect_crawl_delay: bool = False, max_crawl_delay: float = 10.0):
+        self.min_interval = min_interval
+        self.per_host_limit = per_host_limit
+        self.respect_crawl_delay = respect_crawl_delay
+        self.max_crawl_delay = max_crawl_delay
+        self._hosts: Dict[str, _Host] = {}
+        self._lock = threading.Lock()
+        # Per-host concurrency slots: one set for threads, one per event loop
+        self._thread_slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._loop_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = weakref.WeakKeyDictionary()
+        self._robots_flight = SingleFlight()
+        self._arobots_flight = AsyncSingleFlight()
+
+    @classmethod
+    def from_env(cls) -> "PolitenessScheduler":
+        return cls(
+            min_interval=float(os.getenv("FETCH_DOMAIN_MIN_INTERVAL", "1.0")),
+            per_host_limit=int(os.getenv("FETCH_PER_DOMAIN_LIMIT", "2")),
+            respect_crawl_delay=os.getenv("FETCH_RESPECT_CRAWL_DELAY", "false").lower() in ("1", "true", "yes"),
+            max_crawl_delay=float(os.getenv("FETCH_MAX_CRAWL_DELAY", "10"))
+        )
+
+    @contextmanager
+    def slot(self, url: str) -> Iterator[None]:
+        """Hold one of the host's fetch slots, entered once the host's interval has passed (blocking)."""
+        host = self._host_of(url)
+        start = time.perf_counter()
+        if self._needs_robots(host):
+            self._robots_flight.do(host, lambda: self._read_robots(url, host))
+        with self._lock:
+            slots = self._thread_slots.get(host)
+            if slots is None:
+                slots = self._thread_slots[host] = threading.BoundedSemaphore(self.per_host_limit)
+        with slots:
+            wait = self._reserve(host)
+            if wait > 0:
+                time.sleep(wait)
+            POLITENESS_WAIT.observe(time.perf_counter() - start)
+            yield
+
+    @asynccontextmanager
+    async def aslot(self, url: str) -> AsyncIterator[None]:
+        """Async counterpart of `slot`."""
+        host = self._host_of(url)
+        start = time.perf_counter()
+        if self._needs_robots(host):
+            await self._arobots_flight.do(host, lambda: self._aread_robots(url, host))
+        with self._lock:
+            loop_slots = self._loop_slots.setdefault(asyncio.get_running_loop(), {})
+            slots = loop_slots.get(host)
+            if slots is None:
+                slots = loop_slots[host] = asyncio.Semaphore(self.per_host_limit)
+        async with slots:
+            wait = self._reserve(host)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            POLITENESS_WAIT.observe(time.perf_counter() - start)
+            yield
+
+    def interval(self, host: str) -> float:
+        """Seconds between fetch starts for `host`."""
+        state = self._hosts.get(host)
+        crawl_delay = state.crawl_delay if state is not None and self.respect_crawl_delay else None
+        return max(self.min_interval, min(crawl_delay or 0.0, self.max_crawl_delay))
+
+    def _reserve(self, host: str) -> float:
+        """Book the host's next start time; returns the seconds to wait for it."""
+        with self._lock:
+            state = self._hosts.setdefault(host, _Host())
+            now = time.monotonic()
+            start = max(now, state.next_start)
+            state.next_start = start + self.interval(host)
+            return start - now
+
+    def _needs_robots(self, host: str) -> bool:
+        if not self.respect_crawl_delay:
+            return False
+        state = self._hosts.get(host)
+        return state is None or time.monotonic() - state.robots_checked > ROBOTS_TTL
+
+    def _read_robots(self, url: str, host: str):
+        try:
+            response = get_session().get(self._robots_url(url), timeout=http_config.timeout)
+            text = response.text if response.status_code == 200 else ""
+        except Exception:
+            text = ""
+        self._set_crawl_delay(host, text)
+
+    async def _aread_robots(self, url: str, host: str):
+        try:
+            response = await get_async_client().get(self._robots_url(url))
+            text = response.text if response.status_code == 200 else ""
+        except Exception:
+            text = ""
+        self._set_crawl_delay(host, text)
+
+    def _set_crawl_delay(self, host: str, robots_txt: str):
+        parser = RobotFileParser()
+        parser.parse(robots_txt.splitlines())
+        delay = parser.crawl_delay("*")
+        with self._lock:
+            state = self._hosts.setdefault(host, _Host())
+            state.crawl_delay = float(delay) if delay else None
+            state.robots_checked = time.monotonic()
+
+    @staticmethod
+    def _robots_url(url: str) -> str:
+        parsed = urlparse(url)
+        return f"{parsed.scheme or 'https'}://{parsed.netloc}/robots.txt"
+
+    @staticmethod
+    def _host_of(url: str) -> str:
+        return urlparse(url).netloc.lower()
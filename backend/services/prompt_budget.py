@@ -0,0 +1,141 @@
+import math
+import re
+from typing import Dict, List, Optional
+
+# Rough average for English prose with Gemini's tokenizer; good enough for budgeting
+CHARS_PER_TOKEN = 4
+
+# Smallest share a ranked item is cut to; past that the least relevant items are dropped
+MIN_ITEM_TOKENS = 40
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimated token count of `text` (no API call)."""
+    return math.ceil(len(text or "") / CHARS_PER_TOKEN)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut `text` to about `max_tokens` tokens, at a word boundary, marking the cut with '...'."""
+    text = text or ""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+    cut = text[:max(max_tokens * CHARS_PER_TOKEN - 3, 0)]
+    space = cut.rfind(" ")
+    if space > len(cut) // 2:
+        cut = cut[:space]
+    return cut.rstrip() + "..."
+
+
+class PromptBudget:
+    """
+    Assembles prompt sections within an input token budget.
+
+    Sections are added in priority order and each one only gets what the
+    earlier ones left. `usage` records the estimated tokens every section
+    used, plus how many items a ranked section kept and dropped.
+    """
+
+    def __init__(self, max_tokens: int):
+        self.max_tokens = max_tokens
+        self.used = 0
+        self.usage: Dict[str, Dict[str, int]] = {}
+
+    @property
+    def remaining(self) -> int:
+        return max(self.max_tokens - self.used, 0)
+
+    def reserve(self, name: str, text: str, **counts: int) -> str:
+        """Count text that must be sent whole (instructions, templates), even past the budget."""
+        self._record(name, estimate_tokens(text), **counts)
+        return text
+
+    def add(self, name: str, text: str, max_tokens: Optional[int] = None) -> str:
+        """
+        Add one block of text, truncated to fit.
+
+        Args:
+            name: Section name used in `usage`
+            text: Section text
+            max_tokens: Optional cap for this section below what is left
+
+        Returns:
+            The text to put in the prompt
+        """
+        limit = self.remaining if max_tokens is None else min(max_tokens, self.remaining)
+        text = truncate_to_tokens(text, limit)
+        self._record(name, estimate_tokens(text))
+        return text
+
+    def add_items(self, name: str, items: List[str], max_tokens: Optional[int] = None,
+                  separator: str = "\n") -> str:
+        """
+        Add ranked items, most relevant first.
+
+        Each item may use at most an equal share of the tokens left for the
+        section, so one long item cannot crowd out the rest; unused share
+        carries over to later items. A share is never below MIN_ITEM_TOKENS,
+        so when there is not enough room for every item the least relevant
+        ones are dropped.
+
+        Args:
+            name: Section name used in `usage`
+            items: Item texts in order of relevance
+            max_tokens: Optional cap for this section below what is left
+            separator: Joins the kept items
+
+        Returns:
+            The kept items joined with `separator`
+        """
+        available = self.remaining if max_tokens is None else min(max_tokens, self.remaining)
+        kept = []
+        spent = 0
+        for position, item in enumerate(items):
+            left = available - spent
+            share = max(left // (len(items) - position), MIN_ITEM_TOKENS)
+            if min(share, estimate_tokens(item)) > left:
+                continue
+            item = truncate_to_tokens(item, share)
+            kept.append(item)
+            spent += estimate_tokens(item) + estimate_tokens(separator)
+
+        text = separator.join(kept)
+        self._record(name, estimate_tokens(text), items=len(kept), dropped=len(items) - len(kept))
+        return text
+
+    def report(self) -> Dict[str, object]:
+        """Budget, total and per-section usage, for agent logs."""
+        return {"budget": self.max_tokens, "tokens": self.used, "sections": self.usage}
+
+    def summary(self) -> str:
+        """One-line description of the usage, for logs."""
+        sections = ", ".join(f"{name}={info['tokens']}" for name, info in self.usage.items())
+        return f"~{self.used}/{self.max_tokens} tokens ({sections})"
+
+    def _record(self, name: str, tokens: int, **counts: int):
+        self.used += tokens
+        self.usage[name] = {"tokens": tokens, **counts}
+
+
+def relevance_terms(tables: Dict[str, List[Dict]], limit: int = 20) -> Dict[str, float]:
+    """
+    Keyword weights for ranking sources, from the analysis keyword tables.
+
+    Uses TF-IDF scores when available, else raw keyword counts.
+    """
+    weights = {}
+    for row in (tables.get("keyword_tfidf") or [])[:limit]:
+        weights[str(row.get("Keyword", "")).lower()] = float(row.get("TF-IDF", 0) or 0)
+    if not weights:
+        for row in (tables.get("keyword_frequency") or [])[:limit]:
+            weights[str(row.get("Keyword", "")).lower()] = float(row.get("Count", 0) or 0)
+    weights.pop("n/a", None)
+    weights.pop("", None)
+    return weights
+
+
+def relevance_score(text: str, weights: Dict[str, float]) -> float:
+    """Sum of the weights of the distinct keywords that occur in `text`."""
+    words = set(re.findall(r"[a-z]+", (text or "").lower()))
+    return sum(weight for term, weight in weights.items() if term in words)
@@ -0,0 +1,365 @@
+import asyncio
+import os
+import random
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+import httpx
+import requests
+from logger import logger
+from services.deadline import DeadlineExceeded, current_deadline
+from services.metrics import REGISTRY
+
+# Status codes worth another attempt; anything else (400, 401, 403, 404...) fails at once
+RETRYABLE_STATUS = (408, 429, 500, 502, 503, 504)
+
+# Seconds of traffic a bucket may burst when it has been idle
+BURST_SECONDS = 10
+
+# Throttling halves the effective rate (not below this share); every success wins back ADAPT_STEP
+MIN_RATE_FACTOR = 0.1
+ADAPT_STEP = 0.05
+
+# Retry hints in error messages, e.g. Gemini's "Please retry in 23.4s" or "retry_delay { seconds: 23 }"
+_RETRY_HINTS = (
+    re.compile(r"retry in ([\d.]+)\s*s", re.IGNORECASE),
+    re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)", re.IGNORECASE),
+)
+_STATUS_IN_MESSAGE = re.compile(r"\b(408|429|500|502|503|504)\b|RESOURCE_EXHAUSTED|UNAVAILABLE|DEADLINE_EXCEEDED")
+
+RETRIES = REGISTRY.counter(
+    "outbound_retries_total", "Retried outbound API calls by provider and reason", ("provider", "reason")
+)
+RETRIES_DENIED = REGISTRY.counter(
+    "outbound_retries_denied_total", "Retries skipped because the global retry budget was spent", ("provider",)
+)
+RATE_LIMIT_WAIT = REGISTRY.histogram(
+    "rate_limiter_wait_seconds", "Time calls waited for the client-side rate limiter", ("provider",)
+)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket that hands out reservations.
+
+    `reserve(amount)` debits the bucket at once and returns how long the
+    caller must wait before going ahead, so waiting happens outside the lock
+    and sync threads and async tasks share one budget. The level may go
+    negative, which queues later callers behind earlier ones; a request
+    larger than the whole bucket still gets through after its wait.
+    """
+
+    def __init__(self, per_second: float, capacity: float):
+        self.per_second = per_second
+        self.capacity = capacity
+        self.level = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float, factor: float = 1.0) -> float:
+        """Debit `amount`; returns the seconds to wait. `factor` scales the refill rate."""
+        with self._lock:
+            now = time.monotonic()
+            rate = self.per_second * factor
+            self.level = min(self.capacity, self.level + (now - self._updated) * rate)
+            self._updated = now
+            self.level -= amount
+            return -self.level / rate if self.level < 0 else 0.0
+
+    def charge(self, amount: float):
+        """Debit `amount` without waiting (e.g. response tokens counted after the call)."""
+        with self._lock:
+            self.level -= amount
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute budgets for one provider.
+
+    Adaptive: a throttled response (429 or a Retry-After hint) pauses every
+    caller until the hinted time and halves the effective rate; each
+    success then restores a little of it, so concurrency settles just under
+    the provider's real quota instead of hammering it. A budget of 0
+    disables that limit.
+    """
+
+    def __init__(self, name: str, requests_per_minute: float = 0, tokens_per_minute: float = 0):
+        self.name = name
+        self.requests = self._bucket(requests_per_minute)
+        self.tokens = self._bucket(tokens_per_minute)
+        self.factor = 1.0
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _bucket(per_minute: float) -> Optional[TokenBucket]:
+        if per_minute <= 0:
+            return None
+        return TokenBucket(per_minute / 60, max(per_minute / 60 * BURST_SECONDS, 1))
+
+    def reserve(self, tokens: int = 0) -> float:
+        """Reserve one request (and `tokens` tokens); returns the seconds to wait before sending it."""
+        with self._lock:
+            factor = self.factor
+            wait = max(self._paused_until - time.monotonic(), 0.0)
+        if self.requests is not None:
+            wait = max(wait, self.requests.reserve(1, factor))
+        if self.tokens is not None and tokens:
+            wait = max(wait, self.tokens.reserve(tokens, factor))
+        return wait
+
+    def acquire(self, tokens: int = 0):
+        """Block the calling thread until the request may be sent."""
+        wait = self.reserve(tokens)
+        RATE_LIMIT_WAIT.observe(wait, provider=self.name)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, tokens: int = 0):
+        """Async counterpart of `acquire`."""
+        wait = self.reserve(tokens)
+        RATE_LIMIT_WAIT.observe(wait, provider=self.name)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def charge(self, tokens: int):
+        if self.tokens is not None and tokens:
+            self.tokens.charge(tokens)
+
+    def throttled(self, retry_after: Optional[float]):
+        with self._lock:
+            self.factor = max(self.factor / 2, MIN_RATE_FACTOR)
+            if retry_after:
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+
+    def succeeded(self):
+        if self.factor < 1.0:
+            with self._lock:
+                self.factor = min(self.factor + ADAPT_STEP, 1.0)
+
+
+class RetryBudget:
+    """
+    Process-wide cap on retries, shared by every provider.
+
+    Each first attempt earns `ratio` of a retry and the balance also refills
+    by `min_per_second`, up to `max_balance`. A retry spends one, so during
+    an outage retries add at most about `ratio` extra load instead of
+    multiplying it by the attempt count.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_per_second: float = 0.5, max_balance: float = 20):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_balance = max_balance
+        self.balance = max_balance
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "RetryBudget":
+        return cls(
+            ratio=float(os.getenv("RETRY_BUDGET_RATIO", "0.2")),
+            min_per_second=float(os.getenv("RETRY_BUDGET_MIN_PER_SECOND", "0.5")),
+            max_balance=float(os.getenv("RETRY_BUDGET_MAX", "20"))
+        )
+
+    def record_attempt(self):
+        with self._lock:
+            self.balance = min(self.balance + self.ratio, self.max_balance)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self.balance = min(self.balance + (now - self._updated) * self.min_per_second, self.max_balance)
+            self._updated = now
+            if self.balance < 1:
+                return False
+            self.balance -= 1
+            return True
+
+
+def status_code(error: BaseException) -> Optional[int]:
+    """HTTP status behind an httpx/requests error or a Google API error, if any."""
+    response = getattr(error, "response", None)
+    code = getattr(response, "status_code", None)
+    if code is None:
+        code = getattr(error, "status_code", None) or getattr(error, "code", None)
+    return code if isinstance(code, int) else None
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Seconds the server asked us to wait, from a Retry-After header or a hint in the message."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("Retry-After") if hasattr(headers, "get") else None
+    if value:
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            try:
+                return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+            except (TypeError, ValueError):
+                pass
+    for pattern in _RETRY_HINTS:
+        match = pattern.search(str(error))
+        if match:
+            return float(match.group(1))
+    return None
+
+
+def retry_reason(error: BaseException) -> Optional[str]:
+    """'throttled', 'server_error' or 'network' for transient errors; None if retrying cannot help."""
+    if isinstance(error, (asyncio.CancelledError, KeyboardInterrupt, DeadlineExceeded)):
+        return None
+    code = status_code(error)
+    if code is None:
+        match = _STATUS_IN_MESSAGE.search(str(error))
+        if match:
+            code = int(match.group(1)) if match.group(1) else (429 if "EXHAUSTED" in match.group(0) else 503)
+    if code is not None:
+        if code == 429:
+            return "throttled"
+        return "server_error" if code in RETRYABLE_STATUS else None
+    if isinstance(error, (TimeoutError, ConnectionError, httpx.TransportError, requests.ConnectionError, requests.Timeout)):
+        return "network"
+    return None
+
+
+class RetryScheduler:
+    """
+    Sends a provider's outbound calls through its rate limiter and retries transient failures.
+
+    Retries use capped exponential backoff with full jitter, never wait less
+    than the server's Retry-After, and each one must be paid for from the
+    shared `RetryBudget`. Errors that retrying cannot fix are raised at once.
+    """
+
+    def __init__(self, limiter: RateLimiter, budget: RetryBudget, max_attempts: int = 3,
+                 base_delay: float = 1.0, max_delay: float = 30.0):
+        self.limiter = limiter
+        self.budget = budget
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @property
+    def name(self) -> str:
+        return self.limiter.name
+
+    def next_delay(self, error: BaseException, attempt: int) -> Optional[float]:
+        """
+        Seconds to wait before retrying after `error`, or None to give up.
+
+        Args:
+            error: Exception raised by attempt number `attempt` (0-based)
+            attempt: Attempts made so far, minus one
+
+        Returns:
+            Backoff delay, or None when the error is permanent, attempts are
+            used up, the request deadline would pass first or the retry
+            budget is spent
+        """
+        reason = retry_reason(error)
+        hinted = retry_after(error)
+        if reason == "throttled" or hinted is not None:
+            self.limiter.throttled(hinted)
+        if reason is None or attempt + 1 >= self.max_attempts:
+            return None
+        delay = max(random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt))), hinted or 0.0)
+        deadline = current_deadline()
+        if deadline is not None and delay >= deadline.remaining():
+            # The retry could not finish before the request deadline anyway
+            return None
+        if not self.budget.try_spend():
+            RETRIES_DENIED.inc(provider=self.name)
+            return None
+        RETRIES.inc(provider=self.name, reason=reason)
+        return delay
+
+    def call(self, fn: Callable[[], Any], tokens: int = 0) -> Any:
+        """
+        Run `fn` under the rate limiter, retrying transient errors (blocking).
+
+        Args:
+            fn: The outbound call
+            tokens: Estimated tokens the call uses, for the tokens-per-minute budget
+
+        Returns:
+            Whatever `fn` returns; the last error is raised when retries stop
+        """
+        self.budget.record_attempt()
+        for attempt in range(self.max_attempts):
+            self.limiter.acquire(tokens)
+            try:
+                result = fn()
+            except Exception as e:
+                delay = self.next_delay(e, attempt)
+                if delay is None:
+                    raise
+                logger.warning("%s call failed (%s); retry %d/%d in %.1fs",
+                               self.name, e, attempt + 1, self.max_attempts - 1, delay)
+                time.sleep(delay)
+                continue
+            self.limiter.succeeded()
+            return result
+
+    async def acall(self, fn: Callable[[], Awaitable[Any]], tokens: int = 0) -> Any:
+        """Async counterpart of `call`; `fn` returns a new awaitable for every attempt."""
+        self.budget.record_attempt()
+        for attempt in range(self.max_attempts):
+            await self.limiter.aacquire(tokens)
+            try:
+                result = await fn()
+            except Exception as e:
+                delay = self.next_delay(e, attempt)
+                if delay is None:
+                    raise
+                logger.warning("%s call failed (%s); retry %d/%d in %.1fs",
+                               self.name, e, attempt + 1, self.max_attempts - 1, delay)
+                await asyncio.sleep(delay)
+                continue
+            self.limiter.succeeded()
+            return result
+
+
+# provider -> (env var, default) for its requests-per-minute and tokens-per-minute budgets (0 = unlimited)
+PROVIDER_LIMITS: Dict[str, Tuple[Tuple[str, str], Optional[Tuple[str, str]]]] = {
+    "gemini": (("GEMINI_RPM", "150"), ("GEMINI_TPM", "2000000")),
+    "serper": (("SERPER_RPM", "300"), None),
+    "serpapi": (("SERPAPI_RPM", "100"), None),
+}
+
+_budget: Optional[RetryBudget] = None
+_schedulers: Dict[str, RetryScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(provider: str) -> RetryScheduler:
+    """
+    Return the process-wide scheduler for `provider`, created from the environment on first use.
+
+    Every client of a provider shares its limiter, and all providers share
+    one retry budget (RETRY_BUDGET_*).
+    """
+    global _budget
+    with _schedulers_lock:
+        scheduler = _schedulers.get(provider)
+        if scheduler is None:
+            if _budget is None:
+                _budget = RetryBudget.from_env()
+            rpm, tpm = PROVIDER_LIMITS.get(provider, (None, None))
+            limiter = RateLimiter(
+                provider,
+                requests_per_minute=float(os.getenv(*rpm)) if rpm else 0,
+                tokens_per_minute=float(os.getenv(*tpm)) if tpm else 0
+            )
+            scheduler = _schedulers[provider] = RetryScheduler(
+                limiter, _budget,
+                max_attempts=int(os.getenv("RETRY_MAX_ATTEMPTS", "3")),
+                base_delay=float(os.getenv("RETRY_BASE_DELAY", "1")),
+                max_delay=float(os.getenv("RETRY_MAX_DELAY", "30"))
+            )
+        return scheduler
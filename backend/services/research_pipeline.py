@@ -0,0 +1,244 @@
+import asyncio
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from logger import logger
+from schemas.request import ResearchRequest
+from schemas.response import ResearchResponse
+from services.deadline import Deadline, deadline_scope
+from services.metrics import REQUEST_SECONDS, trace
+from services.orchestrator import Orchestrator, Stage, StageContext
+from services.search_cache import normalize_query
+from services.singleflight import AsyncSingleFlight
+
+EventCallback = Callable[[str, Dict[str, Any]], None]
+ProgressCallback = Callable[[Dict[str, Dict[str, Any]]], None]
+
+# Under a request deadline, the point (as a share of the budget) by which each stage's
+# fetches and Gemini calls must finish; later stages still get the unused time
+STAGE_DEADLINES = {"research": 0.35, "summaries": 0.6, "synthesis": 0.7, "writer": 0.9, "reviewer": 1.0}
+
+# Identical requests in flight at the same time share one pipeline run
+_research_flight = AsyncSingleFlight()
+_progress_listeners: Dict[Tuple, List[ProgressCallback]] = {}
+_last_progress: Dict[Tuple, Dict[str, Dict[str, Any]]] = {}
+
+
+async def run_pipeline(request: ResearchRequest, agents,
+                       emit: Optional[EventCallback] = None,
+                       on_progress: Optional[ProgressCallback] = None) -> ResearchResponse:
+    """
+    Run the research pipeline as a graph of stages.
+
+    research ─┬─ sources (stream) ─> summaries ─┐
+              └─ research_results ─┬────────────┴─> synthesis ─┐
+                                   └─> tables ──────────────────┴─> analysis ─> writer ─> reviewer
+
+    Sources are summarized as soon as each page is fetched, and the tables
+    are built while the summaries are still being generated. A timing
+    breakdown (stages, fetches, Gemini calls) is added to `agent_logs`
+    under "timings".
+
+    With a deadline (`request.deadline_seconds`, else RESEARCH_DEADLINE_SECONDS)
+    each stage must finish its fetches and Gemini calls by its share of the
+    budget in STAGE_DEADLINES. Pages and summaries still pending then are
+    dropped and listed in `dropped_sources`; the analysis, draft and review
+    fall back to what is available instead of failing.
+
+    Args:
+        request: Research request with topic, number of results, and report style
+        agents: Shared agents (see dependencies.AgentContainer)
+        emit: Optional callback receiving (event, data) for incremental progress;
+            when given, the writer and reviewer stream their output token by token
+        on_progress: Optional callback receiving `agent_logs` whenever an agent
+            starts or completes
+
+    Returns:
+        Research response with all agent outputs
+    """
+    start_time = time.perf_counter()
+    agent_logs = {}
+    deadline_seconds = request.deadline_seconds or float(os.getenv("RESEARCH_DEADLINE_SECONDS", "0"))
+    deadline = Deadline(deadline_seconds) if deadline_seconds > 0 else None
+
+    def set_stage(stage: str, log: Dict[str, Any]):
+        agent_logs[stage] = log
+        if on_progress is not None:
+            on_progress(agent_logs)
+
+    def send(event: str, data: Dict[str, Any]):
+        if emit is not None:
+            emit(event, data)
+
+    logger.info("Research request: topic=%r num_results=%d style=%s", request.topic, request.num_results, request.report_style)
+    logger.debug("Incoming request payload: %s", request)
+
+    async def research(ctx: StageContext) -> Dict[str, Any]:
+        set_stage("research", {"status": "running"})
+        logger.info("Running ResearchAgent")
+
+        def on_result(index: int, result: Dict[str, Any]):
+            # The full page text stays server-side
+            send("source", {"index": index, "result": {k: v for k, v in result.items() if k != "fetched_text"}})
+            ctx.publish("sources", (index, result))
+
+        research_results = await agents.research_agent.aresearch(
+            request.topic, request.num_results,
+            on_search=(lambda results: send("search", {"results": results})) if emit is not None else None,
+            on_result=on_result
+        )
+        logger.info("Research completed. Results found: %d", len(research_results))
+        set_stage("research", {
+            "status": "completed",
+            "results_count": len(research_results)
+        })
+        send("research", agent_logs["research"])
+        return {"research_results": research_results}
+
+    async def summaries(ctx: StageContext) -> Dict[str, Any]:
+        set_stage("analysis", {"status": "running"})
+        logger.info("Running AnalysisAgent")
+        return {"summaries": await agents.analysis_agent.asummarize_incrementally(ctx.stream("sources"))}
+
+    async def tables(ctx: StageContext) -> Dict[str, Any]:
+        tables = await asyncio.to_thread(agents.analysis_agent.generate_tables, ctx.inputs["research_results"])
+        # The tables are ready long before the synthesis the `analysis` event waits for
+        send("tables", {"analysis_tables": tables})
+        return {"analysis_tables": tables}
+
+    async def synthesis(ctx: StageContext) -> Dict[str, Any]:
+        summary = await agents.analysis_agent.asynthesize(ctx.inputs["research_results"], ctx.inputs["summaries"])
+        return {"analysis_summary": summary}
+
+    async def analysis(ctx: StageContext) -> Dict[str, Any]:
+        analysis_output = {
+            "analysis_summary": ctx.inputs["analysis_summary"],
+            "analysis_tables": ctx.inputs["analysis_tables"]
+        }
+        logger.info("Analysis completed")
+        set_stage("analysis", {
+            "status": "completed",
+            "summary_length": len(analysis_output["analysis_summary"]),
+            "tables_count": len(analysis_output["analysis_tables"])
+        })
+        send("analysis", analysis_output)
+        return {"analysis_output": analysis_output}
+
+    async def writer(ctx: StageContext) -> Dict[str, Any]:
+        set_stage("writer", {"status": "running"})
+        logger.info("Running WriterAgent")
+        prompt_usage = {}
+        draft_report = await agents.writer_agent.awrite_report(
+            ctx.inputs["analysis_output"], request.report_style,
+            on_token=(lambda text: send("draft_token", {"text": text})) if emit is not None else None,
+            on_prompt_usage=prompt_usage.update
+        )
+        logger.info("Draft report generated. Length: %d characters", len(draft_report))
+        set_stage("writer", {
+            "status": "completed",
+            "draft_length": len(draft_report),
+            "prompt_tokens": prompt_usage
+        })
+        send("draft", {"draft_report": draft_report})
+        return {"draft_report": draft_report}
+
+    async def reviewer(ctx: StageContext) -> Dict[str, Any]:
+        set_stage("reviewer", {"status": "running"})
+        logger.info("Running ReviewerAgent")
+        prompt_usage = {}
+        review_output = await agents.reviewer_agent.areview_report(
+            ctx.inputs["draft_report"],
+            on_token=(lambda text: send("review_token", {"text": text})) if emit is not None else None,
+            on_prompt_usage=prompt_usage.update
+        )
+        logger.info("Review completed")
+        set_stage("reviewer", {
+            "status": "completed",
+            "final_report_length": len(review_output.get("final_report", "")),
+            "review_notes_length": len(review_output.get("review_notes", "")),
+            "prompt_tokens": prompt_usage
+        })
+        return {"review_output": review_output}
+
+    def budgeted(name: str, run):
+        """Run the stage under its share of the request deadline."""
+        if deadline is None or name not in STAGE_DEADLINES:
+            return run
+
+        async def run_within(ctx: StageContext) -> Dict[str, Any]:
+            with deadline_scope(deadline.until(STAGE_DEADLINES[name])):
+                return await run(ctx)
+        return run_within
+
+    orchestrator = Orchestrator([
+        Stage("research", budgeted("research", research), outputs=["research_results"], streams=["sources"]),
+        Stage("summaries", budgeted("summaries", summaries), consumes=["sources"], outputs=["summaries"]),
+        Stage("tables", tables, inputs=["research_results"], outputs=["analysis_tables"]),
+        Stage("synthesis", budgeted("synthesis", synthesis), inputs=["research_results", "summaries"], outputs=["analysis_summary"]),
+        Stage("analysis", analysis, inputs=["analysis_summary", "analysis_tables"], outputs=["analysis_output"]),
+        Stage("writer", budgeted("writer", writer), inputs=["analysis_output"], outputs=["draft_report"]),
+        Stage("reviewer", budgeted("reviewer", reviewer), inputs=["draft_report"], outputs=["review_output"]),
+    ])
+    # Fetches and Gemini calls made by the stages are recorded in the request trace
+    with trace() as request_trace:
+        try:
+            values = await orchestrator.run()
+        except BaseException:
+            REQUEST_SECONDS.observe(time.perf_counter() - start_time, outcome="error")
+            raise
+
+    # Calculate total processing time
+    processing_time = time.perf_counter() - start_time
+    REQUEST_SECONDS.observe(processing_time, outcome="ok")
+    logger.info("Total processing time: %.2f seconds", processing_time)
+    set_stage("timings", request_trace.summary())
+
+    analysis_output = values["analysis_output"]
+    review_output = values["review_output"]
+    return ResearchResponse(
+        research_results=values["research_results"],
+        analysis_summary=analysis_output["analysis_summary"],
+        analysis_tables=analysis_output["analysis_tables"],
+        draft_report=values["draft_report"],
+        final_report=review_output["final_report"],
+        review_notes=review_output["review_notes"],
+        processing_time=processing_time,
+        agent_logs=agent_logs,
+        dropped_sources=deadline.dropped if deadline is not None else []
+    )
+
+
+async def run_coalesced(request: ResearchRequest, agents,
+                        on_progress: Optional[ProgressCallback] = None) -> ResearchResponse:
+    """
+    Run the pipeline once for identical concurrent requests.
+
+    Requests match on normalized topic, number of results, report style and deadline.
+    Every caller receives the shared result and the shared stage progress.
+    """
+    key = (normalize_query(request.topic), request.num_results, request.report_style, request.deadline_seconds)
+
+    if on_progress is not None:
+        _progress_listeners.setdefault(key, []).append(on_progress)
+        if key in _last_progress:
+            on_progress(_last_progress[key])
+
+    def fan_out(agent_logs: Dict[str, Dict[str, Any]]):
+        _last_progress[key] = agent_logs
+        for listener in list(_progress_listeners.get(key, [])):
+            listener(agent_logs)
+
+    async def run() -> ResearchResponse:
+        try:
+            return await run_pipeline(request, agents, on_progress=fan_out)
+        finally:
+            _last_progress.pop(key, None)
+
+    try:
+        return await _research_flight.do(key, run)
+    finally:
+        if on_progress is not None:
+            listeners = _progress_listeners[key]
+            listeners.remove(on_progress)
+            if not listeners:
+                del _progress_listeners[key]
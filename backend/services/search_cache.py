@@ -0,0 +1,99 @@
+import os
+import re
+from typing import Any, Dict, List, Optional
+from services.cache import MemoryCache, SQLiteCache
+
+
+class CachedSearchService:
+    """
+    Caching wrapper around a search provider (SerperService / SerpApiService).
+
+    Entries are keyed on provider and normalized query. Each entry remembers
+    how many results were requested, so a cached search for 10 results also
+    answers later requests for 5. The in-memory LRU is checked first, then
+    the optional SQLite tier.
+    """
+
+    def __init__(self, service, provider: str, memory: MemoryCache, disk: Optional[SQLiteCache] = None):
+        self.service = service
+        self.provider = provider
+        self.memory = memory
+        self.disk = disk
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls, service, provider: str) -> "CachedSearchService":
+        ttl = float(os.getenv("SEARCH_CACHE_TTL", "3600"))
+        memory = MemoryCache(
+            max_entries=int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "512")),
+            ttl=ttl,
+            max_bytes=int(os.getenv("SEARCH_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+        )
+        path = os.getenv("SEARCH_CACHE_PATH")
+        disk = SQLiteCache(path, ttl=ttl, table="search_cache") if path else None
+        return cls(service, provider, memory, disk)
+
+    def search(self, query: str, num_results: int = 5) -> List[Dict[str, Any]]:
+        key = self._key(query)
+        cached = self._lookup(key, num_results)
+        if cached is not None:
+            return cached
+
+        results = self.service.search(query, num_results)
+        self._store(key, num_results, results)
+        return results
+
+    async def asearch(self, query: str, num_results: int = 5) -> List[Dict[str, Any]]:
+        key = self._key(query)
+        cached = self._lookup(key, num_results)
+        if cached is not None:
+            return cached
+
+        results = await self.service.asearch(query, num_results)
+        self._store(key, num_results, results)
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats() if self.disk else None
+        }
+
+    def _key(self, query: str) -> str:
+        return f"{self.provider}:{normalize_query(query)}"
+
+    def _lookup(self, key: str, num_results: int) -> Optional[List[Dict[str, Any]]]:
+        entry = self.memory.get(key)
+        if entry is None and self.disk is not None:
+            entry = self.disk.get(key)
+            if entry is not None:
+                self.memory.set(key, entry)
+
+        # A larger cached request, or one the provider could not fill, covers this one
+        if entry is not None and (
+            entry["num_results"] >= num_results or len(entry["results"]) < entry["num_results"]
+        ):
+            self.hits += 1
+            return [dict(result) for result in entry["results"][:num_results]]
+
+        self.misses += 1
+        return None
+
+    def _store(self, key: str, num_results: int, results: List[Dict[str, Any]]):
+        entry = {"num_results": num_results, "results": [dict(result) for result in results]}
+        self.memory.set(key, entry)
+        if self.disk is not None:
+            self.disk.set(key, entry)
+
+    def __getattr__(self, name):
+        # Anything else (endpoint, api_key, ...) comes from the wrapped provider
+        return getattr(self.service, name)
+
+
+def normalize_query(query: str) -> str:
+    """Case-fold, collapse whitespace and trim surrounding punctuation."""
+    query = " ".join(query.casefold().split())
+    return re.sub(r"^[^\w]+|[^\w]+$", "", query)
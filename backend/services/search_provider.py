@@ -1,6 +1,7 @@
 import os
 from services.serper_service import SerperService
 from services.serpapi_service import SerpApiService
+from services.search_cache import CachedSearchService
 
 class SearchProviderFactory:
     @staticmethod
@@ -8,8 +9,12 @@ class SearchProviderFactory:
         provider = os.getenv("SEARCH_PROVIDER", "serper").lower()
 
         if provider == "serpapi":
-            return SerpApiService()
+            service = SerpApiService()
         elif provider == "serper":
-            return SerperService()
+            service = SerperService()
         else:
             raise ValueError(f"Unsupported SEARCH_PROVIDER: {provider}")
+
+        if os.getenv("SEARCH_CACHE_ENABLED", "true").lower() in ("1", "true", "yes"):
+            return CachedSearchService.from_env(service, provider)
+        return service
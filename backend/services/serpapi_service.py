@@ -1,42 +1,75 @@
 import os
-import requests
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from urllib.parse import urlparse
+from services.http_client import config as http_config, get_async_client, get_session
+from services.hedging import Hedger
+from services.rate_limiter import RetryScheduler, get_scheduler
 
 class SerpApiService:
-    def __init__(self):
+    def __init__(self, scheduler: Optional[RetryScheduler] = None):
         self.api_key = os.getenv("SERPAPI_API_KEY")
         if not self.api_key:
             raise ValueError("SERPAPI_API_KEY environment variable not set")
         
         self.endpoint = "https://serpapi.com/search"
+        
+        # Shared rate limit (SERPAPI_RPM) and retries of 429s, 5xx and network errors
+        self.scheduler = scheduler or get_scheduler("serpapi")
+        
+        # Optional duplicate of async searches slower than the recent p95 (HEDGE_SEARCH)
+        self.hedger = Hedger.from_env("serpapi", "HEDGE_SEARCH")
 
     def search(self, query: str, num_results: int = 5) -> List[Dict[str, Any]]:
-        params = {
-            "q": query,
-            "api_key": self.api_key
-        }
+        params = self._build_params(query)
+
+        def send():
+            # Raised inside the scheduled call, so a 429 or 5xx is retried
+            response = get_session().get(self.endpoint, params=params, timeout=http_config.timeout)
+            response.raise_for_status()
+            return response
 
         try:
-            response = requests.get(self.endpoint, params=params)
+            response = self.scheduler.call(send)
+            return self._format_results(response.json(), num_results)
+
+        except Exception as e:
+            raise Exception(f"SerpApi search failed: {str(e)}")
+
+    async def asearch(self, query: str, num_results: int = 5) -> List[Dict[str, Any]]:
+        """Async variant of `search` that does not block the event loop."""
+        params = self._build_params(query)
+
+        async def send():
+            response = await get_async_client().get(self.endpoint, params=params)
             response.raise_for_status()
-            results = response.json()
-
-            organic_results = results.get("organic_results", [])
-            formatted_results = []
-
-            for result in organic_results[:num_results]:
-                url = result.get("link", "")
-                domain = urlparse(url).netloc if url else ""
-                formatted_results.append({
-                    "title": result.get("title", ""),
-                    "url": url,
-                    "snippet": result.get("snippet", ""),
-                    "published_date": result.get("date", ""),  # may be missing often
-                    "domain": domain
-                })
-            
-            return formatted_results
+            return response
+
+        try:
+            response = await self.hedger.run(lambda: self.scheduler.acall(send))
+            return self._format_results(response.json(), num_results)
 
         except Exception as e:
             raise Exception(f"SerpApi search failed: {str(e)}")
+
+    def _build_params(self, query: str) -> Dict[str, str]:
+        return {
+            "q": query,
+            "api_key": self.api_key
+        }
+
+    def _format_results(self, results: Dict[str, Any], num_results: int) -> List[Dict[str, Any]]:
+        organic_results = results.get("organic_results", [])
+        formatted_results = []
+
+        for result in organic_results[:num_results]:
+            url = result.get("link", "")
+            domain = urlparse(url).netloc if url else ""
+            formatted_results.append({
+                "title": result.get("title", ""),
+                "url": url,
+                "snippet": result.get("snippet", ""),
+                "published_date": result.get("date", ""),  # may be missing often
+                "domain": domain
+            })
+        
+        return formatted_results
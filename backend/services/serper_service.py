@@ -1,17 +1,57 @@
 import os
 import json
-import requests
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+from services.http_client import config as http_config, get_async_client, get_session
+from services.hedging import Hedger
+from services.rate_limiter import RetryScheduler, get_scheduler
 
 class SerperService:
-    def __init__(self):
+    def __init__(self, scheduler: Optional[RetryScheduler] = None):
         self.api_key = os.getenv("SERPER_API_KEY")
         if not self.api_key:
             raise ValueError("SERPER_API_KEY environment variable not set")
         
         self.endpoint = "https://google.serper.dev/search"
+        
+        # Shared rate limit (SERPER_RPM) and retries of 429s, 5xx and network errors
+        self.scheduler = scheduler or get_scheduler("serper")
+        
+        # Optional duplicate of async searches slower than the recent p95 (HEDGE_SEARCH)
+        self.hedger = Hedger.from_env("serper", "HEDGE_SEARCH")
 
     def search(self, query: str, num_results: int = 5) -> List[Dict[str, Any]]:
+        headers, payload = self._build_request(query, num_results)
+
+        def send():
+            # Raised inside the scheduled call, so a 429 or 5xx is retried
+            response = get_session().post(self.endpoint, headers=headers, json=payload, timeout=http_config.timeout)
+            response.raise_for_status()
+            return response
+
+        try:
+            response = self.scheduler.call(send)
+            return self._format_results(response.json(), num_results)
+
+        except Exception as e:
+            raise Exception(f"Serper.dev search failed: {str(e)}")
+
+    async def asearch(self, query: str, num_results: int = 5) -> List[Dict[str, Any]]:
+        """Async variant of `search` that does not block the event loop."""
+        headers, payload = self._build_request(query, num_results)
+
+        async def send():
+            response = await get_async_client().post(self.endpoint, headers=headers, json=payload)
+            response.raise_for_status()
+            return response
+
+        try:
+            response = await self.hedger.run(lambda: self.scheduler.acall(send))
+            return self._format_results(response.json(), num_results)
+
+        except Exception as e:
+            raise Exception(f"Serper.dev search failed: {str(e)}")
+
+    def _build_request(self, query: str, num_results: int):
         headers = {
             "X-API-KEY": self.api_key,
             "Content-Type": "application/json"
@@ -21,25 +61,19 @@ class SerperService:
             "q": query,
             "num": num_results
         }
+        return headers, payload
 
-        try:
-            response = requests.post(self.endpoint, headers=headers, json=payload)
-            response.raise_for_status()
-            results = response.json()
-
-            organic_results = results.get("organic", [])
-            formatted_results = []
-
-            for result in organic_results[:num_results]:
-                formatted_results.append({
-                    "title": result.get("title", ""),
-                    "url": result.get("link", ""),
-                    "snippet": result.get("snippet", ""),
-                    "published_date": result.get("date", ""),
-                    "domain": result.get("source", "")
-                })
-            
-            return formatted_results
+    def _format_results(self, results: Dict[str, Any], num_results: int) -> List[Dict[str, Any]]:
+        organic_results = results.get("organic", [])
+        formatted_results = []
 
-        except Exception as e:
-            raise Exception(f"Serper.dev search failed: {str(e)}")
+        for result in organic_results[:num_results]:
+            formatted_results.append({
+                "title": result.get("title", ""),
+                "url": result.get("link", ""),
+                "snippet": result.get("snippet", ""),
+                "published_date": result.get("date", ""),
+                "domain": result.get("source", "")
+            })
+        
+        return formatted_results
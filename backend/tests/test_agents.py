@@ -1,12 +1,12 @@
 import pytest
-from unittest.mock import Mock, patch
+from unittest.mock import AsyncMock, Mock, patch
 from agents.research_agent import ResearchAgent
 from agents.analysis_agent import AnalysisAgent
 from agents.writer_agent import WriterAgent
-from agents.reviewer_agent import ReviewerAgent
+from agents.reviewer_agent import UNCHANGED, ReviewerAgent
 
 class TestResearchAgent:
-    @patch('agents.research_agent.SerpApiService')
+    @patch('agents.research_agent.SerperService')
     @patch('agents.research_agent.ContentFetcher')
     def test_research(self, mock_fetcher, mock_serp):
         # Setup mocks
@@ -38,6 +38,192 @@ class TestResearchAgent:
         assert results[0]["content_preview"] == "This is a preview of the content"
         assert results[0]["fetched_text_length"] == 100
 
+    @patch('agents.research_agent.SerperService')
+    @patch('agents.research_agent.ContentFetcher')
+    def test_research_concurrent_keeps_search_order(self, mock_fetcher, mock_serp):
+        import time
+
+        urls = [f"https://site{i % 2}.example.com/{i}" for i in range(6)]
+        mock_serp.return_value.search.return_value = [
+            {"title": f"Result {i}", "url": url, "snippet": "", "published_date": "", "domain": ""}
+            for i, url in enumerate(urls)
+        ]
+
+        def fake_fetch(url):
+            # Earlier URLs finish last
+            time.sleep(0.05 * (6 - int(url.rsplit("/", 1)[1])))
+            return {"content_preview": url, "fetched_text": url, "fetched_text_length": len(url)}
+
+        mock_fetcher.return_value.fetch_content.side_effect = fake_fetch
+
+        agent = ResearchAgent(max_concurrency=4, per_domain_limit=2)
+        results = agent.research("test topic", 6)
+
+        assert [r["url"] for r in results] == urls
+        assert [r["content_preview"] for r in results] == urls
+
+    @patch('agents.research_agent.SerperService')
+    @patch('agents.research_agent.ContentFetcher')
+    def test_busy_host_does_not_hold_global_slots(self, mock_fetcher, mock_serp):
+        import time
+
+        # The first URLs all share one host; the last one is elsewhere
+        urls = [f"https://busy.example.com/{i}" for i in range(4)] + ["https://other.example.com/0"]
+        mock_serp.return_value.search.return_value = [
+            {"title": "", "url": url, "snippet": "", "published_date": "", "domain": ""}
+            for url in urls
+        ]
+
+        started = {}
+        t0 = time.monotonic()
+
+        def fake_fetch(url):
+            started[url] = time.monotonic() - t0
+            time.sleep(0.1)
+            return {"content_preview": url, "fetched_text": url, "fetched_text_length": len(url)}
+
+        mock_fetcher.return_value.fetch_content.side_effect = fake_fetch
+
+        agent = ResearchAgent(max_concurrency=2, per_domain_limit=1)
+        results = agent.research("test topic", 5)
+
+        assert [r["url"] for r in results] == urls
+        # The other host starts right away instead of queueing behind the busy one
+        assert started["https://other.example.com/0"] < 0.05
+
+    @pytest.mark.asyncio
+    @patch('agents.research_agent.SerperService')
+    @patch('agents.research_agent.ContentFetcher')
+    async def test_aresearch(self, mock_fetcher, mock_serp):
+        import asyncio
+
+        urls = [f"https://example{i}.com/page" for i in range(3)]
+        mock_serp.return_value.asearch = AsyncMock(return_value=[
+            {"title": f"Result {i}", "url": url, "snippet": "", "published_date": "", "domain": ""}
+            for i, url in enumerate(urls)
+        ])
+
+        async def fake_fetch(url):
+            await asyncio.sleep(0.01)
+            return {"content_preview": url, "fetched_text": url, "fetched_text_length": len(url)}
+
+        mock_fetcher.return_value.afetch_content.side_effect = fake_fetch
+
+        agent = ResearchAgent()
+        results = await agent.aresearch("test topic", 3)
+
+        assert [r["url"] for r in results] == urls
+        assert [r["content_preview"] for r in results] == urls
+
+    @pytest.mark.asyncio
+    @patch('agents.research_agent.SerperService')
+    @patch('agents.research_agent.ContentFetcher')
+    async def test_aresearch_drops_pages_past_the_deadline(self, mock_fetcher, mock_serp):
+        import asyncio
+        from services.deadline import Deadline, deadline_scope
+
+        urls = ["https://fast.example.com/page", "https://slow.example.com/page"]
+        mock_serp.return_value.asearch = AsyncMock(return_value=[
+            {"title": f"Result {i}", "url": url, "snippet": "", "published_date": "", "domain": ""}
+            for i, url in enumerate(urls)
+        ])
+
+        async def fake_fetch(url):
+            await asyncio.sleep(5 if "slow" in url else 0.01)
+            return {"content_preview": url, "fetched_text": url, "fetched_text_length": len(url)}
+
+        mock_fetcher.return_value.afetch_content.side_effect = fake_fetch
+
+        deadline = Deadline(0.2)
+        with deadline_scope(deadline):
+            results = await ResearchAgent().aresearch("test topic", 2)
+
+        assert [r["url"] for r in results] == urls
+        assert results[0]["content_preview"] == urls[0]
+        assert results[1]["content_preview"] == ResearchAgent.DROPPED_CONTENT["content_preview"]
+        assert deadline.dropped == [{"url": urls[1], "title": "Result 1", "stage": "fetch"}]
+
+    @pytest.mark.asyncio
+    @patch('agents.research_agent.SerperService')
+    @patch('agents.research_agent.ContentFetcher')
+    async def test_aresearch_overfetch_fills_with_meaningful_pages(self, mock_fetcher, mock_serp):
+        import asyncio
+
+        # Two login walls, two good pages, one slow page and one more good page
+        kinds = ["wall", "good", "wall", "good", "slow", "good"]
+        urls = [f"https://site{i}.example.com/{kind}" for i, kind in enumerate(kinds)]
+        mock_serp.return_value.asearch = AsyncMock(return_value=[
+            {"title": f"Result {i}", "url": url, "snippet": "", "published_date": "", "domain": ""}
+            for i, url in enumerate(urls)
+        ])
+        cancelled = []
+
+        async def fake_fetch(url):
+            try:
+                await asyncio.sleep(5 if url.endswith("slow") else 0.01)
+            except asyncio.CancelledError:
+                cancelled.append(url)
+                raise
+            text = "" if url.endswith("wall") else "Article text. " * 50
+            return {"content_preview": url, "fetched_text": text, "fetched_text_length": len(text)}
+
+        mock_fetcher.return_value.afetch_content.side_effect = fake_fetch
+        arrived = []
+
+        agent = ResearchAgent(overfetch=2)
+        results = await agent.aresearch("test topic", 3, on_result=lambda index, result: arrived.append(index))
+
+        mock_serp.return_value.asearch.assert_awaited_once_with("test topic", 6)
+        assert [r["url"] for r in results] == [urls[1], urls[3], urls[5]]
+        assert all(r["fetched_text_length"] > 500 for r in results)
+        # The slow page was no longer needed
+        assert cancelled == [urls[4]]
+        assert 4 not in arrived
+
+    @patch('agents.research_agent.SerperService')
+    @patch('agents.research_agent.ContentFetcher')
+    def test_research_overfetch_keeps_requested_count(self, mock_fetcher, mock_serp):
+        urls = [f"https://site{i}.example.com/{i}" for i in range(4)]
+        mock_serp.return_value.search.return_value = [
+            {"title": f"Result {i}", "url": url, "snippet": "", "published_date": "", "domain": ""}
+            for i, url in enumerate(urls)
+        ]
+
+        def fake_fetch(url):
+            # Only the last page is meaningful
+            text = "Article text. " * 50 if url.endswith("3") else "Sign in"
+            return {"content_preview": url, "fetched_text": text, "fetched_text_length": len(text)}
+
+        mock_fetcher.return_value.fetch_content.side_effect = fake_fetch
+
+        results = ResearchAgent(overfetch=2).research("test topic", 2)
+
+        mock_serp.return_value.search.assert_called_once_with("test topic", 4)
+        # The meaningful page is kept and the other place goes to the first result
+        assert [r["url"] for r in results] == [urls[0], urls[3]]
+
+    @pytest.mark.asyncio
+    @patch('agents.research_agent.SerperService')
+    @patch('agents.research_agent.ContentFetcher')
+    async def test_aresearch_starts_hosts_in_turn(self, mock_fetcher, mock_serp):
+        urls = [f"https://busy.example.com/{i}" for i in range(3)] + ["https://other.example.com/0"]
+        mock_serp.return_value.asearch = AsyncMock(return_value=[
+            {"title": "", "url": url, "snippet": "", "published_date": "", "domain": ""} for url in urls
+        ])
+        started = []
+
+        async def fake_fetch(url):
+            started.append(url)
+            return {"content_preview": url, "fetched_text": url, "fetched_text_length": len(url)}
+
+        mock_fetcher.return_value.afetch_content.side_effect = fake_fetch
+
+        results = await ResearchAgent(max_concurrency=2).aresearch("test topic", 4)
+
+        assert [r["url"] for r in results] == urls
+        # The other host does not wait behind the busy host's later URLs
+        assert started.index("https://other.example.com/0") == 1
+
 class TestAnalysisAgent:
     @patch('agents.analysis_agent.GeminiService')
     def test_analyze(self, mock_gemini):
@@ -54,7 +240,7 @@ class TestAnalysisAgent:
                 "title": "Test Result 1",
                 "snippet": "This is a test snippet",
                 "content_preview": "This is a preview of the content",
-                "fetched_text_length": 100
+                "fetched_text_length": 600
             }
         ]
         
@@ -70,14 +256,209 @@ class TestAnalysisAgent:
         assert "keyword_frequency" in result["analysis_tables"]
         assert "source_summaries" in result["analysis_tables"]
 
+    @patch('agents.analysis_agent.GeminiService')
+    def test_concurrent_summaries_isolate_failures(self, mock_gemini):
+        def fake_generate(prompt):
+            if "https://example.com/bad" in prompt:
+                raise Exception("quota exceeded")
+            if "summarized research findings" in prompt:
+                return prompt
+            return "summary of " + prompt.split("URL: ")[1].split()[0]
+
+        mock_gemini.return_value.generate_text.side_effect = fake_generate
+
+        research_results = [
+            {"url": f"https://example.com/{name}", "title": name, "snippet": "",
+             "content_preview": "preview", "fetched_text_length": 600}
+            for name in ("a", "bad", "b")
+        ]
+
+        agent = AnalysisAgent(summary_mode="concurrent", max_concurrency=3)
+        result = agent.analyze(research_results)
+
+        summary = result["analysis_summary"]
+        assert "a: summary of https://example.com/a" in summary
+        assert "b: summary of https://example.com/b" in summary
+        assert summary.index("a: summary") < summary.index("b: summary")
+        assert "bad:" not in summary
+
+    @patch('agents.analysis_agent.GeminiService')
+    def test_batched_summaries_fall_back_per_source(self, mock_gemini):
+        mock_gemini.return_value.generate_text.side_effect = [
+            '[{"url": "https://example.com/a", "summary": "batched a"}]',
+            "individual b",
+            "overall analysis",
+        ]
+
+        research_results = [
+            {"url": f"https://example.com/{name}", "title": name, "snippet": "",
+             "content_preview": "preview", "fetched_text_length": 600}
+            for name in ("a", "b")
+        ]
+
+        agent = AnalysisAgent(summary_mode="batched")
+        result = agent.analyze(research_results)
+
+        assert result["analysis_summary"] == "overall analysis"
+        combine_prompt = mock_gemini.return_value.generate_text.call_args_list[-1][0][0]
+        assert "a: batched a" in combine_prompt
+        assert "b: individual b" in combine_prompt
+
+    @pytest.mark.asyncio
+    @patch('agents.analysis_agent.GeminiService')
+    async def test_aanalyze_concurrent_is_bounded(self, mock_gemini):
+        import asyncio
+
+        in_flight = {"now": 0, "max": 0}
+
+        async def fake_generate(prompt):
+            if "summarized research findings" in prompt:
+                return prompt
+            if "https://example.com/bad" in prompt:
+                raise Exception("quota exceeded")
+            in_flight["now"] += 1
+            in_flight["max"] = max(in_flight["max"], in_flight["now"])
+            await asyncio.sleep(0.01)
+            in_flight["now"] -= 1
+            return "summary of " + prompt.split("URL: ")[1].split()[0]
+
+        mock_gemini.return_value.agenerate_text = AsyncMock(side_effect=fake_generate)
+
+        names = ["a", "bad", "b", "c", "d", "e"]
+        research_results = [
+            {"url": f"https://example.com/{name}", "title": name, "snippet": "",
+             "content_preview": "preview", "fetched_text_length": 600}
+            for name in names
+        ]
+
+        agent = AnalysisAgent(summary_mode="concurrent", max_concurrency=2)
+        result = await agent.aanalyze(research_results)
+
+        summary = result["analysis_summary"]
+        positions = [summary.index(f"{name}: summary") for name in names if name != "bad"]
+        assert positions == sorted(positions)
+        assert "bad:" not in summary
+        assert in_flight["max"] == 2
+
+    @pytest.mark.asyncio
+    @patch('agents.analysis_agent.GeminiService')
+    async def test_aanalyze_batched_falls_back_with_bounded_fan_out(self, mock_gemini):
+        import asyncio
+
+        in_flight = {"now": 0, "max": 0}
+
+        async def fake_generate(prompt):
+            if "Summarize each of the following documents" in prompt:
+                return '[{"url": "https://example.com/a", "summary": "batched a"}]'
+            if "summarized research findings" in prompt:
+                return prompt
+            in_flight["now"] += 1
+            in_flight["max"] = max(in_flight["max"], in_flight["now"])
+            await asyncio.sleep(0.01)
+            in_flight["now"] -= 1
+            return "individual " + prompt.split("URL: ")[1].split()[0]
+
+        mock_gemini.return_value.agenerate_text = AsyncMock(side_effect=fake_generate)
+
+        names = ["a", "b", "c", "d", "e"]
+        research_results = [
+            {"url": f"https://example.com/{name}", "title": name, "snippet": "",
+             "content_preview": "preview", "fetched_text_length": 600}
+            for name in names
+        ]
+
+        agent = AnalysisAgent(summary_mode="batched", max_concurrency=2)
+        result = await agent.aanalyze(research_results)
+
+        summary = result["analysis_summary"]
+        assert "a: batched a" in summary
+        for name in names[1:]:
+            assert f"{name}: individual https://example.com/{name}" in summary
+        assert in_flight["max"] == 2
+
+    @pytest.mark.asyncio
+    @patch('agents.analysis_agent.GeminiService')
+    async def test_asummarize_incrementally_starts_before_research_ends(self, mock_gemini):
+        import asyncio
+
+        summarized = []
+
+        async def fake_generate(prompt):
+            title = prompt.split("Title: ")[1].split()[0]
+            summarized.append(title)
+            return f"summary of {title}"
+
+        mock_gemini.return_value.agenerate_text = AsyncMock(side_effect=fake_generate)
+        more_sources = asyncio.Event()
+
+        async def sources():
+            # Pages land out of search order; the login wall is skipped
+            yield 2, {"url": "https://example.com/c", "title": "c", "content_preview": "", "fetched_text_length": 600}
+            yield 1, {"url": "https://example.com/b", "title": "b", "content_preview": "", "fetched_text_length": 10}
+            await more_sources.wait()
+            yield 0, {"url": "https://example.com/a", "title": "a", "content_preview": "", "fetched_text_length": 600}
+
+        agent = AnalysisAgent(summary_mode="concurrent", max_concurrency=2)
+        task = asyncio.create_task(agent.asummarize_incrementally(sources()))
+        await asyncio.sleep(0.01)
+        assert summarized == ["c"]
+
+        more_sources.set()
+        summaries = await task
+
+        assert [s["title"] for s in summaries] == ["a", "c"]
+        assert summaries[0]["summary"] == "summary of a"
+
+    @patch('agents.analysis_agent.GeminiService')
+    def test_generate_tables_from_full_text(self, mock_gemini):
+        results = [
+            {"title": "A", "url": "https://a.example.com/1", "snippet": "x" * 120, "domain": "a.example.com",
+             "content_preview": "preview only", "fetched_text": "The battery market and solar battery",
+             "fetched_text_length": 600},
+            {"title": "B", "url": "https://a.example.com/2", "snippet": "short", "domain": "a.example.com",
+             "content_preview": "", "fetched_text": "Solar wind turbine.", "fetched_text_length": 700},
+            {"title": "C", "url": "https://b.example.com/3", "snippet": "login", "domain": "",
+             "content_preview": "Sign in", "fetched_text": "Sign in to continue", "fetched_text_length": 20},
+        ]
+
+        agent = AnalysisAgent()
+        tables = agent.generate_tables(results)
+
+        assert tables["research_overview"][0]["Snippet"] == "x" * 100 + "..."
+        assert [r["Content Status"] for r in tables["research_overview"]] == ["Accessible", "Accessible", "Limited/Behind Login"]
+
+        # Counted over the full text of accessible sources; stopwords and short words dropped
+        frequency = {r["Keyword"]: r["Count"] for r in tables["keyword_frequency"]}
+        assert frequency == {"battery": 2, "solar": 2, "market": 1, "wind": 1, "turbine": 1}
+
+        # "solar" is in every source, so source-specific terms rank above it
+        tfidf = [r["Keyword"] for r in tables["keyword_tfidf"]]
+        assert tfidf.index("battery") < tfidf.index("solar")
+        assert next(r for r in tables["keyword_tfidf"] if r["Keyword"] == "solar")["Sources"] == 2
+
+        assert tables["domain_summary"] == [
+            {"Domain": "a.example.com", "Sources": 2, "Accessible": 2, "Average Content Length": 650},
+            {"Domain": "b.example.com", "Sources": 1, "Accessible": 0, "Average Content Length": 20},
+        ]
+        assert [s["title"] for s in tables["source_summaries"]] == ["A", "B"]
+        assert all("fetched_text" not in s for s in tables["source_summaries"])
+
+    @patch('agents.analysis_agent.GeminiService')
+    def test_generate_tables_without_accessible_sources(self, mock_gemini):
+        agent = AnalysisAgent()
+        tables = agent.generate_tables([])
+
+        assert tables["research_overview"] == []
+        assert tables["keyword_frequency"] == [{"Keyword": "N/A", "Count": 0}]
+        assert tables["keyword_tfidf"] == []
+        assert tables["domain_summary"] == []
+        assert tables["source_summaries"] == []
+
 class TestWriterAgent:
     @patch('agents.writer_agent.GeminiService')
     def test_write_report(self, mock_gemini):
-        # Setup mocks
-        mock_tool = Mock()
-        mock_tool.func.return_value = "This is a draft report"
-        
-        mock_gemini.return_value.create_writer_tool.return_value = mock_tool
+        report = "# Market Report\n\n## Executive Summary\n" + "The market is growing steadily. " * 5
+        mock_gemini.return_value.generate_text.return_value = report
         
         # Test data
         analysis_data = {
@@ -94,28 +475,199 @@ class TestWriterAgent:
         result = agent.write_report(analysis_data, "concise")
         
         # Assertions
-        assert result == "This is a draft report"
-        mock_tool.func.assert_called_once()
+        assert result == report
+        mock_gemini.return_value.generate_text.assert_called_once()
+
+    @patch('agents.writer_agent.GeminiService')
+    def test_prompt_stays_within_budget(self, mock_gemini):
+        mock_gemini.return_value.generate_text.return_value = "# Report\n" + "Body text. " * 20
+        overview = []
+        summaries = []
+        for i in range(50):
+            url = f"https://example.com/{i}"
+            topic = "battery storage" if i == 30 else "unrelated filler"
+            overview.append({"Title": f"Source {i}", "URL": url, "Content Length": 5000,
+                             "Content Status": "Accessible", "Snippet": "snippet"})
+            summaries.append({"title": f"Source {i}", "url": url, "snippet": "snippet", "domain": "example.com",
+                              "content_preview": f"{topic} " * 40, "fetched_text_length": 5000})
+        overview.append(dict(overview[0]))  # duplicate URL
+        analysis_data = {
+            "analysis_summary": "Summary. " * 2000,
+            "analysis_tables": {
+                "research_overview": overview,
+                "keyword_frequency": [{"Keyword": "battery", "Count": 40}],
+                "keyword_tfidf": [{"Keyword": "battery", "TF-IDF": 0.5, "Sources": 1}],
+                "source_summaries": summaries
+            }
+        }
+
+        usage = {}
+        WriterAgent(prompt_tokens=3000).write_report(analysis_data, "concise", on_prompt_usage=usage.update)
+
+        prompt = mock_gemini.return_value.generate_text.call_args[0][0]
+        assert usage["tokens"] <= 3000
+        assert len(prompt) <= 3000 * 4 + 200  # template whitespace rounding
+        assert set(usage["sections"]) == {"instructions", "analysis_summary", "keyword_frequency", "sources"}
+        assert usage["sections"]["analysis_summary"]["tokens"] <= 3000 * WriterAgent.SUMMARY_SHARE
+        # The source matching the top keyword ranks first; the duplicate URL is listed once
+        assert "[1] Source 30 - https://example.com/30" in prompt
+        assert prompt.count("https://example.com/0 ") == 1
+        assert usage["sections"]["sources"]["dropped"] > 0
+        assert usage["sections"]["sources"]["items"] + usage["sections"]["sources"]["dropped"] == 50
+
+    @pytest.mark.asyncio
+    @patch('agents.writer_agent.GeminiService')
+    async def test_awrite_report(self, mock_gemini):
+        report = "# Market Report\n\n## Executive Summary\n" + "The market is growing steadily. " * 5
+        mock_gemini.return_value.agenerate_text = AsyncMock(return_value=report)
+
+        analysis_data = {
+            "analysis_summary": "This is an analysis summary",
+            "analysis_tables": {"research_overview": [], "keyword_frequency": [], "source_summaries": []}
+        }
+
+        agent = WriterAgent()
+        result = await agent.awrite_report(analysis_data, "detailed")
+
+        assert result == report
+        prompt = mock_gemini.return_value.agenerate_text.await_args[0][0]
+        assert "detailed style" in prompt
+        assert "This is an analysis summary" in prompt
+
+    @pytest.mark.asyncio
+    @patch('agents.writer_agent.GeminiService')
+    async def test_awrite_report_streams_tokens(self, mock_gemini):
+        chunks = ["# Market Report\n\n", "## Executive Summary\n", "The market is growing steadily. " * 5]
+
+        async def astream_text(prompt):
+            for chunk in chunks:
+                yield chunk
+
+        mock_gemini.return_value.astream_text = astream_text
+        analysis_data = {
+            "analysis_summary": "This is an analysis summary",
+            "analysis_tables": {"research_overview": [], "keyword_frequency": [], "source_summaries": []}
+        }
+
+        tokens = []
+        result = await WriterAgent().awrite_report(analysis_data, "concise", on_token=tokens.append)
+
+        assert tokens == chunks
+        assert result == "".join(chunks)
 
 class TestReviewerAgent:
     @patch('agents.reviewer_agent.GeminiService')
     def test_review_report(self, mock_gemini):
         # Setup mocks
-        mock_tool = Mock()
-        mock_tool.func.return_value = {
-            "final_report": "This is the final report",
-            "review_notes": "These are the review notes"
-        }
-        
-        mock_gemini.return_value.create_reviewer_tool.return_value = mock_tool
+        draft = "# Market Report\n\n## Summary\n" + "The market is growing steadily. " * 5
+        mock_gemini.return_value.generate_text.return_value = (
+            "Of course. # Market Report\n\n## Summary\n" + "The market grows steadily. " * 5
+        )
         
         # Test the agent
-        agent = ReviewerAgent()
-        result = agent.review_report("This is a draft report")
+        agent = ReviewerAgent(review_mode="full")
+        result = agent.review_report(draft)
         
         # Assertions
         assert "final_report" in result
         assert "review_notes" in result
-        assert result["final_report"] == "This is the final report"
-        assert result["review_notes"] == "These are the review notes"
-        mock_tool.func.assert_called_once()
\ No newline at end of file
+        assert result["final_report"].startswith("# Market Report\n**Date:**")
+        assert "The market grows steadily." in result["final_report"]
+        assert "Of course" not in result["final_report"]
+        mock_gemini.return_value.generate_text.assert_called_once()
+
+    @pytest.mark.asyncio
+    @patch('agents.reviewer_agent.GeminiService')
+    async def test_areview_report(self, mock_gemini):
+        draft = "# Market Report\n\n## Summary\n" + "The market is growing steadily. " * 5
+        mock_gemini.return_value.agenerate_text = AsyncMock(
+            return_value="Certainly. # Market Report\n\n## Summary\n" + "The market grows steadily. " * 5
+        )
+
+        agent = ReviewerAgent()
+        result = await agent.areview_report(draft)
+
+        assert result["final_report"].startswith("# Market Report\n**Date:**")
+        assert "Certainly" not in result["final_report"]
+        mock_gemini.return_value.agenerate_text.assert_awaited_once()
+
+    @patch('agents.reviewer_agent.GeminiService')
+    def test_review_keeps_sections_past_budget(self, mock_gemini):
+        intro = "# Market Report\n\n## Summary\n" + "The market is growing steadily. " * 20 + "\n"
+        appendix = "## Appendix\n" + "Raw data row. " * 400
+        mock_gemini.return_value.generate_text.return_value = "# Market Report\n\n## Summary\n" + "The market grows. " * 20
+
+        usage = {}
+        agent = ReviewerAgent(prompt_tokens=1000)
+        result = agent.review_report(intro + appendix, on_prompt_usage=usage.update)
+
+        prompt = mock_gemini.return_value.generate_text.call_args[0][0]
+        assert "The market is growing steadily." in prompt
+        assert "Raw data row." not in prompt
+        assert result["final_report"].startswith("# Market Report\n**Date:**")
+        assert result["final_report"].endswith(appendix)
+        assert "kept as written" in result["review_notes"]
+        assert usage["sections"]["draft"]["sections"] == 2
+        assert usage["sections"]["draft"]["unreviewed"] == 1
+
+    @patch('agents.reviewer_agent.GeminiService')
+    def test_review_sections_splices_unchanged_sections(self, mock_gemini):
+        findings = "## Key Findings\n" + "Demand is rising fast and supply is lagging behind. " * 3 + "\n\n"
+        risks = "## Risks\n" + "Their is regulatory risk in several markets today. " * 3 + "\n\n"
+        sources = "## Sources\n" + "Source one, published by an industry analyst group. " * 3 + "\n"
+        draft = "# Market Report\n**Date:** January 1, 2020\n\n" + findings + risks + sources
+
+        def generate(prompt):
+            if "Their is" in prompt:
+                return "Certainly. " + risks.replace("Their is", "There is").strip()
+            if "Source one" in prompt:
+                return ""  # empty reply keeps the section
+            return UNCHANGED
+
+        mock_gemini.return_value.generate_text.side_effect = generate
+
+        usage = {}
+        agent = ReviewerAgent(review_mode="sections")
+        result = agent.review_report(draft, on_prompt_usage=usage.update)
+
+        final = result["final_report"]
+        assert mock_gemini.return_value.generate_text.call_count == 3  # the title section is too short to review
+        assert final.startswith("# Market Report\n**Date:**")
+        assert "January 1, 2020" not in final
+        assert findings in final and sources.strip() in final
+        assert "There is regulatory risk" in final and "Their is" not in final
+        assert "Certainly" not in final
+        assert final.index("## Key Findings") < final.index("## Risks") < final.index("## Sources")
+        assert "1 revised, 1 unchanged" in result["review_notes"]
+        assert usage["calls"] == 3
+        assert usage["sections"]["draft"] == {"sections": 4, "unreviewed": 1}
+
+    @pytest.mark.asyncio
+    @patch('agents.reviewer_agent.GeminiService')
+    async def test_areview_sections_run_concurrently_and_stream_in_order(self, mock_gemini):
+        import asyncio
+
+        sections = [f"## Part {i}\n" + f"Paragraph {i} describes the market in some detail here. " * 3 + "\n\n" for i in range(4)]
+        draft = "# Market Report\n\n" + "".join(sections)
+        in_flight = {"now": 0, "max": 0}
+
+        async def agenerate(prompt):
+            in_flight["now"] += 1
+            in_flight["max"] = max(in_flight["max"], in_flight["now"])
+            # Earlier sections finish last
+            part = int(prompt.split("## Part ")[1][0])
+            await asyncio.sleep(0.01 * (4 - part))
+            in_flight["now"] -= 1
+            return UNCHANGED
+
+        mock_gemini.return_value.agenerate_text = AsyncMock(side_effect=agenerate)
+
+        streamed = []
+        agent = ReviewerAgent(max_concurrency=2, min_sections=3)  # auto mode switches to sections
+        result = await agent.areview_report(draft, on_token=streamed.append)
+
+        assert in_flight["max"] == 2
+        assert "".join(streamed) == draft
+        assert result["final_report"].startswith("# Market Report\n**Date:**")
+        assert "".join(sections).strip() in result["final_report"]
+
@@ -0,0 +1,223 @@
+import asyncio
+import json
+import httpx
+import pytest
+from unittest.mock import AsyncMock, Mock, patch
+from fastapi.testclient import TestClient
+import dependencies
+from dependencies import get_agents, get_job_manager
+from services.job_manager import JobManager
+from services.job_store import InMemoryJobStore
+from main import app
+from routes.research_route import run_research_job
+
+
+def make_agents():
+    agents = Mock()
+    agents.research_agent.aresearch = AsyncMock(return_value=[
+        {
+            "url": "https://example.com/1",
+            "title": "Test Result 1",
+            "snippet": "This is a test snippet",
+            "content_preview": "This is a preview of the content",
+            "fetched_text_length": 600
+        }
+    ])
+    agents.analysis_agent.asummarize_incrementally = AsyncMock(return_value=[])
+    agents.analysis_agent.asynthesize = AsyncMock(return_value="This is an analysis summary")
+    agents.analysis_agent.generate_tables = Mock(
+        return_value={"research_overview": [], "keyword_frequency": [], "source_summaries": []}
+    )
+    agents.writer_agent.awrite_report = AsyncMock(return_value="This is a draft report")
+    agents.reviewer_agent.areview_report = AsyncMock(return_value={
+        "final_report": "This is the final report",
+        "review_notes": "These are the review notes"
+    })
+    return agents
+
+
+class TestResearchRoute:
+    def test_research_uses_shared_agents(self):
+        agents = make_agents()
+        app.dependency_overrides[get_agents] = lambda: agents
+        try:
+            client = TestClient(app)
+            for _ in range(2):
+                response = client.post("/api/research", json={"topic": "test topic", "num_results": 1})
+                assert response.status_code == 200
+        finally:
+            app.dependency_overrides.clear()
+
+        body = response.json()
+        assert body["final_report"] == "This is the final report"
+        assert body["agent_logs"]["research"]["results_count"] == 1
+        assert set(body["agent_logs"]["timings"]["stages"]) == {
+            "research", "summaries", "tables", "synthesis", "analysis", "writer", "reviewer"
+        }
+        assert agents.research_agent.aresearch.await_count == 2
+
+    def test_metrics_endpoint(self):
+        agents = make_agents()
+        app.dependency_overrides[get_agents] = lambda: agents
+        try:
+            client = TestClient(app)
+            client.post("/api/research", json={"topic": "metrics topic", "num_results": 1})
+            response = client.get("/metrics")
+        finally:
+            app.dependency_overrides.clear()
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert "# TYPE research_request_duration_seconds histogram" in response.text
+        assert 'pipeline_stage_duration_seconds_count{stage="writer"}' in response.text
+
+    @pytest.mark.asyncio
+    async def test_health_responds_while_research_is_running(self):
+        agents = make_agents()
+        release = asyncio.Event()
+        search_results = agents.research_agent.aresearch.return_value
+
+        async def slow_research(topic, num_results, **callbacks):
+            await release.wait()
+            return search_results
+
+        agents.research_agent.aresearch = AsyncMock(side_effect=slow_research)
+        app.dependency_overrides[get_agents] = lambda: agents
+        try:
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                research = asyncio.create_task(
+                    client.post("/api/research", json={"topic": "test topic", "num_results": 1})
+                )
+                await asyncio.sleep(0.05)
+
+                health = await asyncio.wait_for(client.get("/health"), timeout=2)
+                assert health.json() == {"status": "healthy"}
+                assert not research.done()
+
+                release.set()
+                response = await asyncio.wait_for(research, timeout=2)
+        finally:
+            app.dependency_overrides.clear()
+
+        assert response.status_code == 200
+
+    def test_research_stream_emits_progress_events(self):
+        agents = make_agents()
+        search_results = agents.research_agent.aresearch.return_value
+
+        async def research(topic, num_results, on_search=None, on_result=None):
+            on_search([{"url": "https://example.com/1", "title": "Test Result 1"}])
+            on_result(0, search_results[0])
+            return search_results
+
+        async def write(analysis, style, on_token=None, on_prompt_usage=None):
+            for token in ("This is ", "a draft report"):
+                on_token(token)
+            return "This is a draft report"
+
+        agents.research_agent.aresearch = AsyncMock(side_effect=research)
+        agents.writer_agent.awrite_report = AsyncMock(side_effect=write)
+        app.dependency_overrides[get_agents] = lambda: agents
+        try:
+            client = TestClient(app)
+            with client.stream("POST", "/api/research/stream", json={"topic": "test topic", "num_results": 1}) as response:
+                assert response.headers["content-type"].startswith("text/event-stream")
+                body = "".join(response.iter_text())
+        finally:
+            app.dependency_overrides.clear()
+
+        events = []
+        for block in body.strip().split("\n\n"):
+            event, data = block.split("\n")
+            events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+
+        names = [name for name, _ in events]
+        assert names == ["search", "source", "research", "tables", "analysis", "draft_token", "draft_token", "draft", "complete"]
+        assert events[names.index("tables")][1]["analysis_tables"] == events[names.index("analysis")][1]["analysis_tables"]
+        assert events[1][1]["result"]["url"] == "https://example.com/1"
+        assert "".join(data["text"] for name, data in events if name == "draft_token") == "This is a draft report"
+        assert events[-1][1]["final_report"] == "This is the final report"
+
+    def test_research_stream_reports_errors(self):
+        agents = make_agents()
+        agents.analysis_agent.asynthesize = AsyncMock(side_effect=Exception("Analysis failed: boom"))
+        app.dependency_overrides[get_agents] = lambda: agents
+        try:
+            client = TestClient(app)
+            response = client.post("/api/research/stream", json={"topic": "test topic", "num_results": 1})
+        finally:
+            app.dependency_overrides.clear()
+
+        assert response.status_code == 200
+        assert response.text.rstrip().split("\n\n")[-1].startswith("event: error")
+        assert "Analysis failed: boom" in response.text
+
+    @pytest.mark.asyncio
+    @patch('routes.research_route.create_container', side_effect=make_agents)
+    async def test_research_job_lifecycle(self, _):
+        jobs = JobManager(InMemoryJobStore(), run_research_job, workers=1)
+        await jobs.start()
+        app.dependency_overrides[get_job_manager] = lambda: jobs
+        try:
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                submitted = await client.post("/api/research/jobs", json={"topic": "test topic", "num_results": 1})
+                assert submitted.status_code == 202
+                job_id = submitted.json()["job_id"]
+
+                await asyncio.wait_for(jobs._queue.join(), timeout=2)
+                status = (await client.get(f"/api/research/jobs/{job_id}")).json()
+                result = await client.get(f"/api/research/jobs/{job_id}/result")
+                missing = await client.get("/api/research/jobs/unknown")
+        finally:
+            app.dependency_overrides.clear()
+            await jobs.stop()
+
+        assert status["status"] == "completed"
+        agents_run = ("research", "analysis", "writer", "reviewer")
+        assert [status["agent_logs"][agent]["status"] for agent in agents_run] == ["completed"] * 4
+        assert result.status_code == 200
+        assert result.json()["final_report"] == "This is the final report"
+        assert missing.status_code == 404
+
+    @pytest.mark.asyncio
+    async def test_identical_concurrent_requests_share_one_run(self):
+        agents = make_agents()
+        release = asyncio.Event()
+        search_results = agents.research_agent.aresearch.return_value
+
+        async def slow_research(topic, num_results, **callbacks):
+            await release.wait()
+            return search_results
+
+        agents.research_agent.aresearch = AsyncMock(side_effect=slow_research)
+        app.dependency_overrides[get_agents] = lambda: agents
+        try:
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                requests = [
+                    asyncio.create_task(client.post("/api/research", json={"topic": topic, "num_results": 1}))
+                    for topic in ("Test topic", "test  topic?", "other topic")
+                ]
+                await asyncio.sleep(0.05)
+                release.set()
+                responses = await asyncio.wait_for(asyncio.gather(*requests), timeout=2)
+        finally:
+            app.dependency_overrides.clear()
+
+        assert [response.status_code for response in responses] == [200, 200, 200]
+        assert responses[0].json() == responses[1].json()
+        assert agents.research_agent.aresearch.await_count == 2
+
+    @patch('dependencies.AgentContainer')
+    def test_container_is_created_once(self, mock_container):
+        dependencies._container = None
+        try:
+            first = dependencies.create_container()
+            second = dependencies.create_container()
+        finally:
+            dependencies._container = None
+
+        assert first is second
+        mock_container.assert_called_once()
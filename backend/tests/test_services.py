@@ -0,0 +1,1081 @@
+import asyncio
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import pytest
+import httpx
+from unittest.mock import AsyncMock, Mock, patch
+from logger import DebugSampler, configure_logging, stop_logging
+from services import http_client
+from services.cache import MemoryCache, SQLiteCache
+from services.search_cache import CachedSearchService
+from services.deadline import Deadline, DeadlineExceeded, deadline_scope
+from services.extractors import BeautifulSoupExtractor, FallbackExtractor, LxmlExtractor
+from services.fetcher import ContentFetcher
+from services.gemini_service import GeminiService
+from services.hedging import Hedger
+from services.job_manager import JobManager, JobQueueFull
+from services.job_store import InMemoryJobStore, SQLiteJobStore
+from services.llm_cache import LLMResponseCache
+from services.metrics import Registry, observe_fetch, register_cache, trace, REGISTRY
+from services.orchestrator import Orchestrator, Stage
+from services.page_cache import PageCache
+from services.page_classifier import DomainVerdicts, PageClassifier, PageRejected
+from services.politeness import PolitenessScheduler
+from services.prompt_budget import PromptBudget, estimate_tokens, truncate_to_tokens
+from services.rate_limiter import RateLimiter, RetryBudget, RetryScheduler, retry_after, retry_reason
+from services.serpapi_service import SerpApiService
+from services.serper_service import SerperService
+from services.singleflight import AsyncSingleFlight, SingleFlight
+
+
+class TestHttpClient:
+    def test_session_is_shared_and_pooled(self):
+        session = http_client.get_session()
+
+        assert http_client.get_session() is session
+        adapter = session.get_adapter("https://google.serper.dev/search")
+        assert adapter._pool_maxsize == http_client.config.per_host_limit
+        assert adapter._pool_block is True
+
+    @pytest.mark.asyncio
+    async def test_per_host_limit(self):
+        in_flight = {"now": 0, "max": 0}
+
+        async def handler(request):
+            in_flight["now"] += 1
+            in_flight["max"] = max(in_flight["max"], in_flight["now"])
+            await asyncio.sleep(0.01)
+            in_flight["now"] -= 1
+
+            async def body():
+                yield b"ok"
+
+            # A streamed body, like a real transport returns
+            return httpx.Response(200, content=body())
+
+        transport = http_client._PerHostLimitTransport(httpx.MockTransport(handler), per_host_limit=2)
+        async with httpx.AsyncClient(transport=transport) as client:
+            responses = await asyncio.gather(*(client.get("https://example.com/") for _ in range(6)))
+
+        assert all(r.text == "ok" for r in responses)
+        assert in_flight["max"] == 2
+        # Idle hosts are not kept around
+        assert transport._slots == {}
+
+    @pytest.mark.asyncio
+    async def test_async_client_does_not_keep_cookies(self):
+        seen = []
+
+        def handler(request):
+            seen.append(request.headers.get("Cookie"))
+            return httpx.Response(200, text="ok", headers={"Set-Cookie": "meter=1; Path=/"})
+
+        async with http_client._build_async_client(httpx.MockTransport(handler)) as client:
+            await client.get("https://news.example.com/a")
+            await client.get("https://news.example.com/b")
+
+        assert seen == [None, None]
+
+    def test_session_does_not_keep_cookies(self):
+        from http.server import BaseHTTPRequestHandler, HTTPServer
+        import threading
+
+        seen = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                seen.append(self.headers.get("Cookie"))
+                self.send_response(200)
+                self.send_header("Set-Cookie", "meter=1; Path=/")
+                self.send_header("Content-Length", "2")
+                self.end_headers()
+                self.wfile.write(b"ok")
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer(("127.0.0.1", 0), Handler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            url = f"http://127.0.0.1:{server.server_port}/"
+            session = http_client.get_session()
+            session.get(url, timeout=5)
+            session.get(url, timeout=5)
+        finally:
+            server.shutdown()
+
+        assert seen == [None, None]
+
+
+def mock_client(handler):
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler), follow_redirects=True)
+
+
+class TestContentFetcher:
+    @pytest.mark.asyncio
+    async def test_afetch_content(self):
+        html = "<html><body><nav>Menu</nav><p>" + "Useful article text. " * 20 + "</p><script>x()</script></body></html>"
+
+        def handler(request):
+            assert request.url == "https://example.com/article"
+            return httpx.Response(200, text=html, headers={"Content-Type": "text/html"})
+
+        async with mock_client(handler) as client:
+            with patch('services.fetcher.get_async_client', return_value=client):
+                result = await ContentFetcher().afetch_content("https://example.com/article")
+
+        assert result["fetched_text"].startswith("Useful article text.")
+        assert "Menu" not in result["fetched_text"]
+        assert result["fetched_text_length"] == len(result["fetched_text"])
+
+    @pytest.mark.asyncio
+    async def test_afetch_content_http_error(self):
+        async with mock_client(lambda request: httpx.Response(503)) as client:
+            with patch('services.fetcher.get_async_client', return_value=client):
+                result = await ContentFetcher().afetch_content("https://example.com/down")
+
+        assert result["content_preview"].startswith("Error fetching content")
+        assert result["fetched_text_length"] == 0
+
+    @pytest.mark.asyncio
+    async def test_afetch_content_stops_at_text_budget(self, monkeypatch):
+        monkeypatch.setenv("FETCH_MAX_TEXT_CHARS", "1000")
+        sent = {"chunks": 0}
+
+        async def body():
+            yield "<html><body>".encode()
+            for _ in range(1000):
+                sent["chunks"] += 1
+                yield ("<p>" + "Long article text. " * 50 + "</p>").encode()
+
+        def handler(request):
+            return httpx.Response(200, content=body(), headers={"Content-Type": "text/html; charset=utf-8"})
+
+        async with mock_client(handler) as client:
+            with patch('services.fetcher.get_async_client', return_value=client):
+                result = await ContentFetcher().afetch_content("https://example.com/huge")
+
+        assert result["fetched_text_length"] == 1000
+        assert result["fetched_text"].startswith("Long article text.")
+        assert sent["chunks"] < 1000
+
+    @pytest.mark.asyncio
+    async def test_afetch_content_rejects_non_html(self):
+        sent = {"chunks": 0}
+
+        async def body():
+            sent["chunks"] += 1
+            yield b"%PDF-1.7"
+
+        def handler(request):
+            return httpx.Response(200, content=body(), headers={"Content-Type": "application/pdf"})
+
+        async with mock_client(handler) as client:
+            with patch('services.fetcher.get_async_client', return_value=client):
+                result = await ContentFetcher().afetch_content("https://example.com/report.pdf")
+
+        assert "Unsupported content type: application/pdf" in result["content_preview"]
+        assert sent["chunks"] == 0
+
+    def test_fetch_content_respects_byte_budget(self, monkeypatch):
+        monkeypatch.setenv("FETCH_MAX_BYTES", "4096")
+        response = Mock(status_code=200, headers={"Content-Type": "text/html; charset=iso-8859-1"})
+        response.__enter__ = Mock(return_value=response)
+        response.__exit__ = Mock(return_value=False)
+        response.iter_content.return_value = iter(["<p>caf\u00e9 ".encode("latin-1") * 1000] * 100)
+
+        with patch('services.fetcher.get_session') as session:
+            session.return_value.get.return_value = response
+            fetcher = ContentFetcher()
+            with patch.object(fetcher.extractor, 'stream', wraps=fetcher.extractor.stream) as stream:
+                result = fetcher.fetch_content("https://example.com/big")
+
+        assert session.return_value.get.call_args.kwargs["stream"] is True
+        stream.assert_called_once_with("iso8859-1")
+        assert result["fetched_text"].startswith("caf\u00e9")
+        assert result["fetched_text_length"] < 4096
+
+
+class TestPageClassifier:
+    def test_login_wall_text(self):
+        classifier = PageClassifier()
+
+        assert classifier.is_login_wall("Please sign in to continue reading.")
+        assert classifier.is_login_wall("Create account or Join now for free")
+        assert not classifier.is_login_wall("Sign in to continue. " + "Long article text. " * 100)
+        assert not classifier.is_login_wall("An article about heat pumps.")
+
+    def test_rejects_account_urls_and_gated_html(self):
+        classifier = PageClassifier()
+
+        with pytest.raises(PageRejected):
+            classifier.check_url("https://example.com/account/login?next=/article")
+        classifier.check_url("https://example.com/blog/logins-explained")
+        with pytest.raises(PageRejected, match="redirected"):
+            classifier.check_response("https://example.com/signin")
+        with pytest.raises(PageRejected, match="paywalled"):
+            classifier.check_prefix('<script type="application/ld+json">{"isAccessibleForFree": false}</script>')
+        with pytest.raises(PageRejected, match="login form"):
+            classifier.check_prefix('<p>Please log in</p><form><input type="password"></form>')
+        # A login box next to an article is fine
+        classifier.check_prefix('<a href="/login">Sign in</a><input type="password"><p>Article</p>')
+
+    def test_learned_domain_verdicts_persist(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("DOMAIN_VERDICTS_PATH", str(tmp_path / "domains.db"))
+        classifier = PageClassifier.from_env()
+        for _ in range(3):
+            classifier.record("https://walled.example.com/story", useful=False)
+        classifier.record("https://open.example.com/story", useful=True)
+
+        # A new process reads the verdicts back and skips the domain without fetching
+        restarted = PageClassifier.from_env()
+        with pytest.raises(PageRejected, match="domain"):
+            restarted.check_url("https://walled.example.com/other-story")
+        restarted.check_url("https://open.example.com/other-story")
+
+    @pytest.mark.asyncio
+    async def test_gated_page_is_rejected_before_parsing(self):
+        requests = []
+
+        def handler(request):
+            requests.append(str(request.url))
+            html = '<html><body><p>Please log in to continue</p><input type="password"></body></html>'
+            return httpx.Response(200, text=html, headers={"Content-Type": "text/html"})
+
+        fetcher = ContentFetcher(politeness=PolitenessScheduler(min_interval=0),
+                                 classifier=PageClassifier(DomainVerdicts(MemoryCache(), min_samples=2)))
+        async with mock_client(handler) as client:
+            with patch('services.fetcher.get_async_client', return_value=client):
+                with patch.object(fetcher.extractor, 'stream') as stream:
+                    results = [await fetcher.afetch_content(f"https://gated.example.com/{i}") for i in range(3)]
+
+        stream.assert_not_called()
+        assert [r["fetched_text_length"] for r in results] == [0, 0, 0]
+        # Two rejections teach the classifier to skip the domain
+        assert len(requests) == 2
+        assert results[2]["content_preview"].startswith("Skipped")
+
+
+    @pytest.mark.asyncio
+    async def test_domain_verdicts_are_read_and_written_off_the_event_loop(self):
+        loop_thread = threading.get_ident()
+        threads = []
+
+        class Store(MemoryCache):
+            def get(self, key):
+                threads.append(threading.get_ident())
+                return super().get(key)
+
+            def set(self, key, value, size=None):
+                threads.append(threading.get_ident())
+                super().set(key, value, size)
+
+        html = "<html><body><p>" + "Useful article text. " * 40 + "</p></body></html>"
+        fetcher = ContentFetcher(politeness=PolitenessScheduler(min_interval=0),
+                                 classifier=PageClassifier(DomainVerdicts(Store())))
+        async with mock_client(lambda request: httpx.Response(200, text=html, headers={"Content-Type": "text/html"})) as client:
+            with patch('services.fetcher.get_async_client', return_value=client):
+                result = await fetcher.afetch_content("https://example.com/article")
+
+        fetch_threads = list(threads)
+        assert result["fetched_text_length"] > 500
+        assert fetcher.classifier.domains.get("example.com") == {"useful": 1, "useless": 0}
+        assert fetch_threads and loop_thread not in fetch_threads
+
+
+class TestPoliteness:
+    @pytest.mark.asyncio
+    async def test_same_host_is_spaced_other_hosts_are_not(self):
+        html = "<html><body><p>" + "Article text. " * 40 + "</p></body></html>"
+        t0 = time.monotonic()
+        started = {}
+
+        def handler(request):
+            started[str(request.url)] = time.monotonic() - t0
+            return httpx.Response(200, text=html, headers={"Content-Type": "text/html"})
+
+        fetcher = ContentFetcher(politeness=PolitenessScheduler(min_interval=0.2, per_host_limit=2))
+        urls = ["https://a.example.com/1", "https://a.example.com/2", "https://b.example.com/1"]
+        async with mock_client(handler) as client:
+            with patch('services.fetcher.get_async_client', return_value=client):
+                await asyncio.gather(*(fetcher.afetch_content(url) for url in urls))
+
+        assert started["https://a.example.com/1"] < 0.1
+        assert started["https://b.example.com/1"] < 0.1
+        assert started["https://a.example.com/2"] - started["https://a.example.com/1"] >= 0.19
+
+    @pytest.mark.asyncio
+    async def test_robots_crawl_delay(self):
+        scheduler = PolitenessScheduler(min_interval=0, respect_crawl_delay=True, max_crawl_delay=0.3)
+
+        def handler(request):
+            assert request.url == "https://slow.example.com/robots.txt"
+            return httpx.Response(200, text="User-agent: *\nCrawl-delay: 5\n")
+
+        async with mock_client(handler) as client:
+            with patch('services.politeness.get_async_client', return_value=client):
+                async with scheduler.aslot("https://slow.example.com/a"):
+                    pass
+
+        # Capped at max_crawl_delay; hosts without a crawl delay use min_interval
+        assert scheduler.interval("slow.example.com") == 0.3
+        assert scheduler.interval("fast.example.com") == 0
+
+class TestSearchServices:
+    @pytest.mark.asyncio
+    async def test_serper_asearch(self, monkeypatch):
+        monkeypatch.setenv("SERPER_API_KEY", "test-key")
+
+        def handler(request):
+            assert request.headers["X-API-KEY"] == "test-key"
+            assert json.loads(request.content) == {"q": "test topic", "num": 2}
+            return httpx.Response(200, json={"organic": [
+                {"title": "A", "link": "https://a.example.com", "snippet": "a", "source": "a.example.com"},
+                {"title": "B", "link": "https://b.example.com", "snippet": "b", "source": "b.example.com"},
+                {"title": "C", "link": "https://c.example.com", "snippet": "c", "source": "c.example.com"},
+            ]})
+
+        async with mock_client(handler) as client:
+            with patch('services.serper_service.get_async_client', return_value=client):
+                results = await SerperService().asearch("test topic", 2)
+
+        assert [r["url"] for r in results] == ["https://a.example.com", "https://b.example.com"]
+        assert results[0]["domain"] == "a.example.com"
+
+    @pytest.mark.asyncio
+    async def test_serpapi_asearch(self, monkeypatch):
+        monkeypatch.setenv("SERPAPI_API_KEY", "test-key")
+
+        def handler(request):
+            assert request.url.params["q"] == "test topic"
+            return httpx.Response(200, json={"organic_results": [
+                {"title": "A", "link": "https://a.example.com/x", "snippet": "a"},
+            ]})
+
+        async with mock_client(handler) as client:
+            with patch('services.serpapi_service.get_async_client', return_value=client):
+                results = await SerpApiService().asearch("test topic", 5)
+
+        assert results == [{
+            "title": "A", "url": "https://a.example.com/x", "snippet": "a",
+            "published_date": "", "domain": "a.example.com"
+        }]
+
+    @pytest.mark.asyncio
+    async def test_serper_asearch_error(self, monkeypatch):
+        monkeypatch.setenv("SERPER_API_KEY", "test-key")
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            return httpx.Response(429)
+
+        scheduler = RetryScheduler(RateLimiter("serper"), RetryBudget(), max_attempts=3, base_delay=0)
+        async with mock_client(handler) as client:
+            with patch('services.serper_service.get_async_client', return_value=client):
+                with pytest.raises(Exception, match="Serper.dev search failed"):
+                    await SerperService(scheduler=scheduler).asearch("test topic")
+        # Throttled responses are retried until the attempts run out
+        assert len(calls) == 3
+
+
+class TestGeminiService:
+    @pytest.mark.asyncio
+    @patch('services.gemini_service.ChatGoogleGenerativeAI')
+    async def test_agenerate_text(self, mock_model, monkeypatch):
+        monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+        mock_model.return_value.ainvoke = AsyncMock(return_value=Mock(content="generated"))
+
+        assert await GeminiService().agenerate_text("prompt") == "generated"
+        messages = mock_model.return_value.ainvoke.await_args[0][0]
+        assert messages[0].content == "prompt"
+
+    @pytest.mark.asyncio
+    @patch('services.gemini_service.ChatGoogleGenerativeAI')
+    async def test_astream_text(self, mock_model, monkeypatch):
+        monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+
+        async def astream(messages):
+            for part in ("gene", "", "rated"):
+                yield Mock(content=part)
+
+        mock_model.return_value.astream = astream
+        service = GeminiService(cache=LLMResponseCache(MemoryCache()))
+
+        assert [chunk async for chunk in service.astream_text("prompt")] == ["gene", "rated"]
+        # The assembled response is memoized and replayed in one piece
+        assert [chunk async for chunk in service.astream_text("prompt")] == ["generated"]
+
+    @patch('services.gemini_service.ChatGoogleGenerativeAI')
+    def test_memoized_responses(self, mock_model, monkeypatch, tmp_path):
+        monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+        mock_model.return_value.invoke.side_effect = lambda messages: Mock(content="answer to " + messages[0].content)
+
+        path = str(tmp_path / "llm.sqlite")
+        service = GeminiService(cache=LLMResponseCache(MemoryCache(), SQLiteCache(path, table="llm_cache")))
+
+        assert service.generate_text("prompt") == "answer to prompt"
+        assert service.generate_text("prompt") == "answer to prompt"
+        assert mock_model.return_value.invoke.call_count == 1
+
+        # Per-call bypass always reaches the model
+        service.generate_text("prompt", use_cache=False)
+        assert mock_model.return_value.invoke.call_count == 2
+
+        # The disk tier survives a new process-level cache
+        restarted = GeminiService(cache=LLMResponseCache(MemoryCache(), SQLiteCache(path, table="llm_cache")))
+        assert restarted.generate_text("prompt") == "answer to prompt"
+        assert mock_model.return_value.invoke.call_count == 2
+
+    @pytest.mark.asyncio
+    @patch('services.gemini_service.ChatGoogleGenerativeAI')
+    async def test_shared_call_keeps_each_callers_deadline(self, mock_model, monkeypatch):
+        monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+
+        async def ainvoke(messages):
+            await asyncio.sleep(0.3)
+            return Mock(content="generated")
+
+        mock_model.return_value.ainvoke = AsyncMock(side_effect=ainvoke)
+        service = GeminiService()
+
+        async def call(deadline):
+            with deadline_scope(deadline):
+                return await service.agenerate_text("prompt")
+
+        # Leader with a short deadline, follower without one, and the reverse
+        for leader, follower in ((Deadline(0.1), None), (None, Deadline(0.1))):
+            start = time.perf_counter()
+            results = await asyncio.gather(call(leader), call(follower), return_exceptions=True)
+            short = results[0] if leader is not None else results[1]
+            unbounded = results[1] if leader is not None else results[0]
+
+            assert isinstance(short, DeadlineExceeded)
+            assert unbounded == "generated"
+            assert time.perf_counter() - start < 0.6
+        # The callers shared one model call each time
+        assert mock_model.return_value.ainvoke.await_count == 2
+
+    def test_cache_key_covers_model_settings(self):
+        key = LLMResponseCache.make_key("gemini-2.5-pro", 0.2, "prompt")
+
+        assert key == LLMResponseCache.make_key("gemini-2.5-pro", 0.2, "prompt")
+        assert key != LLMResponseCache.make_key("gemini-2.5-pro", 0.7, "prompt")
+        assert key != LLMResponseCache.make_key("gemini-2.5-flash", 0.2, "prompt")
+
+
+class TestSearchCache:
+    def make_service(self, n=10):
+        service = Mock()
+        service.search.side_effect = lambda query, num_results: [
+            {"title": f"{query} {i}", "url": f"https://example.com/{i}", "snippet": "",
+             "published_date": "", "domain": "example.com"}
+            for i in range(num_results)
+        ]
+        return service
+
+    def test_larger_cached_request_serves_smaller(self):
+        service = self.make_service()
+        cached = CachedSearchService(service, "serper", MemoryCache(max_entries=10, ttl=60))
+
+        first = cached.search("AI  Agents?", 10)
+        second = cached.search("ai agents", 5)
+
+        assert len(first) == 10
+        assert second == first[:5]
+        assert service.search.call_count == 1
+        assert (cached.hits, cached.misses) == (1, 1)
+
+        cached.search("ai agents", 10)
+        cached.search("ai agents", 3)
+        assert service.search.call_count == 1
+
+    def test_smaller_cached_request_misses_for_larger(self):
+        service = self.make_service()
+        cached = CachedSearchService(service, "serper", MemoryCache(max_entries=10, ttl=60))
+
+        cached.search("ai agents", 3)
+        assert len(cached.search("ai agents", 8)) == 8
+        assert service.search.call_count == 2
+
+    def test_memory_cache_lru_and_ttl(self, monkeypatch):
+        cache = MemoryCache(max_entries=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+
+        now = time.monotonic()
+        monkeypatch.setattr("services.cache.time.monotonic", lambda: now + 120)
+        assert cache.get("a") is None
+
+    def test_disk_tier_survives_restart(self, tmp_path):
+        path = str(tmp_path / "search.sqlite")
+        service = self.make_service()
+
+        first = CachedSearchService(service, "serper", MemoryCache(), SQLiteCache(path, table="search_cache"))
+        results = first.search("ai agents", 5)
+        first.disk.close()
+
+        second = CachedSearchService(service, "serper", MemoryCache(), SQLiteCache(path, table="search_cache"))
+        assert second.search("ai agents", 5) == results
+        assert service.search.call_count == 1
+        assert second.stats()["disk"]["hits"] == 1
+
+    @pytest.mark.asyncio
+    async def test_asearch_uses_cache(self):
+        service = Mock()
+        service.asearch = AsyncMock(return_value=[{"title": "A", "url": "https://a.example.com"}])
+        cached = CachedSearchService(service, "serper", MemoryCache())
+
+        await cached.asearch("ai agents", 1)
+        assert await cached.asearch("AI agents", 1) == [{"title": "A", "url": "https://a.example.com"}]
+        service.asearch.assert_awaited_once()
+
+
+class TestPageCache:
+    @pytest.mark.asyncio
+    async def test_fresh_hit_then_conditional_revalidation(self, tmp_path):
+        html = "<html><body><p>" + "Cached article text. " * 40 + "</p></body></html>"
+        requests_seen = []
+
+        def handler(request):
+            requests_seen.append(dict(request.headers))
+            if request.headers.get("If-None-Match") == '"v1"':
+                return httpx.Response(304)
+            return httpx.Response(200, text=html, headers={"ETag": '"v1"', "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"})
+
+        cache = PageCache(str(tmp_path / "pages.sqlite"), freshness=3600)
+        fetcher = ContentFetcher(page_cache=cache, politeness=PolitenessScheduler(min_interval=0))
+
+        async with mock_client(handler) as client:
+            with patch('services.fetcher.get_async_client', return_value=client):
+                first = await fetcher.afetch_content("https://example.com/a")
+                second = await fetcher.afetch_content("https://example.com/a")
+                assert len(requests_seen) == 1
+
+                cache.freshness = 0
+                with patch.object(fetcher.extractor, 'stream') as extract:
+                    third = await fetcher.afetch_content("https://example.com/a")
+                    extract.assert_not_called()
+
+        assert first == second == third
+        assert requests_seen[1]["if-none-match"] == '"v1"'
+        assert requests_seen[1]["if-modified-since"] == "Mon, 01 Jan 2024 00:00:00 GMT"
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["revalidated"] == 1
+
+    def test_size_bounded_eviction(self, tmp_path):
+        cache = PageCache(str(tmp_path / "pages.sqlite"), max_bytes=350)
+        page = {"content_preview": "x", "fetched_text": "x" * 100, "fetched_text_length": 100}
+
+        cache.set("https://example.com/1", page)
+        cache.set("https://example.com/2", page)
+        cache.get("https://example.com/1")
+        cache.set("https://example.com/3", page)
+
+        assert cache.get("https://example.com/2") is None
+        assert cache.get("https://example.com/1") is not None
+        assert cache.stats()["bytes"] <= 350
+
+
+class TestExtractors:
+    @pytest.mark.parametrize("path", sorted(glob.glob(os.path.join(os.path.dirname(__file__), "..", "benchmarks", "corpus", "*.html"))))
+    def test_lxml_matches_beautifulsoup(self, path):
+        with open(path, encoding="utf-8") as f:
+            html = f.read()
+
+        expected = BeautifulSoupExtractor().extract(html)
+        assert expected
+        assert LxmlExtractor().extract(html) == expected
+
+    def test_fallback_on_failure(self):
+        primary = Mock()
+        primary.name = "lxml"
+        primary.extract.side_effect = ValueError("broken page")
+
+        extractor = FallbackExtractor(primary, BeautifulSoupExtractor())
+
+        assert extractor.extract("<p>Hello <nav>x</nav>world</p>") == "Hello world"
+
+
+class TestJobs:
+    def test_sqlite_store_survives_restart(self, tmp_path):
+        path = str(tmp_path / "jobs.sqlite")
+        store = SQLiteJobStore(path)
+        store.create("a", {"topic": "ai"})
+        store.update("a", status="completed", result={"final_report": "done"},
+                     agent_logs={"research": {"status": "completed"}}, finished_at=time.time())
+        store.create("b", {"topic": "ml"})
+        store.close()
+
+        store = SQLiteJobStore(path)
+        job = store.get("a")
+        assert job["status"] == "completed"
+        assert job["request"] == {"topic": "ai"}
+        assert job["result"] == {"final_report": "done"}
+        assert job["agent_logs"]["research"]["status"] == "completed"
+        assert [job["job_id"] for job in store.unfinished()] == ["b"]
+
+        store.purge(time.time() + 1)
+        assert store.get("a") is None
+        assert store.get("b") is not None
+
+    @pytest.mark.asyncio
+    async def test_worker_cap_and_stage_progress(self):
+        running = {"now": 0, "max": 0}
+        release = asyncio.Event()
+
+        async def runner(request, on_progress):
+            running["now"] += 1
+            running["max"] = max(running["max"], running["now"])
+            on_progress({"research": {"status": "running"}})
+            await release.wait()
+            running["now"] -= 1
+            if request["topic"] == "bad":
+                raise Exception("Research failed: boom")
+            return {"final_report": request["topic"], "agent_logs": {"research": {"status": "completed"}}}
+
+        manager = JobManager(InMemoryJobStore(), runner, workers=2, queue_size=10)
+        await manager.start()
+        try:
+            jobs = [manager.submit({"topic": topic}) for topic in ("a", "b", "bad")]
+            await asyncio.sleep(0.01)
+
+            assert running["max"] == 2
+            assert manager.get(jobs[0]["job_id"])["agent_logs"] == {"research": {"status": "running"}}
+            assert manager.get(jobs[2]["job_id"])["status"] == "queued"
+
+            release.set()
+            await asyncio.wait_for(manager._queue.join(), timeout=2)
+        finally:
+            await manager.stop()
+
+        assert manager.get(jobs[0]["job_id"])["result"] == {"final_report": "a", "agent_logs": {"research": {"status": "completed"}}}
+        failed = manager.get(jobs[2]["job_id"])
+        assert failed["status"] == "failed"
+        assert failed["error"] == "Research failed: boom"
+        assert failed["agent_logs"] == {"research": {"status": "failed"}}
+
+    @pytest.mark.asyncio
+    async def test_queue_limit_and_resume(self, tmp_path):
+        async def runner(request, on_progress):
+            return {"final_report": request["topic"]}
+
+        store = SQLiteJobStore(str(tmp_path / "jobs.sqlite"))
+        store.create("left-running", {"topic": "resumed"})
+        store.update("left-running", status="running")
+
+        manager = JobManager(store, runner, workers=1, queue_size=1)
+        await manager.start()
+        try:
+            with pytest.raises(JobQueueFull):
+                manager.submit({"topic": "one too many"})
+            await asyncio.wait_for(manager._queue.join(), timeout=2)
+        finally:
+            await manager.stop()
+
+        assert store.get("left-running")["status"] == "completed"
+        assert store.get("left-running")["result"] == {"final_report": "resumed"}
+
+
+class TestSingleFlight:
+    def test_concurrent_calls_share_one_execution(self):
+        from concurrent.futures import ThreadPoolExecutor
+        import threading
+
+        flight = SingleFlight()
+        calls = []
+        started = threading.Event()
+        release = threading.Event()
+
+        def work():
+            calls.append(1)
+            started.set()
+            release.wait(2)
+            return {"value": 42}
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            leader = pool.submit(flight.do, "key", work)
+            started.wait(2)
+            followers = [pool.submit(flight.do, "key", work) for _ in range(3)]
+            while flight.shared < 3:
+                time.sleep(0.001)
+            release.set()
+            results = [leader.result()] + [f.result() for f in followers]
+
+        assert len(calls) == 1
+        assert all(result is results[0] for result in results)
+        # Nothing is remembered once the call has finished
+        assert flight.do("key", lambda: "fresh") == "fresh"
+
+    @pytest.mark.asyncio
+    async def test_async_errors_are_shared_and_cancellation_is_isolated(self):
+        flight = AsyncSingleFlight()
+        calls = []
+        release = asyncio.Event()
+
+        async def work():
+            calls.append(1)
+            await release.wait()
+            raise ValueError("boom")
+
+        impatient = asyncio.create_task(flight.do("key", work))
+        patient = asyncio.create_task(flight.do("key", work))
+        await asyncio.sleep(0)
+        impatient.cancel()
+        await asyncio.sleep(0)
+        release.set()
+
+        with pytest.raises(ValueError):
+            await patient
+        assert impatient.cancelled()
+        assert len(calls) == 1
+
+    @pytest.mark.asyncio
+    async def test_duplicate_fetches_share_one_download(self):
+        requests_seen = []
+
+        def handler(request):
+            requests_seen.append(str(request.url))
+            return httpx.Response(200, text="<p>" + "Shared page text. " * 20 + "</p>", headers={"Content-Type": "text/html"})
+
+        fetcher = ContentFetcher()
+        async with mock_client(handler) as client:
+            with patch('services.fetcher.get_async_client', return_value=client):
+                first, second = await asyncio.gather(
+                    fetcher.afetch_content("https://example.com/a"),
+                    fetcher.afetch_content("https://example.com/a")
+                )
+
+        assert requests_seen == ["https://example.com/a"]
+        assert first == second
+
+    @pytest.mark.asyncio
+    @patch('services.gemini_service.ChatGoogleGenerativeAI')
+    async def test_duplicate_prompts_share_one_model_call(self, mock_model, monkeypatch):
+        monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+
+        async def ainvoke(messages):
+            await asyncio.sleep(0.01)
+            return Mock(content="answer")
+
+        mock_model.return_value.ainvoke = AsyncMock(side_effect=ainvoke)
+        service = GeminiService()
+
+        results = await asyncio.gather(*(service.agenerate_text("prompt") for _ in range(3)))
+        assert results == ["answer"] * 3
+        assert mock_model.return_value.ainvoke.await_count == 1
+
+        # Opting out of the cache also opts out of sharing
+        await asyncio.gather(*(service.agenerate_text("prompt", use_cache=False) for _ in range(2)))
+        assert mock_model.return_value.ainvoke.await_count == 3
+
+
+class TestOrchestrator:
+    @pytest.mark.asyncio
+    async def test_streams_and_independent_stages_overlap(self):
+        timeline = []
+        produced = asyncio.Event()
+
+        async def produce(ctx):
+            for item in (1, 2):
+                ctx.publish("items", item)
+                timeline.append(f"published {item}")
+                await asyncio.sleep(0.01)
+            await produced.wait()
+            return {"total": 3}
+
+        async def consume(ctx):
+            seen = []
+            async for item in ctx.stream("items"):
+                timeline.append(f"consumed {item}")
+                seen.append(item)
+            return {"seen": seen}
+
+        async def side(ctx):
+            timeline.append("side started")
+            produced.set()
+            return {"side": ctx.inputs["seed"] * 2}
+
+        async def join(ctx):
+            return {"result": (ctx.inputs["total"], ctx.inputs["seen"], ctx.inputs["side"])}
+
+        orchestrator = Orchestrator([
+            Stage("join", join, inputs=["total", "seen", "side"], outputs=["result"]),
+            Stage("produce", produce, outputs=["total"], streams=["items"]),
+            Stage("consume", consume, consumes=["items"], outputs=["seen"]),
+            Stage("side", side, inputs=["seed"], outputs=["side"]),
+        ])
+        values = await orchestrator.run({"seed": 21})
+
+        assert values["result"] == (3, [1, 2], 42)
+        # The consumer works on items while the producer is still running
+        assert timeline.index("consumed 1") < timeline.index("published 2")
+        assert set(orchestrator.timings) == {"join", "produce", "consume", "side"}
+
+    @pytest.mark.asyncio
+    async def test_failure_cancels_other_stages(self):
+        cancelled = asyncio.Event()
+
+        async def slow(ctx):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        async def broken(ctx):
+            raise ValueError("boom")
+
+        orchestrator = Orchestrator([
+            Stage("slow", slow, outputs=["a"]),
+            Stage("broken", broken, outputs=["b"]),
+            Stage("after", slow, inputs=["a", "b"], outputs=["c"]),
+        ])
+        with pytest.raises(ValueError, match="boom"):
+            await asyncio.wait_for(orchestrator.run(), timeout=2)
+        assert cancelled.is_set()
+
+    @pytest.mark.asyncio
+    async def test_invalid_graphs_are_rejected(self):
+        async def noop(ctx):
+            return {}
+
+        with pytest.raises(ValueError, match="cycle"):
+            Orchestrator([Stage("a", noop, inputs=["y"], outputs=["x"]), Stage("b", noop, inputs=["x"], outputs=["y"])])
+        with pytest.raises(ValueError, match="unknown stream"):
+            Orchestrator([Stage("a", noop, consumes=["items"])])
+        with pytest.raises(ValueError, match="No stage produces: x"):
+            await Orchestrator([Stage("a", noop, inputs=["x"])]).run()
+
+
+class TestPromptBudget:
+    def test_truncate_to_tokens(self):
+        text = "word " * 100
+        cut = truncate_to_tokens(text, 10)
+        assert cut.endswith("...")
+        assert estimate_tokens(cut) <= 10
+        assert truncate_to_tokens("short", 10) == "short"
+
+    def test_items_share_the_budget_in_rank_order(self):
+        budget = PromptBudget(400)
+        budget.reserve("instructions", "x" * 400)  # 100 tokens
+        items = ["long " * 400, "short one", "mid " * 50] + ["tail " * 100] * 10
+
+        text = budget.add_items("sources", items)
+
+        assert budget.used <= 400
+        assert text.startswith("long")
+        assert "short one" in text
+        assert budget.usage["sources"]["items"] + budget.usage["sources"]["dropped"] == len(items)
+        assert budget.usage["sources"]["dropped"] > 0
+        # No single item takes more than an equal share of what was left
+        assert estimate_tokens(text.split("\n")[0]) <= 300 // len(items) + 40
+
+
+class TestMetrics:
+    def test_histogram_renders_cumulative_buckets(self):
+        registry = Registry()
+        histogram = registry.histogram("demo_seconds", "Demo", ("route",), buckets=(0.1, 1))
+        for value in (0.05, 0.5, 5):
+            histogram.observe(value, route="/a")
+
+        lines = registry.render().splitlines()
+
+        assert "# TYPE demo_seconds histogram" in lines
+        assert 'demo_seconds_bucket{route="/a",le="0.1"} 1' in lines
+        assert 'demo_seconds_bucket{route="/a",le="1"} 2' in lines
+        assert 'demo_seconds_bucket{route="/a",le="+Inf"} 3' in lines
+        assert 'demo_seconds_sum{route="/a"} 5.55' in lines
+        assert 'demo_seconds_count{route="/a"} 3' in lines
+        with pytest.raises(ValueError):
+            histogram.observe(1, path="/a")
+
+    def test_trace_and_cache_ratio(self):
+        with trace() as request_trace:
+            observe_fetch("https://example.com", 0.2, 1024, "ok")
+        observe_fetch("https://example.com/outside", 0.1, 10, "ok")
+
+        assert request_trace.summary()["fetches"] == [
+            {"url": "https://example.com", "seconds": 0.2, "bytes": 1024, "outcome": "ok"}
+        ]
+
+        cache = MemoryCache(max_entries=4)
+        cache.set("a", 1)
+        cache.get("a")
+        cache.get("b")
+        register_cache("demo", cache)
+        text = REGISTRY.render()
+        assert 'cache_lookups_total{cache="demo",result="hit"} 1' in text
+        assert 'cache_hit_ratio{cache="demo"} 0.5' in text
+
+
+
+
+class TestRateLimiter:
+    def test_bucket_spaces_requests_past_the_burst(self):
+        limiter = RateLimiter("demo", requests_per_minute=60, tokens_per_minute=600)
+
+        # Ten seconds' worth of requests go at once, the next one waits about a second
+        assert [limiter.reserve() for _ in range(10)] == [0.0] * 10
+        assert limiter.reserve() == pytest.approx(1.0, abs=0.05)
+        # A prompt larger than the token bucket still gets a (long) turn
+        assert limiter.reserve(tokens=700) == pytest.approx(60.0, abs=3.0)
+
+    def test_error_classification(self):
+        request = httpx.Request("POST", "https://api.example.com")
+        throttled = httpx.HTTPStatusError("429", request=request,
+                                          response=httpx.Response(429, headers={"Retry-After": "7"}, request=request))
+        forbidden = httpx.HTTPStatusError("403", request=request, response=httpx.Response(403, request=request))
+
+        assert retry_reason(throttled) == "throttled"
+        assert retry_after(throttled) == 7.0
+        assert retry_reason(forbidden) is None
+        assert retry_reason(httpx.ConnectTimeout("slow", request=request)) == "network"
+        # Gemini errors only carry the status and the hint in their message
+        quota = Exception("429 Resource has been exhausted. Please retry in 2.5s.")
+        assert retry_reason(quota) == "throttled"
+        assert retry_after(quota) == 2.5
+
+    @pytest.mark.asyncio
+    async def test_scheduler_honors_retry_after_and_budget(self):
+        limiter = RateLimiter("demo")
+        scheduler = RetryScheduler(limiter, RetryBudget(ratio=0, min_per_second=0, max_balance=1),
+                                   max_attempts=3, base_delay=0)
+        attempts = []
+
+        async def flaky():
+            attempts.append(time.perf_counter())
+            if len(attempts) == 1:
+                raise Exception("503 Service Unavailable. Please retry in 0.05s")
+            return "ok"
+
+        assert await scheduler.acall(flaky) == "ok"
+        assert attempts[1] - attempts[0] >= 0.05
+        # Throttling halved the rate and the success won a little of it back
+        assert limiter.factor == pytest.approx(0.55)
+
+        # The single retry in the budget is spent, so the next failure is final
+        async def down():
+            raise Exception("503 Service Unavailable")
+
+        with pytest.raises(Exception, match="503"):
+            await scheduler.acall(down)
+
+    def test_permanent_errors_are_not_retried(self):
+        scheduler = RetryScheduler(RateLimiter("demo"), RetryBudget(), max_attempts=3, base_delay=0)
+        fn = Mock(side_effect=ValueError("bad request"))
+
+        with pytest.raises(ValueError):
+            scheduler.call(fn)
+        assert fn.call_count == 1
+
+class TestDeadline:
+    @pytest.mark.asyncio
+    async def test_wait_for_cancels_at_the_deadline(self):
+        deadline = Deadline(0.1)
+
+        assert await deadline.wait_for(asyncio.sleep(0.01, result="done")) == "done"
+        with pytest.raises(DeadlineExceeded):
+            await deadline.wait_for(asyncio.sleep(1))
+        assert deadline.expired()
+
+    @pytest.mark.asyncio
+    async def test_own_timeouts_are_not_renamed(self):
+        async def read_timeout():
+            raise asyncio.TimeoutError()
+
+        with pytest.raises(asyncio.TimeoutError):
+            await Deadline(10).wait_for(read_timeout())
+
+    def test_stage_deadlines_share_the_budget(self):
+        deadline = Deadline(10)
+        research = deadline.until(0.35)
+
+        assert research.remaining() == pytest.approx(3.5, abs=0.05)
+        assert research.until(0.9).expires_at == research.expires_at
+        research.drop("https://example.com", "Example", "fetch")
+        research.drop("https://example.com", "Example", "fetch")
+        assert deadline.dropped == [{"url": "https://example.com", "title": "Example", "stage": "fetch"}]
+
+    def test_retries_stop_when_the_delay_outlasts_the_deadline(self):
+        scheduler = RetryScheduler(RateLimiter("demo"), RetryBudget(), max_attempts=3, base_delay=0)
+        fn = Mock(side_effect=Exception("503 Service Unavailable. Please retry in 5s"))
+
+        with deadline_scope(Deadline(1)):
+            with pytest.raises(Exception, match="503"):
+                scheduler.call(fn)
+        assert fn.call_count == 1
+
+
+class TestHedging:
+    @pytest.mark.asyncio
+    async def test_slow_call_is_hedged(self):
+        hedger = Hedger("demo", enabled=True, min_samples=5)
+        for _ in range(5):
+            hedger.latency.observe(0.01)
+        delays = [1.0, 0.01]
+
+        async def call():
+            delay = delays.pop(0)
+            await asyncio.sleep(delay)
+            return delay
+
+        start = time.perf_counter()
+        assert await hedger.run(call) == 0.01
+        assert time.perf_counter() - start < 0.5
+
+    @pytest.mark.asyncio
+    async def test_not_hedged_until_latencies_are_known(self):
+        hedger = Hedger("demo", enabled=True, min_samples=5)
+        call = AsyncMock(return_value="ok")
+
+        assert await hedger.run(call) == "ok"
+        assert call.await_count == 1
+        assert hedger.threshold() is None
+
+
+class TestLogging:
+    def test_queued_json_logging_to_rotating_file(self, tmp_path, monkeypatch):
+        log_file = tmp_path / "app.log"
+        monkeypatch.setenv("LOG_FILE", str(log_file))
+        monkeypatch.setenv("LOG_FORMAT", "json")
+        monkeypatch.setenv("LOG_LEVEL", "INFO")
+        try:
+            configure_logging(force=True)
+            demo = logging.getLogger("demo")
+            demo.debug("not formatted: %s", "payload")
+            demo.info("fetched %d pages", 3, extra={"topic": "solar"})
+            try:
+                raise ValueError("boom")
+            except ValueError:
+                demo.exception("stage failed")
+            # Stopping the listener flushes the queue
+            stop_logging()
+
+            entries = [json.loads(line) for line in log_file.read_text().splitlines()]
+            assert [entry["message"] for entry in entries] == ["fetched 3 pages", "stage failed"]
+            assert entries[0]["level"] == "INFO" and entries[0]["logger"] == "demo"
+            assert entries[0]["topic"] == "solar"
+            assert "ValueError: boom" in entries[1]["exc"]
+        finally:
+            monkeypatch.undo()
+            configure_logging(force=True)
+
+    def test_debug_sampler(self):
+        sampler = DebugSampler(0.0)
+        debug = logging.LogRecord("demo", logging.DEBUG, __file__, 1, "payload", None, None)
+        info = logging.LogRecord("demo", logging.INFO, __file__, 1, "done", None, None)
+
+        assert not sampler.filter(debug)
+        assert sampler.filter(info)
+        assert DebugSampler(1.0).filter(debug)